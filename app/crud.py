@@ -1,7 +1,17 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, delete
+from sqlalchemy import select, func, delete, insert, or_, and_, extract, literal, null, false
 from datetime import date, datetime
 from . import models, schemas
+from .name_search import name_search_prefix
+from .report_cache import (
+	bump_data_version,
+	DOMAIN_ATTENDANCE,
+	DOMAIN_DIRECTORY,
+	DOMAIN_EXPENSES,
+	DOMAIN_PAYMENTS,
+	DOMAIN_SCHEDULE,
+)
+from .search_index import mark_search_index_stale
 
 
 # Users
@@ -38,7 +48,9 @@ def update_user_password(db: Session, user_id: int, new_password: str):
 def create_student(db: Session, data: schemas.StudentCreate) -> models.Student:
 	student = models.Student(**data.model_dump())
 	db.add(student)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(student)
 	return student
 
@@ -50,14 +62,6 @@ def list_students(db: Session, active_only: bool = False):
 	return db.scalars(stmt.order_by(models.Student.created_at.desc())).all()
 
 
-def find_student_by_name(db: Session, first_name: str, last_name: str):
-	stmt = select(models.Student).where(
-		func.lower(models.Student.first_name) == func.lower(first_name),
-		func.lower(models.Student.last_name) == func.lower(last_name),
-	)
-	return db.scalars(stmt).first()
-
-
 def get_student(db: Session, student_id: int):
 	return db.get(models.Student, student_id)
 
@@ -68,7 +72,9 @@ def update_student(db: Session, student_id: int, data: schemas.StudentUpdate):
 		return None
 	for k, v in data.model_dump(exclude_unset=True).items():
 		setattr(student, k, v)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(student)
 	return student
 
@@ -78,8 +84,16 @@ def delete_student(db: Session, student_id: int) -> bool:
 	student = db.get(models.Student, student_id)
 	if not student:
 		return False
+	payment_days = db.scalars(
+		select(models.Payment.payment_date).where(models.Payment.student_id == student_id).distinct()
+	).all()
+	# Paket defterinin ORM ilişkisi yok; SQLite FK cascade'i uygulamadığı için açıkça silinir
+	db.execute(delete(models.PaymentLessonAllocation).where(models.PaymentLessonAllocation.student_id == student_id))
 	db.delete(student)
+	refresh_finance_daily_rollup(db, payment_days)
+	bump_data_version(db, DOMAIN_PAYMENTS, DOMAIN_ATTENDANCE, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	return True
 
 
@@ -87,7 +101,9 @@ def delete_student(db: Session, student_id: int) -> bool:
 def create_teacher(db: Session, data: schemas.TeacherCreate):
 	teacher = models.Teacher(**data.model_dump())
 	db.add(teacher)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(teacher)
 	return teacher
 
@@ -98,7 +114,9 @@ def update_teacher(db: Session, teacher_id: int, data: schemas.TeacherUpdate):
 		return None
 	for k, v in data.model_dump(exclude_unset=True).items():
 		setattr(teacher, k, v)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(teacher)
 	return teacher
 
@@ -117,10 +135,13 @@ def delete_teacher(db: Session, teacher_id: int):
 		return None
 
 	# Öğrenci–öğretmen atamalarını kaldır (yeni öğretmene atanabilsinler)
+	unlinked_student_ids = []
 	for link in db.scalars(
 		select(models.TeacherStudent).where(models.TeacherStudent.teacher_id == teacher_id)
 	).all():
+		unlinked_student_ids.append(link.student_id)
 		db.delete(link)
+	refresh_finance_rollup_for_students(db, unlinked_student_ids)
 
 	# Öğretmen giriş hesaplarını sil
 	for user in db.scalars(select(models.User).where(models.User.teacher_id == teacher_id)).all():
@@ -135,7 +156,9 @@ def delete_teacher(db: Session, teacher_id: int):
 			db.delete(lesson)
 
 	teacher.is_active = False
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(teacher)
 	return teacher
 
@@ -161,17 +184,30 @@ def get_or_create_teacher(db: Session, first_name: str, last_name: str):
 	return teacher, True
 
 
-def assign_student_to_teacher(db: Session, teacher_id: int, student_id: int, commit: bool = False):
+def assign_student_to_teacher(
+	db: Session,
+	teacher_id: int,
+	student_id: int,
+	commit: bool = False,
+	refresh_finance: bool = True,
+):
+	"""refresh_finance=False: toplu senkronizasyonda rollup sonda bir kez yeniden kurulur."""
 	link = db.scalars(select(models.TeacherStudent).where(models.TeacherStudent.student_id == student_id)).first()
 	if link:
 		if link.teacher_id != teacher_id:
 			link.teacher_id = teacher_id
+			bump_data_version(db, DOMAIN_SCHEDULE)
+			if refresh_finance:
+				refresh_finance_rollup_for_students(db, [student_id])
 			if commit:
 				db.commit()
 				db.refresh(link)
 		return link
 	link = models.TeacherStudent(teacher_id=teacher_id, student_id=student_id)
 	db.add(link)
+	bump_data_version(db, DOMAIN_SCHEDULE)
+	if refresh_finance:
+		refresh_finance_rollup_for_students(db, [student_id])
 	if commit:
 		db.commit()
 		db.refresh(link)
@@ -196,11 +232,6 @@ def list_students_by_teacher(db: Session, teacher_id: int, active_only: bool = T
 		return []
 
 
-def reset_teacher_student_links(db: Session):
-	db.execute(delete(models.TeacherStudent))
-	db.commit()
-
-
 def delete_attendance(db: Session, attendance_id: int):
 	"""Tek bir yoklama kaydını sil (yalnızca ilgili attendance satırı)."""
 	import logging
@@ -258,6 +289,9 @@ def delete_attendance(db: Session, attendance_id: int):
 	# Commit öncesi flush yap
 	db.flush()
 	logging.info(f"🔄 Flush yapıldı")
+	refresh_student_financial_state(db, [student_id])
+	refresh_payment_allocations(db, [student_id])
+	bump_data_version(db, DOMAIN_ATTENDANCE)
 	
 	# Commit yap
 	db.commit()
@@ -304,6 +338,9 @@ def delete_all_attendances(db: Session):
 	logging.warning("Tüm yoklama kayıtları siliniyor...")
 	result = db.execute(delete(models.Attendance))
 	count = result.rowcount
+	rebuild_student_financial_state(db, commit=False)
+	rebuild_payment_allocations(db, commit=False)
+	bump_data_version(db, DOMAIN_ATTENDANCE)
 	db.commit()
 	logging.warning(f"{count} yoklama kaydı silindi")
 	return count
@@ -313,7 +350,9 @@ def delete_all_attendances(db: Session):
 def create_course(db: Session, name: str):
 	course = models.Course(name=name)
 	db.add(course)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(course)
 	return course
 
@@ -321,7 +360,9 @@ def create_course(db: Session, name: str):
 def create_course_from_schema(db: Session, data: schemas.CourseCreate):
 	course = models.Course(**data.model_dump())
 	db.add(course)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(course)
 	return course
 
@@ -341,7 +382,9 @@ def update_course(db: Session, course_id: int, data: schemas.CourseUpdate):
 		return None
 	for k, v in data.model_dump(exclude_unset=True).items():
 		setattr(course, k, v)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	db.refresh(course)
 	return course
 
@@ -351,7 +394,9 @@ def delete_course(db: Session, course_id: int):
 	if not course:
 		return False
 	db.delete(course)
+	bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
 	db.commit()
+	mark_search_index_stale()
 	return True
 
 
@@ -370,6 +415,7 @@ def enroll_student(db: Session, student_id: int, course_id: int, commit: bool =
 		return existing
 	enrollment = models.Enrollment(student_id=student_id, course_id=course_id)
 	db.add(enrollment)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	if commit:
 		db.commit()
 		db.refresh(enrollment)
@@ -424,6 +470,7 @@ def assign_student_to_lesson(db: Session, lesson_id: int, student_id: int):
 		return existing
 	link = models.LessonStudent(lesson_id=lesson_id, student_id=student_id)
 	db.add(link)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	# commit yapma, çağıran fonksiyon commit yapacak
 	return link
 
@@ -440,6 +487,7 @@ def remove_student_from_lesson(db: Session, lesson_id: int, student_id: int) ->
 	if not link:
 		return False
 	db.delete(link)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	# commit yapma, çağıran fonksiyon commit yapacak
 	return True
 
@@ -460,6 +508,7 @@ def list_students_by_lesson(db: Session, lesson_id: int, active_only: bool = Tru
 def create_lesson(db: Session, data: schemas.LessonCreate):
 	lesson = models.Lesson(**data.model_dump())
 	db.add(lesson)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	db.commit()
 	db.refresh(lesson)
 	return lesson
@@ -489,6 +538,7 @@ def update_lesson(db: Session, lesson_id: int, data: schemas.LessonUpdate):
 				target_lesson_id=lesson.id,
 				target_weekday=lesson.lesson_date.weekday(),
 			)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	db.commit()
 	db.refresh(lesson)
 	return lesson
@@ -506,6 +556,7 @@ def delete_lesson(db: Session, lesson_id: int):
 	if attendance_count and int(attendance_count) > 0:
 		return False
 	db.delete(lesson)
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	db.commit()
 	return True
 
@@ -568,93 +619,116 @@ def lessons_with_students_by_teacher(db: Session, teacher_id: int):
 	return _lessons_with_students_from_lesson_rows(db, lessons)
 
 
-def lessons_with_students_by_teacher_ids(db: Session, teacher_ids: list[int]) -> dict[int, list[dict]]:
-	from sqlalchemy.orm import joinedload
-	if not teacher_ids:
-		return {}
+# Attendance
+ATTENDANCE_STATUSES = ("PRESENT", "UNEXCUSED_ABSENT", "EXCUSED_ABSENT", "TELAFI")
 
-	lessons = db.query(models.Lesson).options(
-		joinedload(models.Lesson.course),
-		joinedload(models.Lesson.teacher)
-	).filter(models.Lesson.teacher_id.in_(teacher_ids)).order_by(
-		models.Lesson.teacher_id.asc(),
-		models.Lesson.lesson_date.asc(),
-		models.Lesson.start_time.asc(),
-	).all()
 
-	lessons_by_teacher: dict[int, list] = {teacher_id: [] for teacher_id in teacher_ids}
-	for lesson in lessons:
-		lessons_by_teacher.setdefault(lesson.teacher_id, []).append(lesson)
+class AttendanceDuplicateError(ValueError):
+	"""Aynı gün aynı derste yoklaması olan öğrenciler; duplicates: {(lesson_id, student_id, gün)}."""
 
-	return {
-		teacher_id: _lessons_with_students_from_lesson_rows(db, teacher_lessons)
-		for teacher_id, teacher_lessons in lessons_by_teacher.items()
-		if teacher_lessons
-	}
+	def __init__(self, duplicates: set[tuple[int, int, date]]):
+		self.duplicates = duplicates
+		super().__init__(f"{len(duplicates)} öğrenci için bu tarihte yoklama zaten var")
 
 
-# Attendance
-def find_attendance_duplicate_student_ids(
-	db: Session,
-	*,
-	lesson_id: int,
-	student_ids: list[int],
-	attendance_date,
-) -> set[int]:
-	if not student_ids:
+def find_attendance_duplicates(db: Session, keys) -> set[tuple[int, int, date]]:
+	"""(lesson_id, student_id, gün) anahtarlarından kaydı olanlar; tek sorgu."""
+	keys = set(keys)
+	if not keys:
 		return set()
-	from sqlalchemy import func
-	rows = db.scalars(
-		select(models.Attendance.student_id)
+	rows = db.execute(
+		select(models.Attendance.lesson_id, models.Attendance.student_id, func.date(models.Attendance.marked_at))
 		.where(
-			models.Attendance.lesson_id == lesson_id,
-			models.Attendance.student_id.in_(student_ids),
-			func.date(models.Attendance.marked_at) == attendance_date,
+			models.Attendance.lesson_id.in_({key[0] for key in keys}),
+			models.Attendance.student_id.in_({key[1] for key in keys}),
+			func.date(models.Attendance.marked_at).in_({key[2] for key in keys}),
 		)
 	).all()
-	return set(rows)
+	found = set()
+	for lesson_id, student_id, day in rows:
+		if isinstance(day, str):
+			# SQLite date() metin döndürür
+			day = date.fromisoformat(day)
+		if (lesson_id, student_id, day) in keys:
+			found.add((lesson_id, student_id, day))
+	return found
 
 
-def create_attendances_bulk(db: Session, items: list[schemas.AttendanceCreate]) -> int:
-	if not items:
-		return 0
-	from datetime import datetime
+def attendance_insert_rows(items: list[schemas.AttendanceCreate], now: datetime | None = None) -> list[dict]:
+	"""
+	Yoklamaları bellekte doğrulayıp insert satırlarına çevirir: durum büyük harfe
+	çevrilir, eski değerler (ABSENT, LATE) karşılıklarına eşlenir; geçersiz durum
+	varsa hiçbir satır yazılmadan ValueError.
+	"""
+	now = now or datetime.utcnow()
+	rows = []
+	invalid = []
 	for item in items:
-		db.add(
-			models.Attendance(
-				lesson_id=item.lesson_id,
-				student_id=item.student_id,
-				status=str(item.status).strip().upper(),
-				marked_at=item.marked_at or datetime.utcnow(),
-				note=item.note if hasattr(item, "note") and item.note else None,
-			)
-		)
-	db.commit()
-	return len(items)
+		status = normalize_attendance_status_value(str(item.status).strip().upper())
+		if status not in ATTENDANCE_STATUSES:
+			invalid.append(f"{item.student_id}: {item.status}")
+			continue
+		rows.append({
+			"lesson_id": item.lesson_id,
+			"student_id": item.student_id,
+			"status": status,
+			"marked_at": item.marked_at or now,
+			"note": item.note or None,
+		})
+	if invalid:
+		raise ValueError(f"Geçersiz yoklama durumu: {', '.join(invalid)}")
+	return rows
 
 
-def mark_attendance(db: Session, data: schemas.AttendanceCreate, commit: bool = True):
-	# Her yoklama ayrı bir kayıt olarak oluşturulur - mevcut kayıt kontrolü yok
+def create_attendances_bulk(
+	db: Session,
+	items: list[schemas.AttendanceCreate],
+	*,
+	reject_duplicates: bool = False,
+	commit: bool = True,
+) -> list[models.Attendance]:
+	"""
+	Bir formdaki tüm yoklamaları tek INSERT ... RETURNING (executemany) ile yazar;
+	finans özetleri ve paket defteri bir kez yenilenir, tek commit yapılır.
+	reject_duplicates=True ise aynı gün aynı derste kaydı olan öğrenciler tek sorguyla
+	bulunur ve hiçbir şey yazılmadan AttendanceDuplicateError fırlatılır.
+	"""
 	import logging
-	from datetime import datetime
-	
-	attendance = models.Attendance(
-		lesson_id=data.lesson_id,
-		student_id=data.student_id,
-		status=str(data.status).strip().upper(),
-		marked_at=data.marked_at if hasattr(data, 'marked_at') and data.marked_at else datetime.utcnow(),
-		note=data.note if hasattr(data, 'note') and data.note else None
-	)
-	db.add(attendance)
-	
+
+	rows = attendance_insert_rows(items)
+	if not rows:
+		return []
+	if reject_duplicates:
+		duplicates = find_attendance_duplicates(
+			db, ((row["lesson_id"], row["student_id"], row["marked_at"].date()) for row in rows)
+		)
+		if duplicates:
+			raise AttendanceDuplicateError(duplicates)
+
+	attendances = db.scalars(
+		insert(models.Attendance).returning(models.Attendance, sort_by_parameter_order=True),
+		rows,
+	).all()
+	student_ids = [row["student_id"] for row in rows]
+	refresh_student_financial_state(db, student_ids)
+	refresh_payment_allocations(db, student_ids)
+	bump_data_version(db, DOMAIN_ATTENDANCE)
 	if commit:
 		db.commit()
-		db.refresh(attendance)
-		logging.info(f"Yeni yoklama kaydı oluşturuldu: Öğrenci {data.student_id}, Ders {data.lesson_id}, Durum: {attendance.status}")
 	else:
 		db.flush()
-		logging.info(f"Yoklama session'a yazıldı (commit=False): Öğrenci {data.student_id}, Durum: {attendance.status}")
-	
+	logging.info(
+		"%d yoklama kaydı oluşturuldu (dersler: %s)%s",
+		len(attendances),
+		sorted({row["lesson_id"] for row in rows}),
+		"" if commit else " (commit=False)",
+	)
+	return attendances
+
+
+def mark_attendance(db: Session, data: schemas.AttendanceCreate, commit: bool = True):
+	# Her yoklama ayrı bir kayıt olarak oluşturulur - mevcut kayıt kontrolü yok
+	(attendance,) = create_attendances_bulk(db, [data], commit=commit)
 	return attendance
 
 
@@ -663,6 +737,61 @@ def list_attendance_for_lesson(db: Session, lesson_id: int):
 	return db.scalars(stmt).all()
 
 
+def build_teacher_day_attendance_summary(db: Session, teacher_id: int, day: date | None = None) -> list[dict]:
+	"""
+	Öğretmenin bir günde (varsayılan bugün) aldığı yoklamaların ders bazlı özeti.
+	Yoklama, ders, kurs ve öğrenci tek birleştirilmiş sorguda gelir; dersler en son
+	alınan yoklamaya göre sıralanır. Her ders: lesson_id, course_name, lesson_time,
+	attendances [{student_name, status, marked_at}], counts {durum: adet}.
+	"""
+	day = day or date.today()
+	rows = db.execute(
+		select(
+			models.Attendance.status,
+			models.Attendance.marked_at,
+			models.Lesson.id,
+			models.Lesson.start_time,
+			models.Course.name,
+			models.Student.first_name,
+			models.Student.last_name,
+		)
+		.join(models.Lesson, models.Lesson.id == models.Attendance.lesson_id)
+		.outerjoin(models.Course, models.Course.id == models.Lesson.course_id)
+		.outerjoin(models.Student, models.Student.id == models.Attendance.student_id)
+		.where(models.Lesson.teacher_id == teacher_id, *marked_at_range_filters(day, day))
+		.order_by(models.Attendance.marked_at.desc())
+	).all()
+
+	summary_by_lesson: dict[int, dict] = {}
+	for status, marked_at, lesson_id, start_time, course_name, first_name, last_name in rows:
+		summary = summary_by_lesson.get(lesson_id)
+		if summary is None:
+			summary = summary_by_lesson[lesson_id] = {
+				"lesson_id": lesson_id,
+				"course_name": course_name or "Bilinmeyen",
+				"lesson_time": start_time.strftime("%H:%M") if start_time else "",
+				"attendances": [],
+				"counts": {
+					"PRESENT": 0,
+					"EXCUSED_ABSENT": 0,
+					"TELAFI": 0,
+					"UNEXCUSED_ABSENT": 0,
+					"LATE": 0,  # Eski kayıtlar için
+				},
+			}
+		if first_name is None and last_name is None:
+			continue
+		status = normalize_attendance_status_value(status)
+		summary["attendances"].append({
+			"student_name": f"{first_name} {last_name}",
+			"status": status,
+			"marked_at": marked_at.strftime("%H:%M") if marked_at else "",
+		})
+		if status in summary["counts"]:
+			summary["counts"][status] += 1
+	return list(summary_by_lesson.values())
+
+
 def update_attendance(db: Session, attendance_id: int, status: str | None = None, marked_at: datetime | None = None, note: str | None = None):
 	"""Yoklama kaydını güncelle"""
 	attendance = db.get(models.Attendance, attendance_id)
@@ -675,23 +804,32 @@ def update_attendance(db: Session, attendance_id: int, status: str | None = None
 		attendance.marked_at = marked_at
 	if note is not None:
 		attendance.note = note
+	refresh_student_financial_state(db, [attendance.student_id])
+	refresh_payment_allocations(db, [attendance.student_id])
 	
+	bump_data_version(db, DOMAIN_ATTENDANCE)
 	db.commit()
 	db.refresh(attendance)
 	return attendance
 
 
-def student_name_matches_prefix(full_name: str, term: str) -> bool:
-	"""Öğrenci adı filtresi: yazılan metnin ilk 3 harfi ad, soyad veya tam adla eşleşmeli."""
-	term = (term or "").strip().lower()
-	if len(term) < 3:
-		return False
-	prefix = term[:3]
-	normalized = (full_name or "").strip().lower()
-	parts = normalized.split()
-	first = parts[0] if parts else ""
-	last = parts[-1] if len(parts) > 1 else ""
-	return first.startswith(prefix) or last.startswith(prefix) or normalized.startswith(prefix)
+def student_name_prefix_filter(term: str):
+	"""
+	Öğrenci adı filtresi: yazılan metnin ilk 3 harfi (name_search.name_search_prefix)
+	ad, soyad veya tam adın başıyla eşleşmeli; students.search_* kolonlarındaki
+	indeksli önek (LIKE 'abc%') araması. 3 harften kısa aramada hiçbir satır eşleşmez.
+	Kalıp Python'da tek parametre olarak bağlanır: SQLite LIKE optimizasyonu
+	"kolon LIKE :p || '%'" birleştirmesinde indeksi kullanmaz.
+	"""
+	prefix = name_search_prefix(term)
+	if prefix is None:
+		return false()
+	pattern = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+	return or_(
+		models.Student.search_first_token.like(pattern, escape="/"),
+		models.Student.search_last_token.like(pattern, escape="/"),
+		models.Student.search_full_name.like(pattern, escape="/"),
+	)
 
 
 def attendance_status_filter(status: str):
@@ -704,7 +842,7 @@ def attendance_status_filter(status: str):
 	return models.Attendance.status == normalized
 
 
-def list_all_attendances(db: Session, limit: int = 100, teacher_id: int | None = None, student_id: int | None = None, course_id: int | None = None, status: str | None = None, start_date: date | None = None, end_date: date | None = None, order_by: str = "marked_at_desc"):
+def list_all_attendances(db: Session, limit: int = 100, teacher_id: int | None = None, student_id: int | None = None, course_id: int | None = None, status: str | None = None, start_date: date | None = None, end_date: date | None = None, order_by: str = "marked_at_desc", student_name: str | None = None):
 	needs_join = teacher_id is not None or course_id is not None
 
 	if needs_join:
@@ -717,6 +855,10 @@ def list_all_attendances(db: Session, limit: int = 100, teacher_id: int | None =
 		stmt = stmt.where(models.Lesson.teacher_id == teacher_id)
 	if student_id:
 		stmt = stmt.where(models.Attendance.student_id == student_id)
+	elif student_name and student_name.strip():
+		stmt = stmt.join(models.Student, models.Student.id == models.Attendance.student_id).where(
+			student_name_prefix_filter(student_name)
+		)
 	if course_id:
 		stmt = stmt.where(models.Lesson.course_id == course_id)
 	if status and status.strip():
@@ -743,13 +885,155 @@ def list_all_attendances(db: Session, limit: int = 100, teacher_id: int | None =
 	return db.scalars(stmt).all()
 
 
+ATTENDANCE_PAGE_SIZE = 50
+ATTENDANCE_PAGE_MAX = 500
+
+
+def encode_attendance_cursor(marked_at: datetime, attendance_id: int) -> str:
+	"""Sayfa imleci: son satırın (marked_at, id) değeri; URL'de olduğu gibi taşınabilir."""
+	return f"{marked_at.isoformat()}_{attendance_id}"
+
+
+def decode_attendance_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+	if not cursor or "_" not in cursor:
+		return None
+	marked_at_s, _, id_s = cursor.strip().rpartition("_")
+	try:
+		return datetime.fromisoformat(marked_at_s), int(id_s)
+	except ValueError:
+		return None
+
+
+def list_attendance_page(
+	db: Session,
+	*,
+	teacher_id: int | None = None,
+	student_id: int | None = None,
+	course_id: int | None = None,
+	status: str | None = None,
+	start_date: date | None = None,
+	end_date: date | None = None,
+	student_name: str | None = None,
+	order_by: str = "marked_at_desc",
+	cursor: str | None = None,
+	limit: int = ATTENDANCE_PAGE_SIZE,
+) -> dict:
+	"""
+	Yoklamalar için (marked_at, id) üzerinde imleçli (keyset) sayfalama.
+	Satırlar ders, kurs, öğretmen ve öğrenciyle tek sorguda birleştirilmiş düz dict'lerdir
+	(şablonlardaki entry.attendance / entry.lesson / entry.course / entry.teacher /
+	entry.student erişimiyle uyumlu). Dönen: {"items": [...], "next_cursor": str | None}.
+	"""
+	limit = max(1, min(int(limit or ATTENDANCE_PAGE_SIZE), ATTENDANCE_PAGE_MAX))
+	ascending = order_by in ("marked_at_asc", "lesson_date_asc")
+	att = models.Attendance
+	stmt = (
+		select(
+			att.id,
+			att.lesson_id,
+			att.student_id,
+			att.status,
+			att.note,
+			att.marked_at,
+			models.Lesson.lesson_date,
+			models.Lesson.start_time,
+			models.Lesson.end_time,
+			models.Lesson.teacher_id,
+			models.Lesson.course_id,
+			models.Course.name,
+			models.Teacher.first_name,
+			models.Teacher.last_name,
+			models.Student.first_name,
+			models.Student.last_name,
+		)
+		.outerjoin(models.Lesson, models.Lesson.id == att.lesson_id)
+		.outerjoin(models.Course, models.Course.id == models.Lesson.course_id)
+		.outerjoin(models.Teacher, models.Teacher.id == models.Lesson.teacher_id)
+		.outerjoin(models.Student, models.Student.id == att.student_id)
+	)
+	if teacher_id:
+		stmt = stmt.where(models.Lesson.teacher_id == teacher_id)
+	if student_id:
+		stmt = stmt.where(att.student_id == student_id)
+	elif student_name and student_name.strip():
+		stmt = stmt.where(student_name_prefix_filter(student_name))
+	if course_id:
+		stmt = stmt.where(models.Lesson.course_id == course_id)
+	if status and status.strip():
+		stmt = stmt.where(attendance_status_filter(status))
+	stmt = stmt.where(*marked_at_range_filters(start_date, end_date))
+
+	position = decode_attendance_cursor(cursor)
+	if position:
+		marked_at, last_id = position
+		if ascending:
+			stmt = stmt.where(or_(att.marked_at > marked_at, and_(att.marked_at == marked_at, att.id > last_id)))
+		else:
+			stmt = stmt.where(or_(att.marked_at < marked_at, and_(att.marked_at == marked_at, att.id < last_id)))
+	if ascending:
+		stmt = stmt.order_by(att.marked_at.asc(), att.id.asc())
+	else:
+		stmt = stmt.order_by(att.marked_at.desc(), att.id.desc())
+
+	rows = db.execute(stmt.limit(limit + 1)).all()
+	items = []
+	for (
+		aid, lesson_id, sid, att_status, note, marked_at, lesson_date, start_time, end_time,
+		lesson_teacher_id, lesson_course_id, course_name, teacher_first, teacher_last,
+		student_first, student_last,
+	) in rows[:limit]:
+		items.append({
+			"attendance": {
+				"id": aid,
+				"lesson_id": lesson_id,
+				"student_id": sid,
+				"status": att_status,
+				"note": note,
+				"marked_at": marked_at,
+			},
+			"lesson": {
+				"id": lesson_id,
+				"lesson_date": lesson_date,
+				"start_time": start_time,
+				"end_time": end_time,
+				"teacher_id": lesson_teacher_id,
+				"course_id": lesson_course_id,
+			} if lesson_date is not None else None,
+			"course": {"id": lesson_course_id, "name": course_name} if course_name is not None else None,
+			"teacher": {
+				"id": lesson_teacher_id,
+				"first_name": teacher_first,
+				"last_name": teacher_last,
+			} if teacher_first is not None else None,
+			"student": {
+				"id": sid,
+				"first_name": student_first,
+				"last_name": student_last,
+			} if student_first is not None else None,
+		})
+	next_cursor = None
+	if len(rows) > limit and items:
+		last = items[-1]["attendance"]
+		if last["marked_at"] is not None:
+			next_cursor = encode_attendance_cursor(last["marked_at"], last["id"])
+	return {"items": items, "next_cursor": next_cursor}
+
+
 # Payments
-def create_payment(db: Session, data: schemas.PaymentCreate):
+def create_payment(db: Session, data: schemas.PaymentCreate, commit: bool = True):
+	"""commit=False: ödeme flush edilir (id atanır); çağıran aynı transaction'a ek yazıp commit eder."""
 	payload = data.model_dump()
 	if not payload.get("payment_date"):
 		payload["payment_date"] = None  # default handled by model
 	payment = models.Payment(**payload)
 	db.add(payment)
+	refresh_student_financial_state(db, [payment.student_id])
+	refresh_payment_allocations(db, [payment.student_id])
+	refresh_finance_daily_rollup(db, [payment.payment_date])
+	bump_data_version(db, DOMAIN_PAYMENTS)
+	if not commit:
+		db.flush()
+		return payment
 	db.commit()
 	db.refresh(payment)
 	return payment
@@ -773,8 +1057,14 @@ def update_payment(db: Session, payment_id: int, data: schemas.PaymentUpdate):
 	payload = data.model_dump()
 	if not payload.get("payment_date"):
 		payload["payment_date"] = None
+	previous_student_id = payment.student_id
+	previous_payment_date = payment.payment_date
 	for key, value in payload.items():
 		setattr(payment, key, value)
+	refresh_student_financial_state(db, [previous_student_id, payment.student_id])
+	refresh_payment_allocations(db, [previous_student_id, payment.student_id])
+	refresh_finance_daily_rollup(db, [previous_payment_date, payment.payment_date])
+	bump_data_version(db, DOMAIN_PAYMENTS)
 	db.commit()
 	db.refresh(payment)
 	return payment
@@ -784,7 +1074,13 @@ def delete_payment(db: Session, payment_id: int):
 	"""Ödeme kaydını siler"""
 	payment = db.get(models.Payment, payment_id)
 	if payment:
+		student_id = payment.student_id
+		payment_date = payment.payment_date
 		db.delete(payment)
+		refresh_student_financial_state(db, [student_id])
+		refresh_payment_allocations(db, [student_id])
+		refresh_finance_daily_rollup(db, [payment_date])
+		bump_data_version(db, DOMAIN_PAYMENTS)
 		db.commit()
 		return True
 	return False
@@ -802,6 +1098,8 @@ def create_expense(db: Session, data: schemas.ExpenseCreate):
 		payload["category"] = "Diğer"
 	expense = models.Expense(**payload)
 	db.add(expense)
+	refresh_finance_daily_rollup(db, [expense.expense_date])
+	bump_data_version(db, DOMAIN_EXPENSES)
 	db.commit()
 	db.refresh(expense)
 	return expense
@@ -836,8 +1134,11 @@ def update_expense(db: Session, expense_id: int, data: schemas.ExpenseUpdate):
 	payload = data.model_dump()
 	if not payload.get("expense_date"):
 		payload["expense_date"] = date.today()
+	previous_expense_date = expense.expense_date
 	for key, value in payload.items():
 		setattr(expense, key, value)
+	refresh_finance_daily_rollup(db, [previous_expense_date, expense.expense_date])
+	bump_data_version(db, DOMAIN_EXPENSES)
 	db.commit()
 	db.refresh(expense)
 	return expense
@@ -847,26 +1148,268 @@ def delete_expense(db: Session, expense_id: int) -> bool:
 	expense = db.get(models.Expense, expense_id)
 	if not expense:
 		return False
+	expense_date = expense.expense_date
 	db.delete(expense)
+	refresh_finance_daily_rollup(db, [expense_date])
+	bump_data_version(db, DOMAIN_EXPENSES)
 	db.commit()
 	return True
 
 
-def sum_expenses(
+# Günlük finans özeti (finance_daily_rollup)
+def _rollup_payment_source(day_filter=None):
+	"""Ham ödemelerden (gün, yöntem, öğretmen) grupları — rollup'a yazılan/karşılaştırılan satırlar."""
+	stmt = (
+		select(
+			models.Payment.payment_date,
+			literal("payment"),
+			models.Payment.method,
+			models.TeacherStudent.teacher_id,
+			null(),
+			func.coalesce(func.sum(models.Payment.amount_try), 0),
+			func.count(models.Payment.id),
+		)
+		.select_from(models.Payment)
+		.join(models.Student, models.Student.id == models.Payment.student_id)
+		.outerjoin(models.TeacherStudent, models.TeacherStudent.student_id == models.Payment.student_id)
+		.group_by(models.Payment.payment_date, models.Payment.method, models.TeacherStudent.teacher_id)
+	)
+	if day_filter is not None:
+		stmt = stmt.where(day_filter(models.Payment.payment_date))
+	return stmt
+
+
+def _rollup_expense_source(day_filter=None):
+	"""Ham giderlerden (gün, yöntem, kategori) grupları."""
+	stmt = (
+		select(
+			models.Expense.expense_date,
+			literal("expense"),
+			models.Expense.method,
+			null(),
+			models.Expense.category,
+			func.coalesce(func.sum(models.Expense.amount_try), 0),
+			func.count(models.Expense.id),
+		)
+		.group_by(models.Expense.expense_date, models.Expense.method, models.Expense.category)
+	)
+	if day_filter is not None:
+		stmt = stmt.where(day_filter(models.Expense.expense_date))
+	return stmt
+
+
+_ROLLUP_COLUMNS = ["day", "kind", "method", "teacher_id", "category", "amount_try", "row_count"]
+
+
+def _write_finance_rollup(db: Session, day_filter=None) -> None:
+	rollup = models.FinanceDailyRollup
+	delete_stmt = delete(rollup)
+	if day_filter is not None:
+		delete_stmt = delete_stmt.where(day_filter(rollup.day))
+	db.execute(delete_stmt)
+	db.execute(insert(rollup).from_select(_ROLLUP_COLUMNS, _rollup_payment_source(day_filter)))
+	db.execute(insert(rollup).from_select(_ROLLUP_COLUMNS, _rollup_expense_source(day_filter)))
+
+
+def refresh_finance_daily_rollup(db: Session, days) -> None:
+	"""
+	Verilen günlerin rollup satırlarını ham ödeme/gider kayıtlarından yeniden yazar.
+	None günü tarihsiz kayıtları temsil eder. Commit yapmaz.
+	"""
+	days = set(days)
+	dates = sorted(d for d in days if d is not None)
+	include_undated = None in days
+	if not dates and not include_undated:
+		return
+	db.flush()
+
+	def day_filter(column):
+		conditions = []
+		if dates:
+			conditions.append(column.in_(dates))
+		if include_undated:
+			conditions.append(column.is_(None))
+		return or_(*conditions)
+
+	_write_finance_rollup(db, day_filter)
+
+
+def refresh_finance_rollup_for_students(db: Session, student_ids) -> None:
+	"""Öğretmen ataması değişen öğrencilerin ödeme günlerini yeniden yazar."""
+	ids = sorted({int(sid) for sid in student_ids if sid is not None})
+	if not ids:
+		return
+	db.flush()
+	days = db.scalars(
+		select(models.Payment.payment_date).where(models.Payment.student_id.in_(ids)).distinct()
+	).all()
+	refresh_finance_daily_rollup(db, days)
+
+
+def rebuild_finance_daily_rollup(db: Session, commit: bool = True) -> int:
+	"""Rollup tablosunu sıfırdan kurar. Yazılan satır sayısını döndürür."""
+	db.flush()
+	_write_finance_rollup(db)
+	count = db.scalar(select(func.count(models.FinanceDailyRollup.id))) or 0
+	bump_data_version(db, DOMAIN_PAYMENTS, DOMAIN_EXPENSES)
+	if commit:
+		db.commit()
+	else:
+		db.flush()
+	return int(count)
+
+
+def reconcile_finance_daily_rollup(db: Session) -> list[dict]:
+	"""
+	Rollup'ı ham kayıtlarla karşılaştırır. Tutarsız (gün, tür, yöntem, öğretmen, kategori)
+	anahtarlarını döndürür; boş liste rollup'ın güncel olduğunu gösterir.
+	"""
+	rollup = models.FinanceDailyRollup
+
+	def _key(day, kind, method, teacher_id, category):
+		return (day.isoformat() if day else None, kind, method, teacher_id, category)
+
+	expected: dict[tuple, tuple[float, int]] = {}
+	for source in (_rollup_payment_source(), _rollup_expense_source()):
+		for day, kind, method, teacher_id, category, amount, count in db.execute(source).all():
+			expected[_key(day, kind, method, teacher_id, category)] = (round(float(amount or 0), 2), int(count or 0))
+
+	actual: dict[tuple, tuple[float, int]] = {}
+	for day, kind, method, teacher_id, category, amount, count in db.execute(
+		select(
+			rollup.day,
+			rollup.kind,
+			rollup.method,
+			rollup.teacher_id,
+			rollup.category,
+			func.sum(rollup.amount_try),
+			func.sum(rollup.row_count),
+		).group_by(rollup.day, rollup.kind, rollup.method, rollup.teacher_id, rollup.category)
+	).all():
+		actual[_key(day, kind, method, teacher_id, category)] = (round(float(amount or 0), 2), int(count or 0))
+
+	mismatches = []
+	for key in sorted(set(expected) | set(actual), key=lambda k: tuple("" if v is None else str(v) for v in k)):
+		want = expected.get(key, (0.0, 0))
+		got = actual.get(key, (0.0, 0))
+		if want != got:
+			day, kind, method, teacher_id, category = key
+			mismatches.append({
+				"day": day,
+				"kind": kind,
+				"method": method,
+				"teacher_id": teacher_id,
+				"category": category,
+				"expected_amount": want[0],
+				"expected_count": want[1],
+				"rollup_amount": got[0],
+				"rollup_count": got[1],
+			})
+	return mismatches
+
+
+def _rollup_groups(
 	db: Session,
+	kind: str,
+	group_cols: list,
 	*,
 	start_date: date | None = None,
 	end_date: date | None = None,
+	method: str | None = None,
 	category: str | None = None,
-) -> float:
-	q = db.query(func.coalesce(func.sum(models.Expense.amount_try), 0))
+):
+	rollup = models.FinanceDailyRollup
+	stmt = (
+		select(*group_cols, func.coalesce(func.sum(rollup.amount_try), 0), func.coalesce(func.sum(rollup.row_count), 0))
+		.where(rollup.kind == kind)
+		.group_by(*group_cols)
+	)
 	if start_date:
-		q = q.filter(models.Expense.expense_date >= start_date)
+		stmt = stmt.where(rollup.day >= start_date)
 	if end_date:
-		q = q.filter(models.Expense.expense_date <= end_date)
+		stmt = stmt.where(rollup.day <= end_date)
+	if method and method.strip():
+		stmt = stmt.where(rollup.method == method.strip())
 	if category and category.strip():
-		q = q.filter(models.Expense.category == category.strip())
-	return float(q.scalar() or 0)
+		stmt = stmt.where(rollup.category == category.strip())
+	return db.execute(stmt).all()
+
+
+def _payments_by_method_from_groups(groups) -> dict[str, float]:
+	"""groups: (method, ..., total, count) satırları."""
+	result = {"Nakit": 0.0, "EFT": 0.0, "Kart": 0.0, "Diğer": 0.0}
+	for row in groups:
+		key = (row[0] or "").strip()
+		amount = float(row[-2] or 0)
+		if key in ("Nakit", "EFT", "Kart"):
+			result[key] += amount
+		else:
+			result["Diğer"] += amount
+	return result
+
+
+def _monthly_totals_from_groups(groups) -> list[dict]:
+	"""groups: (yyyymm, ..., total, count) satırları; tarihsiz kayıtlar atlanır."""
+	buckets: dict[str, float] = {}
+	for row in groups:
+		if row[0] is None:
+			continue
+		key = _year_month_label(row[0])
+		buckets[key] = buckets.get(key, 0.0) + float(row[-2] or 0)
+	return [{"month": k, "total": buckets[k]} for k in sorted(buckets.keys())]
+
+
+def _category_totals_from_groups(groups) -> list[dict]:
+	"""groups: (category, ..., total, count) satırları."""
+	totals: dict[str, float] = {}
+	for row in groups:
+		category = row[0] or "Diğer"
+		totals[category] = totals.get(category, 0.0) + float(row[-2] or 0)
+	return [{"category": category, "total": total} for category, total in totals.items()]
+
+
+def _teacher_totals_from_groups(db: Session, groups) -> list[dict]:
+	"""groups: (teacher_id, ..., total, count) satırları."""
+	totals: dict[int | None, list] = {}
+	for row in groups:
+		entry = totals.setdefault(row[0], [0.0, 0])
+		entry[0] += float(row[-2] or 0)
+		entry[1] += int(row[-1] or 0)
+	teacher_ids = [tid for tid in totals if tid is not None]
+	names = {}
+	if teacher_ids:
+		names = {
+			tid: f"{(first or '').strip()} {(last or '').strip()}".strip()
+			for tid, first, last in db.execute(
+				select(models.Teacher.id, models.Teacher.first_name, models.Teacher.last_name)
+				.where(models.Teacher.id.in_(teacher_ids))
+			).all()
+		}
+	result = []
+	for teacher_id, (total, count) in totals.items():
+		if teacher_id is None:
+			name = "Atanmamış"
+		else:
+			name = names.get(teacher_id) or f"Öğretmen #{teacher_id}"
+		result.append({
+			"teacher_id": teacher_id,
+			"teacher_name": name,
+			"total": total,
+			"count": count,
+		})
+	result.sort(key=lambda x: (-x["total"], x["teacher_name"]))
+	return result
+
+
+def sum_expenses(
+	db: Session,
+	*,
+	start_date: date | None = None,
+	end_date: date | None = None,
+	category: str | None = None,
+) -> float:
+	groups = _rollup_groups(db, "expense", [], start_date=start_date, end_date=end_date, category=category)
+	return float(groups[0][0] or 0) if groups else 0.0
 
 
 def sum_payments_by_method(
@@ -876,21 +1419,10 @@ def sum_payments_by_method(
 	end_date: date | None = None,
 ) -> dict[str, float]:
 	"""Nakit / EFT(IBAN) / Kart toplamları."""
-	q = db.query(models.Payment.method, func.coalesce(func.sum(models.Payment.amount_try), 0))
-	if start_date:
-		q = q.filter(models.Payment.payment_date >= start_date)
-	if end_date:
-		q = q.filter(models.Payment.payment_date <= end_date)
-	q = q.group_by(models.Payment.method)
-	result = {"Nakit": 0.0, "EFT": 0.0, "Kart": 0.0, "Diğer": 0.0}
-	for method, total in q.all():
-		key = (method or "").strip()
-		amount = float(total or 0)
-		if key in ("Nakit", "EFT", "Kart"):
-			result[key] += amount
-		else:
-			result["Diğer"] += amount
-	return result
+	rollup = models.FinanceDailyRollup
+	return _payments_by_method_from_groups(
+		_rollup_groups(db, "payment", [rollup.method], start_date=start_date, end_date=end_date)
+	)
 
 
 def sum_payments_total(
@@ -899,12 +1431,8 @@ def sum_payments_total(
 	start_date: date | None = None,
 	end_date: date | None = None,
 ) -> float:
-	q = db.query(func.coalesce(func.sum(models.Payment.amount_try), 0))
-	if start_date:
-		q = q.filter(models.Payment.payment_date >= start_date)
-	if end_date:
-		q = q.filter(models.Payment.payment_date <= end_date)
-	return float(q.scalar() or 0)
+	groups = _rollup_groups(db, "payment", [], start_date=start_date, end_date=end_date)
+	return float(groups[0][0] or 0) if groups else 0.0
 
 
 def monthly_payment_totals(
@@ -914,18 +1442,11 @@ def monthly_payment_totals(
 	end_date: date | None = None,
 ) -> list[dict]:
 	"""Aylık tahsilat toplamları (grafik için)."""
-	payments = db.query(models.Payment)
-	if start_date:
-		payments = payments.filter(models.Payment.payment_date >= start_date)
-	if end_date:
-		payments = payments.filter(models.Payment.payment_date <= end_date)
-	buckets: dict[str, float] = {}
-	for p in payments.all():
-		if not p.payment_date:
-			continue
-		key = p.payment_date.strftime("%Y-%m")
-		buckets[key] = buckets.get(key, 0.0) + float(p.amount_try or 0)
-	return [{"month": k, "total": buckets[k]} for k in sorted(buckets.keys())]
+	return _monthly_totals_from_groups(
+		_rollup_groups(
+			db, "payment", [_year_month_sql(models.FinanceDailyRollup.day)], start_date=start_date, end_date=end_date
+		)
+	)
 
 
 def monthly_expense_totals(
@@ -934,14 +1455,11 @@ def monthly_expense_totals(
 	start_date: date | None = None,
 	end_date: date | None = None,
 ) -> list[dict]:
-	expenses = list_expenses(db, start_date=start_date, end_date=end_date)
-	buckets: dict[str, float] = {}
-	for e in expenses:
-		if not e.expense_date:
-			continue
-		key = e.expense_date.strftime("%Y-%m")
-		buckets[key] = buckets.get(key, 0.0) + float(e.amount_try or 0)
-	return [{"month": k, "total": buckets[k]} for k in sorted(buckets.keys())]
+	return _monthly_totals_from_groups(
+		_rollup_groups(
+			db, "expense", [_year_month_sql(models.FinanceDailyRollup.day)], start_date=start_date, end_date=end_date
+		)
+	)
 
 
 def expense_totals_by_category(
@@ -950,13 +1468,10 @@ def expense_totals_by_category(
 	start_date: date | None = None,
 	end_date: date | None = None,
 ) -> list[dict]:
-	q = db.query(models.Expense.category, func.coalesce(func.sum(models.Expense.amount_try), 0))
-	if start_date:
-		q = q.filter(models.Expense.expense_date >= start_date)
-	if end_date:
-		q = q.filter(models.Expense.expense_date <= end_date)
-	q = q.group_by(models.Expense.category)
-	return [{"category": (cat or "Diğer"), "total": float(total or 0)} for cat, total in q.all()]
+	rollup = models.FinanceDailyRollup
+	return _category_totals_from_groups(
+		_rollup_groups(db, "expense", [rollup.category], start_date=start_date, end_date=end_date)
+	)
 
 
 def student_teacher_name_map(db: Session) -> dict[int, str]:
@@ -983,47 +1498,112 @@ def payment_totals_by_teacher(
 	Öğretmene kayıtlı öğrencilerin tahsilat toplamları.
 	Öğretmeni olmayan öğrenciler 'Atanmamış' altında toplanır.
 	"""
-	q = (
-		db.query(
-			models.Teacher.id,
-			models.Teacher.first_name,
-			models.Teacher.last_name,
-			func.coalesce(func.sum(models.Payment.amount_try), 0),
-			func.count(models.Payment.id),
-		)
-		.select_from(models.Payment)
-		.join(models.Student, models.Student.id == models.Payment.student_id)
-		.outerjoin(models.TeacherStudent, models.TeacherStudent.student_id == models.Payment.student_id)
-		.outerjoin(models.Teacher, models.Teacher.id == models.TeacherStudent.teacher_id)
+	rollup = models.FinanceDailyRollup
+	return _teacher_totals_from_groups(
+		db,
+		_rollup_groups(db, "payment", [rollup.teacher_id], start_date=start_date, end_date=end_date, method=method),
 	)
-	if start_date:
-		q = q.filter(models.Payment.payment_date >= start_date)
-	if end_date:
-		q = q.filter(models.Payment.payment_date <= end_date)
-	if method and method.strip():
-		q = q.filter(models.Payment.method == method.strip())
-	q = q.group_by(models.Teacher.id, models.Teacher.first_name, models.Teacher.last_name)
-	rows = q.all()
-
-	result = []
-	for teacher_id, first, last, total, count in rows:
-		if teacher_id is None:
-			name = "Atanmamış"
-		else:
-			name = f"{(first or '').strip()} {(last or '').strip()}".strip() or f"Öğretmen #{teacher_id}"
-		result.append({
-			"teacher_id": teacher_id,
-			"teacher_name": name,
-			"total": float(total or 0),
-			"count": int(count or 0),
-		})
-	result.sort(key=lambda x: (-x["total"], x["teacher_name"]))
-	return result
 
 
-def lesson_duration_hours(lesson) -> float:
-	"""Ders süresi (saat). Saat bilgisi yoksa 1.0 kabul edilir."""
-	start = getattr(lesson, "start_time", None)
+def build_finance_overview(
+	db: Session,
+	*,
+	start_date: date | None = None,
+	end_date: date | None = None,
+) -> dict:
+	"""
+	/ui/finance ve özet dışa aktarımı için tüm toplamlar, rollup üzerinde iki gruplu sorgu ile:
+	tahsilat (ay, yöntem, öğretmen) ve gider (ay, kategori).
+	"""
+	rollup = models.FinanceDailyRollup
+	month = _year_month_sql(rollup.day)
+	payment_groups = _rollup_groups(
+		db, "payment", [month, rollup.method, rollup.teacher_id], start_date=start_date, end_date=end_date
+	)
+	expense_groups = _rollup_groups(db, "expense", [month, rollup.category], start_date=start_date, end_date=end_date)
+
+	income_total = sum(float(row[-2] or 0) for row in payment_groups)
+	expense_total = sum(float(row[-2] or 0) for row in expense_groups)
+	return {
+		"income_by_method": _payments_by_method_from_groups([row[1:] for row in payment_groups]),
+		"income_total": income_total,
+		"expense_total": expense_total,
+		"net": income_total - expense_total,
+		"income_monthly": _monthly_totals_from_groups(payment_groups),
+		"expense_monthly": _monthly_totals_from_groups(expense_groups),
+		"expense_by_category": _category_totals_from_groups([row[1:] for row in expense_groups]),
+		"by_teacher": _teacher_totals_from_groups(db, [row[2:] for row in payment_groups]),
+	}
+
+
+def build_payment_report(
+	db: Session,
+	*,
+	start_date: date | None = None,
+	end_date: date | None = None,
+	course_id: int | None = None,
+	teacher_id: int | None = None,
+	student_id: int | None = None,
+	method: str | None = None,
+) -> dict:
+	"""
+	/ui/reports/payments ve CSV'si için ödeme satırları (düz dict, önbelleğe uygun) ve toplam.
+	Öğretmen filtresi öğretmenin aktif öğrencileriyle sınırlıdır; satırlar tek sorguda
+	öğrenci adıyla birlikte gelir.
+	"""
+	stmt = (
+		select(
+			models.Payment.id,
+			models.Payment.payment_date,
+			models.Payment.amount_try,
+			models.Payment.method,
+			models.Payment.note,
+			models.Student.first_name,
+			models.Student.last_name,
+		)
+		.join(models.Student, models.Student.id == models.Payment.student_id)
+	)
+	if course_id:
+		stmt = stmt.join(models.Enrollment, models.Enrollment.student_id == models.Payment.student_id).where(
+			models.Enrollment.course_id == course_id
+		)
+	if teacher_id:
+		stmt = stmt.where(
+			models.Payment.student_id.in_(
+				select(models.TeacherStudent.student_id)
+				.join(models.Student, models.Student.id == models.TeacherStudent.student_id)
+				.where(models.TeacherStudent.teacher_id == teacher_id, models.Student.is_active == True)
+			)
+		)
+	if student_id:
+		stmt = stmt.where(models.Payment.student_id == student_id)
+	if method:
+		stmt = stmt.where(models.Payment.method == method)
+	if start_date:
+		stmt = stmt.where(models.Payment.payment_date >= start_date)
+	if end_date:
+		stmt = stmt.where(models.Payment.payment_date <= end_date)
+	stmt = stmt.order_by(models.Payment.payment_date.desc())
+
+	from decimal import Decimal
+	items = []
+	total = Decimal("0")
+	for pid, payment_date, amount, pay_method, note, first_name, last_name in db.execute(stmt).all():
+		total += Decimal(str(amount or 0))
+		items.append({
+			"id": pid,
+			"payment_date": payment_date,
+			"amount_try": amount,
+			"method": pay_method,
+			"note": note,
+			"student": {"first_name": first_name, "last_name": last_name},
+		})
+	return {"items": items, "total": float(total)}
+
+
+def lesson_duration_hours(lesson) -> float:
+	"""Ders süresi (saat). Saat bilgisi yoksa 1.0 kabul edilir."""
+	start = getattr(lesson, "start_time", None)
 	end = getattr(lesson, "end_time", None)
 	if not start or not end:
 		return 1.0
@@ -1061,6 +1641,60 @@ def teacher_puantaj_lesson_credit(status: str | None, course_name: str | None) -
 	return 0
 
 
+def _teacher_pay_credit_rows(
+	db: Session,
+	teacher_ids: list[int],
+	*,
+	start_date: date | None = None,
+	end_date: date | None = None,
+	by_month: bool = False,
+):
+	"""
+	Öğretmen başına puantaj kredisi toplamı (GROUP BY Lesson.teacher_id).
+	by_month=True ise (öğretmen, yıl, ay) kırılımında döner.
+	"""
+	credit_sum = func.coalesce(func.sum(teacher_puantaj_lesson_credit_sql()), 0)
+	group_cols = [models.Lesson.teacher_id]
+	if by_month:
+		group_cols += [extract("year", models.Attendance.marked_at), extract("month", models.Attendance.marked_at)]
+	stmt = (
+		select(*group_cols, credit_sum)
+		.select_from(models.Attendance)
+		.join(models.Lesson, models.Lesson.id == models.Attendance.lesson_id)
+		.outerjoin(models.Course, models.Course.id == models.Lesson.course_id)
+		.where(
+			models.Attendance.marked_at.isnot(None),
+			models.Lesson.teacher_id.in_(teacher_ids),
+			*marked_at_range_filters(start_date, end_date),
+		)
+		.group_by(*group_cols)
+	)
+	return db.execute(stmt).all()
+
+
+def _teacher_pay_row(teacher, lesson_count: int) -> dict:
+	# Puantaj Toplam Ders ile birebir: 1 kredi = 1 saat birimi
+	hours = round(float(lesson_count), 2)
+	rate = float(teacher.hourly_rate_try) if teacher.hourly_rate_try is not None else None
+	amount = round(hours * rate, 2) if rate is not None else None
+	return {
+		"teacher_id": teacher.id,
+		"teacher_name": f"{teacher.first_name} {teacher.last_name}",
+		"is_active": bool(getattr(teacher, "is_active", True)),
+		"hourly_rate_try": rate,
+		"lessons": lesson_count,
+		"hours": hours,
+		"amount": amount,
+	}
+
+
+def _teachers_for_pay_report(db: Session, teacher_id: int | None):
+	teachers = list_teachers(db, active_only=True)
+	if teacher_id:
+		teachers = [t for t in teachers if t.id == teacher_id]
+	return sorted(teachers, key=lambda t: ((t.first_name or ""), (t.last_name or "")))
+
+
 def build_teacher_pay_report(
 	db: Session,
 	*,
@@ -1071,64 +1705,31 @@ def build_teacher_pay_report(
 	"""
 	Öğretmen ders saat ücreti × işlenen ders.
 	Resim dahil tüm öğretmenlerde sayım, puantaj 'Toplam Ders' ile birebir aynıdır
-	(1 puantaj dersi = 1 saat birimi).
+	(1 puantaj dersi = 1 saat birimi). Kredi kuralı SQL'de toplanır; yalnızca
+	öğretmen başına ders sayısı döner.
 	"""
-	teachers = list_teachers(db, active_only=True)
-	if teacher_id:
-		teachers = [t for t in teachers if t.id == teacher_id]
-
-	q = (
-		db.query(models.Attendance, models.Lesson, models.Course)
-		.join(models.Lesson, models.Lesson.id == models.Attendance.lesson_id)
-		.outerjoin(models.Course, models.Course.id == models.Lesson.course_id)
-		.filter(models.Attendance.marked_at.isnot(None))
-	)
-	if teacher_id:
-		q = q.filter(models.Lesson.teacher_id == teacher_id)
-	else:
-		teacher_ids = [t.id for t in teachers]
-		if not teacher_ids:
-			return {"rows": [], "totals": {"hours": 0.0, "amount": 0.0, "lessons": 0}}
-		q = q.filter(models.Lesson.teacher_id.in_(teacher_ids))
-	if start_date:
-		q = q.filter(models.Attendance.marked_at >= datetime.combine(start_date, datetime.min.time()))
-	if end_date:
-		q = q.filter(models.Attendance.marked_at <= datetime.combine(end_date, datetime.max.time()))
-
-	hours_by_teacher: dict[int, float] = {}
-	lessons_by_teacher: dict[int, int] = {}
-	for attendance, lesson, course in q.all():
-		course_name = course.name if course else None
-		credit = teacher_puantaj_lesson_credit(attendance.status, course_name)
-		if credit <= 0:
-			continue
-		tid = lesson.teacher_id
-		# Puantaj Toplam Ders ile birebir: 1 kredi = 1 saat birimi
-		hours_by_teacher[tid] = hours_by_teacher.get(tid, 0.0) + float(credit)
-		lessons_by_teacher[tid] = lessons_by_teacher.get(tid, 0) + credit
+	teachers = _teachers_for_pay_report(db, teacher_id)
+	if not teachers:
+		return {"rows": [], "totals": {"hours": 0.0, "amount": 0.0, "lessons": 0}}
+
+	lessons_by_teacher = {
+		tid: int(credits or 0)
+		for tid, credits in _teacher_pay_credit_rows(
+			db, [t.id for t in teachers], start_date=start_date, end_date=end_date
+		)
+	}
 
 	rows = []
 	total_hours = 0.0
 	total_amount = 0.0
 	total_lessons = 0
-	for teacher in sorted(teachers, key=lambda t: ((t.first_name or ""), (t.last_name or ""))):
-		hours = round(hours_by_teacher.get(teacher.id, 0.0), 2)
-		lesson_count = lessons_by_teacher.get(teacher.id, 0)
-		rate = float(teacher.hourly_rate_try) if teacher.hourly_rate_try is not None else None
-		amount = round(hours * rate, 2) if rate is not None else None
-		total_hours += hours
-		total_lessons += lesson_count
-		if amount is not None:
-			total_amount += amount
-		rows.append({
-			"teacher_id": teacher.id,
-			"teacher_name": f"{teacher.first_name} {teacher.last_name}",
-			"is_active": bool(getattr(teacher, "is_active", True)),
-			"hourly_rate_try": rate,
-			"lessons": lesson_count,
-			"hours": hours,
-			"amount": amount,
-		})
+	for teacher in teachers:
+		row = _teacher_pay_row(teacher, lessons_by_teacher.get(teacher.id, 0))
+		total_hours += row["hours"]
+		total_lessons += row["lessons"]
+		if row["amount"] is not None:
+			total_amount += row["amount"]
+		rows.append(row)
 
 	return {
 		"rows": rows,
@@ -1140,11 +1741,80 @@ def build_teacher_pay_report(
 	}
 
 
+def _month_keys_between(start_date: date, end_date: date) -> list[str]:
+	keys = []
+	year, month = start_date.year, start_date.month
+	while (year, month) <= (end_date.year, end_date.month):
+		keys.append(f"{year:04d}-{month:02d}")
+		month += 1
+		if month > 12:
+			year, month = year + 1, 1
+	return keys
+
+
+def build_teacher_pay_matrix(
+	db: Session,
+	*,
+	start_date: date | None = None,
+	end_date: date | None = None,
+	teacher_id: int | None = None,
+) -> dict:
+	"""
+	Çok dönemli hak ediş: öğretmen × ay matrisi, tek gruplu sorgu ile.
+	Her hücre build_teacher_pay_report satırıyla aynı alanları taşır (lessons/hours/amount);
+	satır toplamları seçilen aralıktaki build_teacher_pay_report ile aynıdır.
+	"""
+	teachers = _teachers_for_pay_report(db, teacher_id)
+	empty_totals = {"hours": 0.0, "amount": 0.0, "lessons": 0, "by_month": {}}
+	if not teachers:
+		return {"months": [], "rows": [], "totals": empty_totals}
+
+	credits: dict[tuple[int, str], int] = {}
+	for tid, year, month, lesson_count in _teacher_pay_credit_rows(
+		db, [t.id for t in teachers], start_date=start_date, end_date=end_date, by_month=True
+	):
+		key = f"{int(year):04d}-{int(month):02d}"
+		credits[(tid, key)] = credits.get((tid, key), 0) + int(lesson_count or 0)
+
+	if start_date and end_date:
+		months = _month_keys_between(start_date, end_date)
+	else:
+		months = sorted({ym for _, ym in credits})
+
+	rows = []
+	by_month_totals = {ym: {"lessons": 0, "hours": 0.0, "amount": 0.0} for ym in months}
+	for teacher in teachers:
+		cells = {}
+		for ym in months:
+			cell = _teacher_pay_row(teacher, credits.get((teacher.id, ym), 0))
+			cells[ym] = {"lessons": cell["lessons"], "hours": cell["hours"], "amount": cell["amount"]}
+			month_total = by_month_totals[ym]
+			month_total["lessons"] += cell["lessons"]
+			month_total["hours"] = round(month_total["hours"] + cell["hours"], 2)
+			if cell["amount"] is not None:
+				month_total["amount"] = round(month_total["amount"] + cell["amount"], 2)
+		row = _teacher_pay_row(teacher, sum(c["lessons"] for c in cells.values()))
+		row["months"] = cells
+		rows.append(row)
+
+	return {
+		"months": months,
+		"rows": rows,
+		"totals": {
+			"hours": round(sum(r["hours"] for r in rows), 2),
+			"amount": round(sum(r["amount"] for r in rows if r["amount"] is not None), 2),
+			"lessons": sum(r["lessons"] for r in rows),
+			"by_month": by_month_totals,
+		},
+	}
+
+
 def set_teacher_hourly_rate(db: Session, teacher_id: int, hourly_rate_try: float | None) -> bool:
 	teacher = db.get(models.Teacher, teacher_id)
 	if not teacher:
 		return False
 	teacher.hourly_rate_try = hourly_rate_try
+	bump_data_version(db, DOMAIN_SCHEDULE)
 	db.commit()
 	return True
 
@@ -1153,6 +1823,217 @@ PACKAGE_LESSON_SIZE = 4
 _PAYMENT_COUNTABLE_STATUSES = ("PRESENT", "TELAFI", "UNEXCUSED_ABSENT")
 
 
+# Ödeme → ders paket defteri (payment_lesson_allocations)
+def _compute_payment_allocation_rows(db: Session, student_ids: list[int] | None = None) -> list[dict]:
+	"""
+	Her ödeme = PACKAGE_LESSON_SIZE slot. Ödemeler (payment_date, id) sırasıyla,
+	sayılan yoklamalara (marked_at, id) sırasıyla eşlenir; yoklaması olmayan slotlar
+	attendance_id=None (ön ödeme) olarak döner. student_ids None ise tüm öğrenciler.
+	"""
+	payment_stmt = select(models.Payment.id, models.Payment.student_id, models.Payment.amount_try)
+	attendance_stmt = select(
+		models.Attendance.id, models.Attendance.student_id, models.Attendance.marked_at
+	).where(models.Attendance.status.in_(_PAYMENT_COUNTABLE_STATUSES))
+	if student_ids is not None:
+		if not student_ids:
+			return []
+		payment_stmt = payment_stmt.where(models.Payment.student_id.in_(student_ids))
+		attendance_stmt = attendance_stmt.where(models.Attendance.student_id.in_(student_ids))
+	payment_stmt = payment_stmt.order_by(
+		models.Payment.student_id.asc(), models.Payment.payment_date.asc(), models.Payment.id.asc()
+	)
+	attendance_stmt = attendance_stmt.order_by(
+		models.Attendance.student_id.asc(), models.Attendance.marked_at.asc(), models.Attendance.id.asc()
+	)
+
+	attendances_by_student: dict[int, list] = {}
+	for att_id, sid, marked_at in db.execute(attendance_stmt).all():
+		attendances_by_student.setdefault(sid, []).append((att_id, marked_at))
+
+	from decimal import Decimal
+	rows: list[dict] = []
+	package_counts: dict[int, int] = {}
+	for payment_id, sid, amount in db.execute(payment_stmt).all():
+		package_index = package_counts.get(sid, 0)
+		package_counts[sid] = package_index + 1
+		unit = Decimal(str(amount or 0)) / PACKAGE_LESSON_SIZE
+		attendances = attendances_by_student.get(sid, [])
+		for slot in range(PACKAGE_LESSON_SIZE):
+			position = package_index * PACKAGE_LESSON_SIZE + slot
+			att_id, marked_at = attendances[position] if position < len(attendances) else (None, None)
+			rows.append({
+				"student_id": sid,
+				"payment_id": payment_id,
+				"package_index": package_index + 1,
+				"sequence": slot + 1,
+				"attendance_id": att_id,
+				"lesson_date": marked_at.date() if marked_at else None,
+				"amount_share": unit,
+			})
+	return rows
+
+
+def refresh_payment_allocations(db: Session, student_ids) -> None:
+	"""
+	Verilen öğrencilerin paket defterini aynı transaction içinde yeniden yazar.
+	Commit yapmaz; refresh_student_financial_state ile aynı yerlerden çağrılır.
+	"""
+	ids = sorted({int(sid) for sid in student_ids if sid is not None})
+	if not ids:
+		return
+	db.flush()
+	db.execute(
+		delete(models.PaymentLessonAllocation).where(models.PaymentLessonAllocation.student_id.in_(ids))
+	)
+	rows = _compute_payment_allocation_rows(db, ids)
+	if rows:
+		db.execute(insert(models.PaymentLessonAllocation), rows)
+
+
+def rebuild_payment_allocations(db: Session, commit: bool = True) -> int:
+	"""Paket defterini tüm öğrenciler için sıfırdan kurar. Yazılan satır sayısını döndürür."""
+	db.execute(delete(models.PaymentLessonAllocation))
+	rows = _compute_payment_allocation_rows(db)
+	if rows:
+		db.execute(insert(models.PaymentLessonAllocation), rows)
+	if commit:
+		db.commit()
+	else:
+		db.flush()
+	return len(rows)
+
+
+def _year_month_sql(column):
+	"""Tarih kolonunu YYYYMM tamsayısına çevirir (gruplama için; NULL kalır)."""
+	return extract("year", column) * 100 + extract("month", column)
+
+
+def _year_month_label(value) -> str:
+	if value is None:
+		return "—"
+	value = int(value)
+	return f"{value // 100:04d}-{value % 100:02d}"
+
+
+def _filtered_package_payment_ids(
+	*,
+	payment_start: date | None,
+	payment_end: date | None,
+	coverage_start: date | None,
+	coverage_end: date | None,
+	student_id: int | None,
+	teacher_id: int | None,
+	only_cross_month: bool,
+):
+	"""Rapora girecek ödeme id'leri (alt sorgu). Kapsam ve ay aşımı defter üzerinden süzülür."""
+	alloc = models.PaymentLessonAllocation
+	stmt = select(models.Payment.id).join(models.Student, models.Student.id == models.Payment.student_id)
+	if student_id:
+		stmt = stmt.where(models.Payment.student_id == student_id)
+	if teacher_id:
+		stmt = stmt.where(
+			select(models.TeacherStudent.id)
+			.where(
+				models.TeacherStudent.student_id == models.Payment.student_id,
+				models.TeacherStudent.teacher_id == teacher_id,
+			)
+			.exists()
+		)
+	if payment_start:
+		stmt = stmt.where(models.Payment.payment_date >= payment_start)
+	if payment_end:
+		stmt = stmt.where(models.Payment.payment_date <= payment_end)
+
+	if coverage_start or coverage_end:
+		# Kapsam: paketteki bir ders kapsamda ya da bekleyen slot var ve tahsilat kapsamda
+		lesson_filters = [alloc.payment_id == models.Payment.id, alloc.attendance_id.isnot(None), alloc.lesson_date.isnot(None)]
+		pending_filters = [models.Payment.payment_date.isnot(None)]
+		if coverage_start:
+			lesson_filters.append(alloc.lesson_date >= coverage_start)
+			pending_filters.append(models.Payment.payment_date >= coverage_start)
+		if coverage_end:
+			lesson_filters.append(alloc.lesson_date <= coverage_end)
+			pending_filters.append(models.Payment.payment_date <= coverage_end)
+		has_pending = (
+			select(alloc.id)
+			.where(alloc.payment_id == models.Payment.id, alloc.attendance_id.is_(None))
+			.exists()
+		)
+		stmt = stmt.where(or_(select(alloc.id).where(*lesson_filters).exists(), and_(has_pending, *pending_filters)))
+
+	if only_cross_month:
+		# Ay aşımı: dersler ve tahsilat birden fazla aya yayılıyor
+		lesson_month = _year_month_sql(alloc.lesson_date)
+		lesson_rows = [alloc.payment_id == models.Payment.id, alloc.lesson_date.isnot(None)]
+		stmt = stmt.where(
+			or_(
+				and_(
+					models.Payment.payment_date.isnot(None),
+					select(alloc.id)
+					.where(*lesson_rows, lesson_month != _year_month_sql(models.Payment.payment_date))
+					.exists(),
+				),
+				and_(
+					models.Payment.payment_date.is_(None),
+					select(func.count(func.distinct(lesson_month))).where(*lesson_rows).scalar_subquery() > 1,
+				),
+			)
+		)
+	return stmt
+
+
+def build_payment_monthly_compare(db: Session, payment_ids) -> dict:
+	"""
+	Seçili ödemeler için aylık tahsilat / hak ediş / bekleyen karşılaştırması.
+	Defter üzerinde gruplu sorgular: tahsilat ödeme ayına, hak ediş ders ayına,
+	bekleyen (kullanılmamış slot) ödeme ayına yazılır.
+	"""
+	alloc = models.PaymentLessonAllocation
+	payment_month = _year_month_sql(models.Payment.payment_date)
+	lesson_month = _year_month_sql(alloc.lesson_date)
+
+	view_cash: dict[str, float] = {}
+	for ym, total in db.execute(
+		select(payment_month, func.sum(models.Payment.amount_try))
+		.where(models.Payment.id.in_(payment_ids))
+		.group_by(payment_month)
+	).all():
+		view_cash[_year_month_label(ym)] = float(total or 0)
+
+	def _monthly_share_totals(month_expr, *filters) -> dict[str, float]:
+		# Paket satırındaki month_split ile aynı: önce (ödeme, ay) toplamı kuruşa yuvarlanır
+		totals: dict[str, float] = {}
+		for ym, share in db.execute(
+			select(month_expr, func.sum(alloc.amount_share))
+			.join(models.Payment, models.Payment.id == alloc.payment_id)
+			.where(alloc.payment_id.in_(payment_ids), *filters)
+			.group_by(alloc.payment_id, month_expr)
+		).all():
+			label = _year_month_label(ym)
+			totals[label] = totals.get(label, 0.0) + round(float(share or 0), 2)
+		return totals
+
+	view_accrual = _monthly_share_totals(lesson_month, alloc.attendance_id.isnot(None))
+	view_prepaid = _monthly_share_totals(payment_month, alloc.attendance_id.is_(None))
+
+	all_months = sorted(set(view_cash) | set(view_accrual) | set(view_prepaid))
+	return {
+		"monthly_compare": [
+			{
+				"month": m,
+				"cash": round(view_cash.get(m, 0.0), 2),
+				"accrued": round(view_accrual.get(m, 0.0), 2),
+				"prepaid": round(view_prepaid.get(m, 0.0), 2),
+				"delta": round(view_cash.get(m, 0.0) - view_accrual.get(m, 0.0), 2),
+			}
+			for m in all_months
+		],
+		"cash": round(sum(view_cash.values()), 2),
+		"accrued": round(sum(view_accrual.values()), 2),
+		"prepaid": round(sum(view_prepaid.values()), 2),
+	}
+
+
 def build_payment_package_details(
 	db: Session,
 	*,
@@ -1162,49 +2043,34 @@ def build_payment_package_details(
 	coverage_end: date | None = None,
 	student_id: int | None = None,
 	teacher_id: int | None = None,
+	only_cross_month: bool = False,
 ) -> dict:
 	"""
 	Her ödeme = 4 derslik paket.
 	Ödemeler kronolojik sırayla, sayılan yoklamalara (Geldi/Telafi/Habersiz) eşlenir.
 	Böylece Ağustos tahsilatı Eylül derslerini kapsıyorsa ay bazında ayrıştırılır.
+	Eşleme payment_lesson_allocations defterinden okunur; yalnızca süzülen ödemeler yüklenir.
 	"""
-	teacher_names = student_teacher_name_map(db)
-
-	# Paket sırası doğru olsun diye ilgili öğrencilerin TÜM ödemeleri alınır;
-	# tarih filtresi satır seviyesinde uygulanır.
-	candidate_q = db.query(models.Payment.student_id).join(models.Student)
-	if student_id:
-		candidate_q = candidate_q.filter(models.Payment.student_id == student_id)
-	if teacher_id:
-		candidate_q = candidate_q.join(
-			models.TeacherStudent,
-			models.TeacherStudent.student_id == models.Payment.student_id,
-		).filter(models.TeacherStudent.teacher_id == teacher_id)
-	if payment_start:
-		candidate_q = candidate_q.filter(models.Payment.payment_date >= payment_start)
-	if payment_end:
-		candidate_q = candidate_q.filter(models.Payment.payment_date <= payment_end)
-	student_ids = sorted({row[0] for row in candidate_q.distinct().all()})
-
-	# Kapsam ayına göre ek öğrenci bul (tahsilat bu ayda olmasa da dersi bu ayda olan paketler)
-	if coverage_start or coverage_end:
-		att_q = db.query(models.Attendance.student_id).filter(
-			models.Attendance.status.in_(_PAYMENT_COUNTABLE_STATUSES)
+	payment_ids = _filtered_package_payment_ids(
+		payment_start=payment_start,
+		payment_end=payment_end,
+		coverage_start=coverage_start,
+		coverage_end=coverage_end,
+		student_id=student_id,
+		teacher_id=teacher_id,
+		only_cross_month=only_cross_month,
+	)
+	payments = db.scalars(
+		select(models.Payment)
+		.where(models.Payment.id.in_(payment_ids))
+		.order_by(
+			models.Payment.student_id.asc(),
+			models.Payment.payment_date.asc(),
+			models.Payment.id.asc(),
 		)
-		if coverage_start:
-			att_q = att_q.filter(models.Attendance.marked_at >= datetime.combine(coverage_start, datetime.min.time()))
-		if coverage_end:
-			att_q = att_q.filter(models.Attendance.marked_at <= datetime.combine(coverage_end, datetime.max.time()))
-		if student_id:
-			att_q = att_q.filter(models.Attendance.student_id == student_id)
-		if teacher_id:
-			att_q = att_q.join(
-				models.TeacherStudent,
-				models.TeacherStudent.student_id == models.Attendance.student_id,
-			).filter(models.TeacherStudent.teacher_id == teacher_id)
-		student_ids = sorted(set(student_ids) | {row[0] for row in att_q.distinct().all()})
+	).all()
 
-	if not student_ids:
+	if not payments:
 		return {
 			"rows": [],
 			"monthly_compare": [],
@@ -1218,173 +2084,107 @@ def build_payment_package_details(
 			"package_size": PACKAGE_LESSON_SIZE,
 		}
 
-	all_payments = (
-		db.query(models.Payment)
-		.filter(models.Payment.student_id.in_(student_ids))
-		.order_by(
-			models.Payment.student_id.asc(),
-			models.Payment.payment_date.asc(),
-			models.Payment.id.asc(),
-		)
-		.all()
-	)
-
+	student_ids = sorted({p.student_id for p in payments})
+	teacher_names = student_teacher_name_map(db)
 	students_map = {
 		s.id: s
 		for s in db.scalars(select(models.Student).where(models.Student.id.in_(student_ids))).all()
 	}
 
-	attendances_by_student: dict[int, list] = {sid: [] for sid in student_ids}
-	att_rows = (
-		db.query(models.Attendance)
-		.filter(
-			models.Attendance.student_id.in_(student_ids),
-			models.Attendance.status.in_(_PAYMENT_COUNTABLE_STATUSES),
+	alloc = models.PaymentLessonAllocation
+	slots_by_payment: dict[int, list] = {}
+	for slot in db.execute(
+		select(
+			alloc.payment_id,
+			alloc.package_index,
+			alloc.attendance_id,
+			alloc.lesson_date,
+			alloc.amount_share,
+			models.Attendance.status,
 		)
-		.order_by(models.Attendance.student_id.asc(), models.Attendance.marked_at.asc(), models.Attendance.id.asc())
-		.all()
-	)
-	for att in att_rows:
-		attendances_by_student.setdefault(att.student_id, []).append(att)
-
-	payments_by_student: dict[int, list] = {}
-	for p in all_payments:
-		payments_by_student.setdefault(p.student_id, []).append(p)
+		.outerjoin(models.Attendance, models.Attendance.id == alloc.attendance_id)
+		.where(alloc.payment_id.in_(payment_ids))
+		.order_by(alloc.payment_id.asc(), alloc.sequence.asc())
+	).all():
+		slots_by_payment.setdefault(slot.payment_id, []).append(slot)
 
 	detail_rows: list[dict] = []
-
-	for sid, payments in payments_by_student.items():
+	for payment in payments:
+		sid = payment.student_id
 		student = students_map.get(sid)
 		if not student:
 			continue
-		attendances = attendances_by_student.get(sid, [])
 		teacher_name = teacher_names.get(sid) or "Atanmamış"
+		amount = float(payment.amount_try or 0)
+		slots = slots_by_payment.get(payment.id, [])
+		covered = [s for s in slots if s.attendance_id is not None]
+		unused_slots = PACKAGE_LESSON_SIZE - len(covered)
+		set_index = slots[0].package_index if slots else 0
+
+		lesson_entries = []
+		month_split: dict[str, float] = {}
+		for slot in covered:
+			share = float(slot.amount_share or 0)
+			lesson_day = slot.lesson_date
+			ym = lesson_day.strftime("%Y-%m") if lesson_day else "—"
+			month_split[ym] = month_split.get(ym, 0.0) + share
+			lesson_entries.append({
+				"date": lesson_day.isoformat() if lesson_day else None,
+				"status": slot.status,
+				"status_label": ATTENDANCE_STATUS_LABELS.get(slot.status, slot.status),
+				"amount_share": round(share, 2),
+			})
 
-		for set_index, payment in enumerate(payments):
-			amount = float(payment.amount_try or 0)
-			unit = amount / PACKAGE_LESSON_SIZE if PACKAGE_LESSON_SIZE else amount
-			start_idx = set_index * PACKAGE_LESSON_SIZE
-			end_idx = start_idx + PACKAGE_LESSON_SIZE
-			covered = attendances[start_idx:end_idx]
-			unused_slots = PACKAGE_LESSON_SIZE - len(covered)
-
-			lesson_entries = []
-			month_split: dict[str, float] = {}
-			for att in covered:
-				lesson_day = att.marked_at.date() if att.marked_at else None
-				ym = lesson_day.strftime("%Y-%m") if lesson_day else "—"
-				month_split[ym] = month_split.get(ym, 0.0) + unit
-				lesson_entries.append({
-					"date": lesson_day.isoformat() if lesson_day else None,
-					"status": att.status,
-					"status_label": ATTENDANCE_STATUS_LABELS.get(att.status, att.status),
-					"amount_share": round(unit, 2),
-				})
-
-			pay_ym = payment.payment_date.strftime("%Y-%m") if payment.payment_date else "—"
+		pay_ym = payment.payment_date.strftime("%Y-%m") if payment.payment_date else "—"
+		if unused_slots > 0:
+			prepaid_amount = sum(float(s.amount_share or 0) for s in slots if s.attendance_id is None)
+			month_split[f"{pay_ym} (bekleyen)"] = month_split.get(f"{pay_ym} (bekleyen)", 0.0) + prepaid_amount
+
+		first_lesson = lesson_entries[0]["date"] if lesson_entries else None
+		last_lesson = lesson_entries[-1]["date"] if lesson_entries else None
+		if unused_slots == PACKAGE_LESSON_SIZE:
+			coverage_label = "Henüz ders kullanılmadı (ön ödeme)"
+		elif first_lesson and last_lesson:
+			coverage_label = f"{first_lesson} - {last_lesson}"
 			if unused_slots > 0:
-				prepaid_amount = unit * unused_slots
-				month_split[f"{pay_ym} (bekleyen)"] = month_split.get(f"{pay_ym} (bekleyen)", 0.0) + prepaid_amount
-
-			# Filtre: tahsilat tarihi
-			if payment_start and payment.payment_date and payment.payment_date < payment_start:
-				continue
-			if payment_end and payment.payment_date and payment.payment_date > payment_end:
-				continue
-			# Filtre: kapsam ayı
-			if coverage_start or coverage_end:
-				in_coverage = False
-				for entry in lesson_entries:
-					if not entry["date"]:
-						continue
-					d = date.fromisoformat(entry["date"])
-					if coverage_start and d < coverage_start:
-						continue
-					if coverage_end and d > coverage_end:
-						continue
-					in_coverage = True
-					break
-				if unused_slots > 0 and payment.payment_date:
-					d = payment.payment_date
-					ok = True
-					if coverage_start and d < coverage_start:
-						ok = False
-					if coverage_end and d > coverage_end:
-						ok = False
-					if ok:
-						in_coverage = True
-				if not in_coverage:
-					continue
-
-			first_lesson = lesson_entries[0]["date"] if lesson_entries else None
-			last_lesson = lesson_entries[-1]["date"] if lesson_entries else None
-			if unused_slots == PACKAGE_LESSON_SIZE:
-				coverage_label = "Henüz ders kullanılmadı (ön ödeme)"
-			elif first_lesson and last_lesson:
-				coverage_label = f"{first_lesson} - {last_lesson}"
-				if unused_slots > 0:
-					coverage_label += f" (+{unused_slots} ders bekliyor)"
-			elif first_lesson:
-				coverage_label = first_lesson
-			else:
-				coverage_label = "—"
-
-			months_used = {e["date"][:7] for e in lesson_entries if e.get("date")}
-			if payment.payment_date:
-				months_used.add(payment.payment_date.strftime("%Y-%m"))
-			crosses_month = len(months_used) > 1
-
-			detail_rows.append({
-				"payment_id": payment.id,
-				"payment_date": payment.payment_date.isoformat() if payment.payment_date else None,
-				"payment_month": pay_ym,
-				"amount": amount,
-				"method": payment.method,
-				"note": payment.note,
-				"student_id": sid,
-				"student_name": f"{student.first_name} {student.last_name}",
-				"teacher_name": teacher_name,
-				"set_index": set_index + 1,
-				"lessons_used": len(covered),
-				"lessons_remaining": unused_slots,
-				"coverage_label": coverage_label,
-				"month_split": {k: round(v, 2) for k, v in month_split.items()},
-				"lessons": lesson_entries,
-				"crosses_month": crosses_month,
-			})
+				coverage_label += f" (+{unused_slots} ders bekliyor)"
+		elif first_lesson:
+			coverage_label = first_lesson
+		else:
+			coverage_label = "—"
 
-	view_cash: dict[str, float] = {}
-	view_accrual: dict[str, float] = {}
-	view_prepaid: dict[str, float] = {}
-	for row in detail_rows:
-		pm = row["payment_month"]
-		view_cash[pm] = view_cash.get(pm, 0.0) + row["amount"]
-		for ym, val in row["month_split"].items():
-			if "(bekleyen)" in ym:
-				base = ym.replace(" (bekleyen)", "")
-				view_prepaid[base] = view_prepaid.get(base, 0.0) + val
-			else:
-				view_accrual[ym] = view_accrual.get(ym, 0.0) + val
+		months_used = {e["date"][:7] for e in lesson_entries if e.get("date")}
+		if payment.payment_date:
+			months_used.add(payment.payment_date.strftime("%Y-%m"))
+		crosses_month = len(months_used) > 1
 
-	all_months = sorted(set(view_cash) | set(view_accrual) | set(view_prepaid))
-	monthly_compare = [
-		{
-			"month": m,
-			"cash": round(view_cash.get(m, 0.0), 2),
-			"accrued": round(view_accrual.get(m, 0.0), 2),
-			"prepaid": round(view_prepaid.get(m, 0.0), 2),
-			"delta": round(view_cash.get(m, 0.0) - view_accrual.get(m, 0.0), 2),
-		}
-		for m in all_months
-	]
+		detail_rows.append({
+			"payment_id": payment.id,
+			"payment_date": payment.payment_date.isoformat() if payment.payment_date else None,
+			"payment_month": pay_ym,
+			"amount": amount,
+			"method": payment.method,
+			"note": payment.note,
+			"student_id": sid,
+			"student_name": f"{student.first_name} {student.last_name}",
+			"teacher_name": teacher_name,
+			"set_index": set_index,
+			"lessons_used": len(covered),
+			"lessons_remaining": unused_slots,
+			"coverage_label": coverage_label,
+			"month_split": {k: round(v, 2) for k, v in month_split.items()},
+			"lessons": lesson_entries,
+			"crosses_month": crosses_month,
+		})
 
+	compare = build_payment_monthly_compare(db, payment_ids)
 	return {
 		"rows": detail_rows,
-		"monthly_compare": monthly_compare,
+		"monthly_compare": compare["monthly_compare"],
 		"totals": {
-			"cash": round(sum(r["amount"] for r in detail_rows), 2),
-			"accrued": round(sum(view_accrual.values()), 2),
-			"prepaid": round(sum(view_prepaid.values()), 2),
+			"cash": compare["cash"],
+			"accrued": compare["accrued"],
+			"prepaid": compare["prepaid"],
 			"cross_month_packages": sum(1 for r in detail_rows if r["crosses_month"]),
 			"package_count": len(detail_rows),
 		},
@@ -1392,25 +2192,7 @@ def build_payment_package_details(
 	}
 
 
-def check_student_payment_status(db: Session, student_id: int):
-	"""Öğrencinin ödeme durumunu kontrol eder - ödeme gerekip gerekmediğini döndürür"""
-	from datetime import date
-	today = date.today()
-	
-	# Öğrencinin toplam ders sayısını hesapla (PRESENT veya TELAFI)
-	total_lessons = db.scalars(
-		select(func.count(models.Attendance.id))
-		.where(
-			models.Attendance.student_id == student_id,
-			models.Attendance.status.in_(["PRESENT", "TELAFI", "UNEXCUSED_ABSENT"])  # Habersiz gelmedi de toplam derse dahil
-		)
-	).first() or 0
-	
-	# Öğrencinin ödemelerini getir
-	payments = list_payments_by_student(db, student_id)
-	total_paid_sets = len(payments)
-	total_lessons = int(total_lessons or 0)
-	
+def _needs_payment(total_lessons: int, total_paid_sets: int) -> bool:
 	# Ödeme gerekli sadece: hiç ödeme yok VEYA aldığı ders sayısı ödenen setlerin karşıladığı dersi geçti (12 derse gelmeden gerekli gösterme)
 	# 3 set = 12 derse kadar; 8–9 ders alıp 3 set ödeyen öğrenci "gerekli" listesinde olmaz
 	if total_paid_sets == 0:
@@ -1418,15 +2200,31 @@ def check_student_payment_status(db: Session, student_id: int):
 	return total_lessons >= (total_paid_sets * 4)
 
 
+def check_students_payment_status(db: Session, student_ids) -> dict[int, bool]:
+	"""
+	student_id -> ödeme gerekli mi. Öğrenci sayısından bağımsız sabit sayıda sorgu:
+	özet tablo (student_financial_state) tek SELECT; özeti olmayanlar
+	_batch_attendance_counts / _batch_payment_counts ile toplu hesaplanır.
+	"""
+	ids = list(dict.fromkeys(int(sid) for sid in student_ids if sid is not None))
+	states = get_student_financial_states(db, ids)
+	out: dict[int, bool] = {}
+	for sid in ids:
+		state = states.get(sid, {})
+		out[sid] = _needs_payment(int(state.get("lessons_consumed", 0)), int(state.get("packages_paid", 0)))
+	return out
+
+
+def check_student_payment_status(db: Session, student_id: int):
+	"""Öğrencinin ödeme durumunu kontrol eder - ödeme gerekip gerekmediğini döndürür"""
+	return check_students_payment_status(db, [student_id]).get(student_id, True)
+
+
 def list_students_needing_payment(db: Session):
 	"""Ödeme gerekli olan tüm öğrencileri listeler (sadece aktif öğrenciler)"""
-	all_students = list_students(db, active_only=True)
-	students_needing_payment = []
-	
-	for student in all_students:
-		if check_student_payment_status(db, student.id):
-			students_needing_payment.append(student)
-	
+	payment_status_list, _ = build_payment_status_list(db, status_filter="needs_payment")
+	students_needing_payment = [item["student"] for item in payment_status_list]
+	students_needing_payment.sort(key=lambda s: s.created_at or datetime.min, reverse=True)
 	return students_needing_payment
 
 
@@ -1564,6 +2362,100 @@ def _batch_last_payment_dates(db: Session, student_ids: list[int]) -> dict[int,
 	return {row[0]: row[1] for row in rows}
 
 
+# Öğrenci finans özeti (student_financial_state)
+def _compute_student_financial_rows(db: Session, student_ids: list[int]) -> dict[int, dict]:
+	"""Ham yoklama/ödeme tablolarından özet değerleri hesaplar (yazmaz)."""
+	if not student_ids:
+		return {}
+	attendance_counts = _batch_attendance_counts(db, student_ids)
+	payment_counts = _batch_payment_counts(db, student_ids)
+	last_payment_dates = _batch_last_payment_dates(db, student_ids)
+	out: dict[int, dict] = {}
+	for sid in student_ids:
+		lessons_consumed = attendance_counts.get(sid, 0)
+		packages_paid = payment_counts.get(sid, 0)
+		out[sid] = {
+			"lessons_consumed": lessons_consumed,
+			"packages_paid": packages_paid,
+			"last_payment_date": last_payment_dates.get(sid),
+			"payment_status_class": classify_payment_status(lessons_consumed, packages_paid)["payment_status_class"],
+		}
+	return out
+
+
+def refresh_student_financial_state(db: Session, student_ids) -> None:
+	"""
+	Verilen öğrencilerin özet satırlarını aynı transaction içinde günceller.
+	Commit yapmaz; yoklama/ödeme yazan fonksiyon commit ettiğinde birlikte kalıcı olur.
+	"""
+	ids = sorted({int(sid) for sid in student_ids if sid is not None})
+	if not ids:
+		return
+	db.flush()
+	existing_ids = set(db.scalars(select(models.Student.id).where(models.Student.id.in_(ids))).all())
+	ids = [sid for sid in ids if sid in existing_ids]
+	if not ids:
+		return
+	values_by_student = _compute_student_financial_rows(db, ids)
+	states = {
+		row.student_id: row for row in db.scalars(
+			select(models.StudentFinancialState).where(models.StudentFinancialState.student_id.in_(ids))
+		).all()
+	}
+	now = datetime.utcnow()
+	for sid in ids:
+		values = values_by_student[sid]
+		state = states.get(sid)
+		if state is None:
+			db.add(models.StudentFinancialState(student_id=sid, updated_at=now, **values))
+			continue
+		for key, value in values.items():
+			setattr(state, key, value)
+		state.updated_at = now
+	db.flush()
+
+
+def rebuild_student_financial_state(db: Session, commit: bool = True) -> int:
+	"""Tüm öğrenciler için özet tabloyu sıfırdan kurar. Yazılan satır sayısını döndürür."""
+	student_ids = list(db.scalars(select(models.Student.id)).all())
+	db.execute(delete(models.StudentFinancialState))
+	values_by_student = _compute_student_financial_rows(db, student_ids)
+	now = datetime.utcnow()
+	db.add_all([
+		models.StudentFinancialState(student_id=sid, updated_at=now, **values)
+		for sid, values in values_by_student.items()
+	])
+	if commit:
+		db.commit()
+	else:
+		db.flush()
+	return len(values_by_student)
+
+
+def get_student_financial_states(db: Session, student_ids: list[int]) -> dict[int, dict]:
+	"""
+	student_id -> {lessons_consumed, packages_paid, last_payment_date, payment_status_class}.
+	Özet satırı henüz olmayan öğrenciler (rebuild öncesi) ham tablolardan hesaplanır.
+	"""
+	if not student_ids:
+		return {}
+	out = {
+		row.student_id: {
+			"lessons_consumed": int(row.lessons_consumed or 0),
+			"packages_paid": int(row.packages_paid or 0),
+			"last_payment_date": row.last_payment_date,
+			"payment_status_class": row.payment_status_class,
+		}
+		for row in db.scalars(
+			select(models.StudentFinancialState).where(models.StudentFinancialState.student_id.in_(student_ids))
+		).all()
+	}
+	missing = [sid for sid in student_ids if sid not in out]
+	if missing:
+		out.update(_compute_student_financial_rows(db, missing))
+	return out
+
+
 def _load_lesson_days_courses_for_students(
 	db: Session,
 	student_ids: list[int],
@@ -1618,19 +2510,38 @@ def build_payment_status_list(
 	if status_filter not in VALID_PAYMENT_STATUS_FILTERS:
 		return [], {}
 
-	all_students = list_students(db, active_only=True)
-	if not all_students:
+	# Özet tablodan tek indeksli okuma; özet satırı olmayan öğrenciler de alınır (sonra hesaplanır)
+	rows = db.execute(
+		select(models.Student, models.StudentFinancialState)
+		.outerjoin(
+			models.StudentFinancialState,
+			models.StudentFinancialState.student_id == models.Student.id,
+		)
+		.where(
+			models.Student.is_active == True,
+			or_(
+				models.StudentFinancialState.payment_status_class == status_filter,
+				models.StudentFinancialState.student_id.is_(None),
+			),
+		)
+	).all()
+	if not rows:
 		return [], {}
 
-	student_ids = [s.id for s in all_students]
-	attendance_counts = _batch_attendance_counts(db, student_ids)
-	payment_counts = _batch_payment_counts(db, student_ids)
-	last_payment_by_student = _batch_last_payment_dates(db, student_ids) if include_staff_fields else {}
+	missing_ids = [student.id for student, state in rows if state is None]
+	computed = _compute_student_financial_rows(db, missing_ids) if missing_ids else {}
 
 	candidates: list[dict] = []
-	for student in all_students:
-		total_lessons = attendance_counts.get(student.id, 0)
-		total_paid_sets = payment_counts.get(student.id, 0)
+	for student, state in rows:
+		if state is not None:
+			total_lessons = int(state.lessons_consumed or 0)
+			total_paid_sets = int(state.packages_paid or 0)
+			last_payment_date = state.last_payment_date
+		else:
+			values = computed.get(student.id, {})
+			total_lessons = values.get("lessons_consumed", 0)
+			total_paid_sets = values.get("packages_paid", 0)
+			last_payment_date = values.get("last_payment_date")
 		info = classify_payment_status(total_lessons, total_paid_sets)
 		if info["payment_status_class"] != status_filter:
 			continue
@@ -1646,7 +2557,7 @@ def build_payment_status_list(
 				"total_lessons": total_lessons,
 				"expected_paid_sets": (total_lessons // 4) + 1,
 				"total_paid_sets": total_paid_sets,
-				"last_payment_date": last_payment_by_student.get(student.id),
+				"last_payment_date": last_payment_date,
 			})
 		candidates.append(item)
 
@@ -1725,6 +2636,43 @@ def mark_overdue_invoices(db: Session):
     return updated
 
 
+def normalized_attendance_status_sql():
+    """normalize_attendance_status_value kuralının SQL karşılığı (LATE→TELAFI, ABSENT→UNEXCUSED_ABSENT)."""
+    from sqlalchemy import case
+    return case(
+        (models.Attendance.status == "LATE", "TELAFI"),
+        (models.Attendance.status == "ABSENT", "UNEXCUSED_ABSENT"),
+        else_=func.coalesce(models.Attendance.status, ""),
+    )
+
+
+def is_resim_course_sql():
+    """is_resim_course_name kuralının SQL karşılığı (Course join'i gerekir)."""
+    return func.lower(func.trim(func.coalesce(models.Course.name, ""))) == "resim"
+
+
+def teacher_puantaj_lesson_credit_sql():
+    """teacher_puantaj_lesson_credit kuralının SQL CASE karşılığı (0 veya 1)."""
+    from sqlalchemy import case
+    normalized = normalized_attendance_status_sql()
+    return case(
+        (normalized.in_(("PRESENT", "TELAFI")), 1),
+        ((normalized == "UNEXCUSED_ABSENT") & ~is_resim_course_sql(), 1),
+        else_=0,
+    )
+
+
+def marked_at_range_filters(start_date: date | None = None, end_date: date | None = None) -> list:
+    """marked_at için indeks kullanabilen (sargable) yarı açık tarih aralığı koşulları."""
+    from datetime import timedelta
+    filters = []
+    if start_date:
+        filters.append(models.Attendance.marked_at >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        filters.append(models.Attendance.marked_at < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return filters
+
+
 def get_attendance_report_by_teacher(
     db: Session,
     teacher_id: int | None = None,
@@ -1735,135 +2683,111 @@ def get_attendance_report_by_teacher(
     status: str | None = None,
     student_name: str | None = None,
 ):
-    """Öğretmenlere göre yoklama raporu oluşturur. Filtreleme parametreleri ile çalışır."""
-    from sqlalchemy.orm import joinedload
-
+    """
+    Öğretmenlere göre yoklama raporu oluşturur. Filtreleme parametreleri ile çalışır.
+    Tüm öğretmenler için tek gruplu sorgu: (öğretmen, öğrenci, gün, durum, resim mi) başına adet.
+    """
     if teacher_id:
-        teachers = [db.get(models.Teacher, teacher_id)] if db.get(models.Teacher, teacher_id) else []
+        teacher = db.get(models.Teacher, teacher_id)
+        teachers = [teacher] if teacher else []
     else:
         teachers = list_teachers(db)
-    report = []
+    if not teachers:
+        return []
+    teacher_ids = [t.id for t in teachers]
+
+    day_col = func.date(models.Attendance.marked_at)
+    status_col = normalized_attendance_status_sql()
+    resim_col = is_resim_course_sql()
+    credit_col = teacher_puantaj_lesson_credit_sql()
+    stmt = (
+        select(
+            models.Lesson.teacher_id,
+            models.Attendance.student_id,
+            day_col,
+            status_col,
+            resim_col,
+            func.count(models.Attendance.id),
+            func.sum(credit_col),
+        )
+        .select_from(models.Attendance)
+        .join(models.Lesson, models.Lesson.id == models.Attendance.lesson_id)
+        .outerjoin(models.Course, models.Course.id == models.Lesson.course_id)
+        .where(models.Lesson.teacher_id.in_(teacher_ids))
+    )
+    if student_id:
+        stmt = stmt.where(models.Attendance.student_id == student_id)
+    elif student_name and student_name.strip():
+        stmt = stmt.join(models.Student, models.Student.id == models.Attendance.student_id).where(
+            student_name_prefix_filter(student_name)
+        )
+    if status and status.strip():
+        stmt = stmt.where(attendance_status_filter(status))
+    if course_id:
+        stmt = stmt.where(models.Lesson.course_id == course_id)
+    for condition in marked_at_range_filters(start_date, end_date):
+        stmt = stmt.where(condition)
+    stmt = stmt.group_by(
+        models.Lesson.teacher_id, models.Attendance.student_id, day_col, status_col, resim_col
+    ).order_by(models.Lesson.teacher_id, day_col, models.Attendance.student_id)
+    rows = db.execute(stmt).all()
+
+    student_map = {
+        s.id: s for s in db.scalars(
+            select(models.Student).where(models.Student.id.in_({row[1] for row in rows}))
+        ).all()
+    } if rows else {}
+
+    stats_by_teacher: dict[int, dict[int, dict]] = {}
+    for row_teacher_id, att_student_id, day_value, att_status, _is_resim, count, credits in rows:
+        student = student_map.get(att_student_id)
+        if not student:
+            continue
+        student_stats = stats_by_teacher.setdefault(row_teacher_id, {})
+        if att_student_id not in student_stats:
+            student_stats[att_student_id] = {
+                "student": student,
+                "present": 0,
+                "excused_absent": 0,
+                "telafi": 0,
+                "unexcused_absent": 0,
+                "total": 0,
+                "dates": []
+            }
+        stats = student_stats[att_student_id]
+        count = int(count or 0)
+        # Öğretmen Toplam Ders artışı SQL'de teacher_puantaj_lesson_credit kuralıyla hesaplandı
+        credits = int(credits or 0)
+
+        # Yoklama zamanındaki tarihi kullan (marked_at); SQLite date() metin döndürür
+        if day_value:
+            attendance_date = date.fromisoformat(day_value[:10]) if isinstance(day_value, str) else day_value
+            date_str = attendance_date.strftime('%d.%m.%Y')
+        else:
+            date_str = ''
+
+        if att_status == "PRESENT":
+            stats["present"] += count
+        elif att_status == "EXCUSED_ABSENT":
+            # Haberli: öğrenci sütununda görünür; öğretmen toplamına girmez (credit=0)
+            stats["excused_absent"] += count
+        elif att_status == "TELAFI":
+            stats["telafi"] += count
+        elif att_status == "UNEXCUSED_ABSENT":
+            # Resim: öğrenci sütununda görünür, öğretmen toplamına eklenmez (credit=0)
+            stats["unexcused_absent"] += count
+        else:
+            continue
+        stats["total"] += credits
+        stats["dates"].extend([date_str] * count)
 
+    report = []
     for teacher in teachers:
-        if not teacher:
-            continue
-        lessons = list_lessons_by_teacher(db, teacher.id)
-        lesson_ids = [lesson.id for lesson in lessons]
-
-        attendances = []
-        if lesson_ids:
-            stmt = select(models.Attendance).where(
-                models.Attendance.lesson_id.in_(lesson_ids)
-            )
-            if student_id:
-                stmt = stmt.where(models.Attendance.student_id == student_id)
-            if status and status.strip():
-                stmt = stmt.where(attendance_status_filter(status))
-            attendances = db.scalars(stmt).all()
-
-            if course_id or start_date or end_date:
-                lesson_map = {
-                    l.id: l for l in db.scalars(
-                        select(models.Lesson).where(models.Lesson.id.in_({a.lesson_id for a in attendances}))
-                    ).all()
-                } if attendances else {}
-                filtered_attendances = []
-                for att in attendances:
-                    lesson = lesson_map.get(att.lesson_id)
-                    if not lesson:
-                        continue
-                    if course_id and lesson.course_id != course_id:
-                        continue
-                    if start_date:
-                        if not att.marked_at or att.marked_at.date() < start_date:
-                            continue
-                    if end_date:
-                        if not att.marked_at or att.marked_at.date() > end_date:
-                            continue
-                    filtered_attendances.append(att)
-                attendances = filtered_attendances
-
-        lesson_map = {
-            l.id: l for l in db.scalars(
-                select(models.Lesson)
-                .where(models.Lesson.id.in_({a.lesson_id for a in attendances}))
-                .options(joinedload(models.Lesson.course))
-            ).all()
-        } if attendances else {}
-        student_map = {
-            s.id: s for s in db.scalars(
-                select(models.Student).where(models.Student.id.in_({a.student_id for a in attendances}))
-            ).all()
-        } if attendances else {}
-
-        if student_name and student_name.strip() and not student_id:
-            attendances = [
-                att for att in attendances
-                if (stu := student_map.get(att.student_id))
-                and student_name_matches_prefix(f"{stu.first_name} {stu.last_name}", student_name)
-            ]
-
-        student_stats = {}
-        for att in attendances:
-            lesson = lesson_map.get(att.lesson_id)
-            att_student_id = att.student_id
-            if att_student_id not in student_stats:
-                student = student_map.get(att_student_id)
-                if not student:
-                    continue
-                student_stats[att_student_id] = {
-                    "student": student,
-                    "present": 0,
-                    "excused_absent": 0,
-                    "telafi": 0,
-                    "unexcused_absent": 0,
-                    "total": 0,
-                    "dates": []
-                }
-            
-            # Yoklama zamanındaki tarihi kullan (marked_at)
-            if att.marked_at:
-                attendance_date = att.marked_at.date() if hasattr(att.marked_at, 'date') else att.marked_at
-                date_str = attendance_date.strftime('%d.%m.%Y') if hasattr(attendance_date, 'strftime') else str(attendance_date)
-            else:
-                date_str = ''
-            
-            status = normalize_attendance_status_value(att.status)
-            course_name = lesson.course.name if lesson and lesson.course else None
-            is_resim_course = is_resim_course_name(course_name)
-            # Öğretmen Toplam Ders artışı: Resim ve diğer kurslar için ortak kural
-            lesson_count = teacher_puantaj_lesson_credit(status, course_name)
-            
-            if status == "PRESENT":
-                student_stats[att_student_id]["present"] += lesson_count
-                student_stats[att_student_id]["total"] += lesson_count
-                student_stats[att_student_id]["dates"].append(date_str)
-            elif status == "EXCUSED_ABSENT":
-                # Haberli: öğrenci sütununda görünsün diye 1; öğretmen toplamına girmez (lesson_count=0)
-                student_stats[att_student_id]["excused_absent"] += 1
-                student_stats[att_student_id]["dates"].append(date_str)
-            elif status == "TELAFI":
-                student_stats[att_student_id]["telafi"] += lesson_count
-                student_stats[att_student_id]["total"] += lesson_count
-                student_stats[att_student_id]["dates"].append(date_str)
-            elif status == "UNEXCUSED_ABSENT":
-                # Resim: öğrenci sütununda görünür, öğretmen toplamına eklenmez
-                # Diğer: hem sütun hem toplam
-                if is_resim_course:
-                    student_stats[att_student_id]["unexcused_absent"] += 1
-                    student_stats[att_student_id]["dates"].append(date_str)
-                else:
-                    student_stats[att_student_id]["unexcused_absent"] += lesson_count
-                    student_stats[att_student_id]["total"] += lesson_count
-                    student_stats[att_student_id]["dates"].append(date_str)
-        
-        students_list = list(student_stats.values())
+        students_list = list(stats_by_teacher.get(teacher.id, {}).values())
         if students_list or teacher_id:
             report.append({
                 "teacher": teacher,
                 "students": students_list
             })
-    
-    return report
-
 
+    return report
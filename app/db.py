@@ -1,5 +1,5 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
 
 # Environment variable'dan al (cloud platformlar otomatik ekler)
@@ -9,6 +9,89 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
 if DATABASE_URL.startswith("postgres://"):
 	DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# SQLite performans profili (opsiyonel): SQLITE_PROFILE=performance
+# WAL + synchronous=NORMAL, mmap/cache/busy_timeout/temp_store pragmaları;
+# yazmalar tek yazıcı bağlantıdan, okumalar salt-okunur bağlantı havuzundan yapılır.
+SQLITE_PROFILE = (os.getenv("SQLITE_PROFILE") or "").strip().lower()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+
+# Salt-okunur bağlantı havuzu (yalnızca SQLite performans profilinde)
+read_engine = None
+
+
+def _sqlite_file_path(url: str) -> str | None:
+	"""sqlite:///./data.db -> ./data.db ; bellek içi veritabanı için None."""
+	from sqlalchemy.engine import make_url
+	database = make_url(url).database
+	if not database or database == ":memory:" or database.startswith("file:"):
+		return None
+	return database
+
+
+def _apply_sqlite_pragmas(dbapi_connection, *, writer: bool) -> None:
+	cursor = dbapi_connection.cursor()
+	try:
+		if writer:
+			cursor.execute("PRAGMA journal_mode=WAL")
+			cursor.execute("PRAGMA synchronous=NORMAL")
+		else:
+			cursor.execute("PRAGMA query_only=ON")
+		cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+		cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+		cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+		cursor.execute("PRAGMA temp_store=MEMORY")
+	finally:
+		cursor.close()
+
+
+def _create_sqlite_performance_engines(url: str, path: str):
+	"""(yazıcı engine, salt-okunur engine) döndürür."""
+	import sqlite3
+	from sqlalchemy.pool import QueuePool
+
+	# Tek yazıcı bağlantı: eşzamanlı yazmalar havuzda sıraya girer, "database is locked" beklemesi olmaz
+	writer = create_engine(
+		url,
+		connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+		pool_size=1,
+		max_overflow=0,
+		pool_timeout=30,
+	)
+	abs_path = os.path.abspath(path)
+
+	def _connect_read_only():
+		return sqlite3.connect(
+			f"file:{abs_path}?mode=ro",
+			uri=True,
+			check_same_thread=False,
+			timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+		)
+
+	reader = create_engine(
+		"sqlite://",
+		creator=_connect_read_only,
+		poolclass=QueuePool,
+		pool_size=SQLITE_READ_POOL_SIZE,
+		max_overflow=SQLITE_READ_POOL_SIZE,
+	)
+
+	@event.listens_for(writer, "connect")
+	def _writer_connect(dbapi_connection, connection_record):
+		_apply_sqlite_pragmas(dbapi_connection, writer=True)
+
+	@event.listens_for(reader, "connect")
+	def _reader_connect(dbapi_connection, connection_record):
+		_apply_sqlite_pragmas(dbapi_connection, writer=False)
+
+	# WAL modunu (ve -wal/-shm dosyalarını) salt-okunur bağlantılardan önce kur
+	with writer.connect():
+		pass
+	return writer, reader
+
+
 # PostgreSQL veya SQLite için farklı ayarlar
 if DATABASE_URL.startswith("postgresql://") or DATABASE_URL.startswith("postgres://"):
 	# PostgreSQL için
@@ -18,6 +101,9 @@ if DATABASE_URL.startswith("postgresql://") or DATABASE_URL.startswith("postgres
 		pool_size=5,  # Connection pool boyutu
 		max_overflow=10
 	)
+elif SQLITE_PROFILE == "performance" and _sqlite_file_path(DATABASE_URL):
+	# SQLite için (production profili)
+	engine, read_engine = _create_sqlite_performance_engines(DATABASE_URL, _sqlite_file_path(DATABASE_URL))
 else:
 	# SQLite için (geliştirme)
 	engine = create_engine(
@@ -25,7 +111,48 @@ else:
 		connect_args={"check_same_thread": False},
 	)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+_READ_ONLY_SQL_PREFIXES = ("SELECT", "WITH", "EXPLAIN")
+
+
+def _is_write_clause(clause) -> bool:
+	from sqlalchemy.sql.dml import UpdateBase
+	from sqlalchemy.sql.elements import TextClause
+	if isinstance(clause, UpdateBase):
+		return True
+	if isinstance(clause, TextClause):
+		words = clause.text.lstrip().split(None, 1)
+		return not words or words[0].upper() not in _READ_ONLY_SQL_PREFIXES
+	return False
+
+
+class RoutingSession(Session):
+	"""
+	Okumaları salt-okunur havuza, yazmaları (flush / DML / DDL) yazıcı bağlantıya yönlendirir.
+	Transaction içinde ilk yazmadan sonra okumalar da yazıcıdan yapılır (kendi yazdığını görsün).
+	"""
+
+	def get_bind(self, mapper=None, clause=None, **kw):
+		if read_engine is None:
+			return engine
+		if self.info.get("wrote") or self._flushing or _is_write_clause(clause):
+			self.info["wrote"] = True
+			return engine
+		return read_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def _reset_write_routing(session):
+	session.info.pop("wrote", None)
+
+
+SessionLocal = sessionmaker(
+	autocommit=False,
+	autoflush=False,
+	bind=engine,
+	class_=RoutingSession if read_engine is not None else Session,
+)
 
 Base = declarative_base()
 
@@ -36,8 +163,8 @@ def get_db():
 	finally:
 		db.close()
 
-def ensure_is_active_column():
-	"""is_active kolonunun var olduğundan emin ol"""
+def ensure_is_active_column() -> bool:
+	"""is_active kolonunun var olduğundan emin ol; başarısız olursa False"""
 	try:
 		from sqlalchemy import text, inspect
 		inspector = inspect(engine)
@@ -63,25 +190,28 @@ def ensure_is_active_column():
 				print("is_active kolonu basariyla eklendi")
 			except Exception as e:
 				error_str = str(e).lower()
-				if "duplicate column" in error_str or "already exists" in error_str or "column" in error_str:
+				db.rollback()
+				if "duplicate column" in error_str or "already exists" in error_str:
 					print("is_active kolonu zaten mevcut")
 				else:
 					print(f"is_active kolonu eklenirken hata: {e}")
 					import traceback
 					traceback.print_exc()
-				db.rollback()
+					return False
 			finally:
 				db.close()
 		else:
 			print("is_active kolonu zaten mevcut")
+		return True
 	except Exception as e:
 		print(f"is_active kolonu kontrol edilirken hata: {e}")
 		import traceback
 		traceback.print_exc()
+		return False
 
 
-def ensure_teacher_is_active_column():
-	"""teachers.is_active kolonunun var olduğundan emin ol"""
+def ensure_teacher_is_active_column() -> bool:
+	"""teachers.is_active kolonunun var olduğundan emin ol; başarısız olursa False"""
 	try:
 		from sqlalchemy import text, inspect
 		inspector = inspect(engine)
@@ -103,17 +233,20 @@ def ensure_teacher_is_active_column():
 				print("teachers.is_active kolonu basariyla eklendi")
 			except Exception as e:
 				error_str = str(e).lower()
+				db.rollback()
 				if "duplicate column" not in error_str and "already exists" not in error_str:
 					print(f"teachers.is_active kolonu eklenirken hata: {e}")
-				db.rollback()
+					return False
 			finally:
 				db.close()
+		return True
 	except Exception as e:
 		print(f"teachers.is_active kolonu kontrol edilirken hata: {e}")
+		return False
 
 
-def ensure_teacher_hourly_rate_column():
-	"""teachers.hourly_rate_try kolonunun var olduğundan emin ol"""
+def ensure_teacher_hourly_rate_column() -> bool:
+	"""teachers.hourly_rate_try kolonunun var olduğundan emin ol; başarısız olursa False"""
 	try:
 		from sqlalchemy import text, inspect
 		inspector = inspect(engine)
@@ -123,7 +256,7 @@ def ensure_teacher_hourly_rate_column():
 		except Exception:
 			column_names = []
 		if "hourly_rate_try" in column_names:
-			return
+			return True
 		print("teachers.hourly_rate_try kolonu bulunamadi, ekleniyor...")
 		db = SessionLocal()
 		try:
@@ -135,18 +268,21 @@ def ensure_teacher_hourly_rate_column():
 			error_str = str(e).lower()
 			if "duplicate" not in error_str and "already exists" not in error_str:
 				print(f"hourly_rate_try eklenirken hata: {e}")
+				return False
 		finally:
 			db.close()
+		return True
 	except Exception as e:
 		print(f"hourly_rate_try kontrol hatasi: {e}")
+		return False
 
 
-def ensure_attendance_lesson_fk_restrict():
+def ensure_attendance_lesson_fk_restrict() -> bool:
 	"""PostgreSQL'de attendances.lesson_id FK'yi RESTRICT yap (yoklama kayıtları ders silinirken silinmesin)"""
 	try:
 		from sqlalchemy import text
 		if "postgresql" not in str(engine.url).lower() and "postgres" not in str(engine.url).lower():
-			return
+			return True
 		db = SessionLocal()
 		try:
 			# Şu an delete_rule CASCADE mı kontrol et; RESTRICT ise dokunma
@@ -159,7 +295,7 @@ def ensure_attendance_lesson_fk_restrict():
 			"""))
 			row = r.fetchone()
 			if not row or row[1].upper() == "RESTRICT":
-				return
+				return True
 			old_constraint = row[0]
 			db.execute(text(f"ALTER TABLE attendances DROP CONSTRAINT IF EXISTS {old_constraint}"))
 			db.execute(text("""
@@ -168,15 +304,101 @@ def ensure_attendance_lesson_fk_restrict():
 			"""))
 			db.commit()
 			print("attendances.lesson_id FK RESTRICT olarak güncellendi")
+			return True
 		except Exception as e:
 			db.rollback()
+			print(f"attendances.lesson_id FK guncelleme hatasi: {e}")
+			return False
 		finally:
 			db.close()
-	except Exception:
-		pass
+	except Exception as e:
+		print(f"attendances.lesson_id FK kontrol hatasi: {e}")
+		return False
+
+
+def _ensure_app_meta(db):
+	from sqlalchemy import text
+	db.execute(text("""
+		CREATE TABLE IF NOT EXISTS app_meta (
+			key VARCHAR(100) PRIMARY KEY,
+			value VARCHAR(255),
+			created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+		)
+	"""))
+	db.commit()
+
+
+def run_set_backfill(
+	flag_key: str,
+	label: str,
+	insert_sql: dict[str, str],
+	count_sql: str | None = None,
+	required_tables: tuple[str, ...] = (),
+) -> int | None:
+	"""
+	Tek seferlik, küme tabanlı backfill: tek bir INSERT ... SELECT çalıştırır.
+
+	insert_sql lehçe adına göre ("postgresql", "sqlite") SQL içerir; "default"
+	anahtarı diğer lehçeler için kullanılır. count_sql verilirse önce aday satır
+	sayısı raporlanır. Bayrak (app_meta.flag_key) varsa hiçbir şey yapmaz ve None
+	döner; aksi halde eklenen satır sayısını bayrakla birlikte kaydeder.
+	Gerekli tablolar yoksa ya da SQL hata verirse istisna yükselir (bayrak yazılmaz).
+	"""
+	import time
+	from sqlalchemy import text, inspect
+
+	if required_tables:
+		table_names = set(inspect(engine).get_table_names())
+		missing = [name for name in required_tables if name not in table_names]
+		if missing:
+			raise RuntimeError(f"{label}: tablo bulunamadi: {', '.join(missing)}")
 
+	dialect = engine.dialect.name
+	sql = insert_sql.get(dialect) or insert_sql.get("default")
+	if not sql:
+		print(f"{label}: {dialect} icin backfill SQL tanimli degil, atlandi")
+		return None
 
-def ensure_lesson_students_backfill_from_attendance():
+	db = SessionLocal()
+	try:
+		_ensure_app_meta(db)
+		flag = db.execute(
+			text("SELECT value FROM app_meta WHERE key = :k"),
+			{"k": flag_key},
+		).fetchone()
+		if flag:
+			return None
+
+		if count_sql:
+			candidates = db.execute(text(count_sql)).scalar() or 0
+			print(f"{label}: {candidates} aday kayit")
+		started = time.perf_counter()
+		inserted = db.execute(text(sql)).rowcount or 0
+		db.execute(text("""
+			INSERT INTO app_meta (key, value) VALUES (:k, :v)
+		"""), {"k": flag_key, "v": str(inserted)})
+		db.commit()
+		print(f"{label} tamamlandi: {inserted} kayit ({time.perf_counter() - started:.2f}s)")
+		return inserted
+	except Exception as e:
+		db.rollback()
+		print(f"{label} hatasi: {e}")
+		raise
+	finally:
+		db.close()
+
+
+# LessonStudent'ı olmayan derslerin yoklamaları
+_EMPTY_LESSON_ATTENDANCES = """
+	FROM attendances a
+	WHERE a.student_id IS NOT NULL
+	  AND NOT EXISTS (
+		SELECT 1 FROM lesson_students ls WHERE ls.lesson_id = a.lesson_id
+	  )
+"""
+
+
+def ensure_lesson_students_backfill_from_attendance() -> bool:
 	"""
 	Tek seferlik onarım: LessonStudent'ı boş olan ama yoklaması bulunan derslere
 	son yoklama öğrencisini gerçek atama olarak yazar.
@@ -184,110 +406,51 @@ def ensure_lesson_students_backfill_from_attendance():
 	Eski program görünümü yoklamadan isim gösteriyordu; Dersten çıkar ise yalnızca
 	LessonStudent'a bakıyordu. Bu backfill ikisini hizalar. Bayrak sayesinde
 	Dersten çıkar sonrası yeniden ekleme yapmaz.
+
+	Ders başına sorgu yerine tek INSERT ... SELECT: PostgreSQL'de DISTINCT ON,
+	diğerlerinde ROW_NUMBER() penceresi ile her dersin son yoklaması seçilir.
 	"""
 	try:
-		from sqlalchemy import text, inspect
-		inspector = inspect(engine)
-		table_names = set(inspector.get_table_names())
-		if "lessons" not in table_names or "attendances" not in table_names or "lesson_students" not in table_names:
-			return
-
-		db = SessionLocal()
-		try:
-			db.execute(text("""
-				CREATE TABLE IF NOT EXISTS app_meta (
-					key VARCHAR(100) PRIMARY KEY,
-					value VARCHAR(255),
-					created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-				)
-			"""))
-			db.commit()
-
-			flag = db.execute(
-				text("SELECT value FROM app_meta WHERE key = :k"),
-				{"k": "lesson_student_att_backfill_v1"},
-			).fetchone()
-			if flag:
-				return
-
-			# LessonStudent'ı olmayan dersler
-			empty_lessons = db.execute(text("""
-				SELECT l.id
-				FROM lessons l
-				WHERE NOT EXISTS (
-					SELECT 1 FROM lesson_students ls WHERE ls.lesson_id = l.id
-				)
-			""")).fetchall()
-			created = 0
-			for (lesson_id,) in empty_lessons:
-				row = db.execute(text("""
-					SELECT student_id
-					FROM attendances
-					WHERE lesson_id = :lid AND student_id IS NOT NULL
-					ORDER BY marked_at DESC
-					LIMIT 1
-				"""), {"lid": lesson_id}).fetchone()
-				if not row:
-					continue
-				student_id = row[0]
-				exists = db.execute(text("""
-					SELECT 1 FROM lesson_students
-					WHERE lesson_id = :lid AND student_id = :sid
-					LIMIT 1
-				"""), {"lid": lesson_id, "sid": student_id}).fetchone()
-				if exists:
-					continue
-				db.execute(text("""
+		run_set_backfill(
+			"lesson_student_att_backfill_v1",
+			"lesson_students yoklama backfill",
+			insert_sql={
+				"postgresql": f"""
 					INSERT INTO lesson_students (lesson_id, student_id, created_at)
-					VALUES (:lid, :sid, CURRENT_TIMESTAMP)
-				"""), {"lid": lesson_id, "sid": student_id})
-				created += 1
-
-			db.execute(text("""
-				INSERT INTO app_meta (key, value) VALUES (:k, :v)
-			"""), {"k": "lesson_student_att_backfill_v1", "v": str(created)})
-			db.commit()
-			print(f"lesson_students yoklama backfill tamamlandi: {created} kayit")
-		except Exception as e:
-			db.rollback()
-			print(f"lesson_students backfill hatasi: {e}")
-		finally:
-			db.close()
+					SELECT DISTINCT ON (a.lesson_id) a.lesson_id, a.student_id, CURRENT_TIMESTAMP
+					{_EMPTY_LESSON_ATTENDANCES}
+					ORDER BY a.lesson_id, a.marked_at DESC NULLS LAST, a.id DESC
+				""",
+				"default": f"""
+					INSERT INTO lesson_students (lesson_id, student_id, created_at)
+					SELECT ranked.lesson_id, ranked.student_id, CURRENT_TIMESTAMP
+					FROM (
+						SELECT a.lesson_id, a.student_id,
+							ROW_NUMBER() OVER (
+								PARTITION BY a.lesson_id
+								ORDER BY a.marked_at DESC, a.id DESC
+							) AS rn
+						{_EMPTY_LESSON_ATTENDANCES}
+					) ranked
+					WHERE ranked.rn = 1
+				""",
+			},
+			count_sql=f"SELECT COUNT(DISTINCT a.lesson_id) {_EMPTY_LESSON_ATTENDANCES}",
+			required_tables=("lessons", "attendances", "lesson_students"),
+		)
+		return True
 	except Exception as e:
 		print(f"lesson_students backfill kontrol hatasi: {e}")
+		return False
 
 
-# Uygulama başlangıcında kolonu kontrol et
-try:
-	ensure_is_active_column()
-except Exception as e:
-	print(f"Baslangic migration kontrolu hatasi: {e}")
-	import traceback
-	traceback.print_exc()
-
-try:
-	ensure_teacher_is_active_column()
-except Exception:
-	pass
-
-try:
-	ensure_attendance_lesson_fk_restrict()
-except Exception as e:
-	pass
-
-try:
-	ensure_lesson_students_backfill_from_attendance()
-except Exception:
-	pass
-
-
-def ensure_expenses_table():
+def ensure_expenses_table() -> bool:
 	"""expenses tablosunun var olduğundan emin ol (Finans / Giderler)."""
 	try:
 		from sqlalchemy import inspect, text
 		inspector = inspect(engine)
 		if "expenses" in set(inspector.get_table_names()):
-			return
+			return True
 		print("expenses tablosu bulunamadi, olusturuluyor...")
 		is_pg = "postgres" in str(engine.url).lower()
 		ddl = """
@@ -318,32 +481,339 @@ def ensure_expenses_table():
 			db.execute(text(ddl))
 			db.commit()
 			print("expenses tablosu olusturuldu")
+			return True
 		except Exception as e:
 			db.rollback()
 			print(f"expenses tablo olusturma: {e}")
+			return False
 		finally:
 			db.close()
 	except Exception as e:
 		print(f"expenses tablo kontrol hatasi: {e}")
+		return False
 
 
-try:
-	ensure_expenses_table()
-except Exception:
-	pass
+def ensure_student_financial_state_table() -> bool:
+	"""
+	student_financial_state tablosunu oluşturur; ilk kurulumda tüm öğrenciler için
+	özet satırlarını bir kez doldurur (app_meta bayrağı ile, tek INSERT ... SELECT).
+	Durum sınıfı crud.classify_payment_status ile aynı kuraldır.
+	"""
+	try:
+		from sqlalchemy import inspect
+		table_names = set(inspect(engine).get_table_names())
+		if "students" not in table_names:
+			print("student_financial_state: kaynak tablolar henuz yok")
+			return False
+		from . import models
+		if "student_financial_state" not in table_names:
+			print("student_financial_state tablosu bulunamadi, olusturuluyor...")
+			Base.metadata.create_all(bind=engine, tables=[models.StudentFinancialState.__table__])
+
+		run_set_backfill(
+			"student_financial_state_v1",
+			"student_financial_state doldurma",
+			insert_sql={
+				"default": """
+					INSERT INTO student_financial_state
+						(student_id, lessons_consumed, packages_paid, last_payment_date, payment_status_class, updated_at)
+					SELECT
+						s.id,
+						COALESCE(ac.n, 0),
+						COALESCE(pc.n, 0),
+						pc.last_date,
+						CASE
+							WHEN COALESCE(pc.n, 0) = 0 THEN 'needs_payment'
+							WHEN COALESCE(ac.n, 0) = 0 THEN 'paid'
+							WHEN COALESCE(ac.n, 0) < COALESCE(pc.n, 0) * 4 THEN
+								CASE WHEN COALESCE(ac.n, 0) % 4 = 3 THEN 'waiting' ELSE 'paid' END
+							ELSE 'needs_payment'
+						END,
+						CURRENT_TIMESTAMP
+					FROM students s
+					LEFT JOIN (
+						SELECT student_id, COUNT(*) AS n
+						FROM attendances
+						WHERE status IN ('PRESENT', 'TELAFI', 'UNEXCUSED_ABSENT')
+						GROUP BY student_id
+					) ac ON ac.student_id = s.id
+					LEFT JOIN (
+						SELECT student_id, COUNT(*) AS n, MAX(payment_date) AS last_date
+						FROM payments
+						GROUP BY student_id
+					) pc ON pc.student_id = s.id
+					WHERE NOT EXISTS (
+						SELECT 1 FROM student_financial_state f WHERE f.student_id = s.id
+					)
+				""",
+			},
+			count_sql="SELECT COUNT(*) FROM students",
+			required_tables=("students", "attendances", "payments", "student_financial_state"),
+		)
+		return True
+	except Exception as e:
+		print(f"student_financial_state kontrol hatasi: {e}")
+		return False
+
+
+_PAYMENT_ALLOCATION_BACKFILL = """
+	INSERT INTO payment_lesson_allocations
+		(student_id, payment_id, package_index, sequence, attendance_id, lesson_date, amount_share)
+	SELECT p.student_id, p.id, p.package_index, slots.seq, a.id, {lesson_date}, {amount_share}
+	FROM (
+		SELECT id, student_id, amount_try,
+			ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY payment_date, id) AS package_index
+		FROM payments
+	) p
+	CROSS JOIN (SELECT 1 AS seq UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4) slots
+	LEFT JOIN (
+		SELECT id, student_id, marked_at,
+			ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY marked_at, id) AS rn
+		FROM attendances
+		WHERE status IN ('PRESENT', 'TELAFI', 'UNEXCUSED_ABSENT')
+	) a ON a.student_id = p.student_id AND a.rn = (p.package_index - 1) * 4 + slots.seq
+	WHERE NOT EXISTS (
+		SELECT 1 FROM payment_lesson_allocations x WHERE x.payment_id = p.id
+	)
+"""
 
-try:
-	ensure_teacher_hourly_rate_column()
-except Exception:
-	pass
 
-try:
-	from .push_notify import ensure_push_subscriptions_table, ensure_vapid_meta_table
+def ensure_payment_lesson_allocations_table() -> bool:
+	"""
+	payment_lesson_allocations (ödeme → ders paket defteri) tablosunu oluşturur ve
+	ilk kurulumda tek INSERT ... SELECT ile doldurur: ödemeler ve sayılan yoklamalar
+	ROW_NUMBER() ile sıralanıp 4'lük slotlara eşlenir (crud._compute_payment_allocation_rows
+	ile aynı kural).
+	"""
+	try:
+		from sqlalchemy import inspect
+		table_names = set(inspect(engine).get_table_names())
+		if "payments" not in table_names:
+			print("payment_lesson_allocations: kaynak tablolar henuz yok")
+			return False
+		from . import models
+		if "payment_lesson_allocations" not in table_names:
+			print("payment_lesson_allocations tablosu bulunamadi, olusturuluyor...")
+			Base.metadata.create_all(bind=engine, tables=[models.PaymentLessonAllocation.__table__])
+
+		run_set_backfill(
+			"payment_lesson_allocations_v1",
+			"payment_lesson_allocations doldurma",
+			insert_sql={
+				"postgresql": _PAYMENT_ALLOCATION_BACKFILL.format(
+					lesson_date="CAST(a.marked_at AS DATE)",
+					amount_share="ROUND(p.amount_try / 4, 4)",
+				),
+				"default": _PAYMENT_ALLOCATION_BACKFILL.format(
+					lesson_date="DATE(a.marked_at)",
+					amount_share="p.amount_try / 4.0",
+				),
+			},
+			count_sql="SELECT COUNT(*) FROM payments",
+			required_tables=("payments", "attendances", "payment_lesson_allocations"),
+		)
+		return True
+	except Exception as e:
+		print(f"payment_lesson_allocations kontrol hatasi: {e}")
+		return False
 
-	ensure_push_subscriptions_table()
-	ensure_vapid_meta_table()
-except Exception:
-	pass
+
+def ensure_finance_daily_rollup_table() -> bool:
+	"""
+	finance_daily_rollup tablosunu oluşturur ve ilk kurulumda ödeme/gider
+	kayıtlarından (gün, yöntem, öğretmen / kategori) gruplarıyla doldurur.
+	"""
+	try:
+		from sqlalchemy import inspect
+		table_names = set(inspect(engine).get_table_names())
+		if "payments" not in table_names or "expenses" not in table_names:
+			print("finance_daily_rollup: kaynak tablolar henuz yok")
+			return False
+		from . import models
+		if "finance_daily_rollup" not in table_names:
+			print("finance_daily_rollup tablosu bulunamadi, olusturuluyor...")
+			Base.metadata.create_all(bind=engine, tables=[models.FinanceDailyRollup.__table__])
+
+		run_set_backfill(
+			"finance_daily_rollup_v1",
+			"finance_daily_rollup doldurma",
+			insert_sql={
+				"default": """
+					INSERT INTO finance_daily_rollup
+						(day, kind, method, teacher_id, category, amount_try, row_count)
+					SELECT p.payment_date, 'payment', p.method, ts.teacher_id, NULL,
+						COALESCE(SUM(p.amount_try), 0), COUNT(p.id)
+					FROM payments p
+					JOIN students s ON s.id = p.student_id
+					LEFT JOIN teacher_students ts ON ts.student_id = p.student_id
+					WHERE NOT EXISTS (SELECT 1 FROM finance_daily_rollup r WHERE r.kind = 'payment')
+					GROUP BY p.payment_date, p.method, ts.teacher_id
+					UNION ALL
+					SELECT e.expense_date, 'expense', e.method, NULL, e.category,
+						COALESCE(SUM(e.amount_try), 0), COUNT(e.id)
+					FROM expenses e
+					WHERE NOT EXISTS (SELECT 1 FROM finance_daily_rollup r WHERE r.kind = 'expense')
+					GROUP BY e.expense_date, e.method, e.category
+				""",
+			},
+			count_sql="SELECT (SELECT COUNT(*) FROM payments) + (SELECT COUNT(*) FROM expenses)",
+			required_tables=("payments", "expenses", "students", "teacher_students", "finance_daily_rollup"),
+		)
+		return True
+	except Exception as e:
+		print(f"finance_daily_rollup kontrol hatasi: {e}")
+		return False
+
+
+def create_index_concurrently(conn, name: str, ddl: str, unique: bool = False) -> bool:
+	"""
+	PostgreSQL'de CREATE INDEX CONCURRENTLY (conn AUTOCOMMIT olmalı); ddl "ON tablo (...)"
+	kısmıdır. Geçerli indeks varsa dokunulmaz; yarıda kalmış (INVALID) indeks silinip
+	yeniden oluşturulur. İndeks oluşturulduysa True.
+	"""
+	from sqlalchemy import text
+	row = conn.execute(text("""
+		SELECT i.indisvalid FROM pg_class c
+		JOIN pg_index i ON i.indexrelid = c.oid
+		WHERE c.relname = :name
+	"""), {"name": name}).fetchone()
+	if row is not None and row[0]:
+		return False
+	if row is not None:
+		conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+	conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name} {ddl}"))
+	return True
+
+
+# Sıcak sorgu yolları için indeksler (models.py'de tanımlı; mevcut veritabanlarına çevrimiçi eklenir)
+HOT_PATH_INDEX_TABLES = (
+	"attendances",
+	"payments",
+	"lessons",
+	"lesson_students",
+	"teacher_students",
+	"expenses",
+	"student_financial_state",
+	"finance_daily_rollup",
+)
+
+
+def ensure_hot_path_indexes() -> bool:
+	"""
+	models.py'de tanımlı indeksleri mevcut tablolara ekler.
+	PostgreSQL'de CREATE INDEX CONCURRENTLY (tabloyu yazmaya kilitlemez; transaction
+	dışında çalışmalı), SQLite'ta CREATE INDEX IF NOT EXISTS kullanılır.
+	Yarıda kalmış (INVALID) CONCURRENTLY indeksi silinip yeniden oluşturulur.
+	"""
+	try:
+		from sqlalchemy import inspect, text
+		from . import models  # noqa: F401 — tablo metadata'sı için
+
+		table_names = set(inspect(engine).get_table_names())
+		is_pg = "postgres" in str(engine.url).lower()
+		created = 0
+		failed = 0
+		with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+			for table_name in HOT_PATH_INDEX_TABLES:
+				table = Base.metadata.tables.get(table_name)
+				if table is None or table_name not in table_names:
+					continue
+				for index in sorted(table.indexes, key=lambda ix: ix.name):
+					columns = ", ".join(col.name for col in index.columns)
+					unique = "UNIQUE " if index.unique else ""
+					try:
+						if is_pg:
+							if not create_index_concurrently(conn, index.name, f"ON {table_name} ({columns})", index.unique):
+								continue
+						else:
+							exists = conn.execute(
+								text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+								{"name": index.name},
+							).fetchone()
+							if exists:
+								continue
+							conn.execute(text(
+								f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON {table_name} ({columns})"
+							))
+						created += 1
+						print(f"indeks olusturuldu: {index.name}")
+					except Exception as e:
+						failed += 1
+						print(f"indeks olusturma hatasi ({index.name}): {e}")
+		if created:
+			print(f"sicak yol indeksleri: {created} yeni indeks")
+		return not failed
+	except Exception as e:
+		print(f"indeks kontrol hatasi: {e}")
+		return False
+
+
+STUDENT_NAME_SEARCH_COLUMNS = ("search_first_token", "search_last_token", "search_full_name")
 
 
+def ensure_student_name_search_columns() -> bool:
+	"""
+	students tablosuna Türkçe katlanmış ad anahtarı kolonlarını ekler, mevcut satırları
+	doldurur ve önek araması için indeksleri kurar. Katlama (I→ı, İ→i) SQL lower() ile
+	yapılamadığından doldurma Python'da, parça parça yapılır. PostgreSQL'de indeksler
+	LIKE 'abc%' için text_pattern_ops ile, SQLite'ta kolonlar NOCASE harmanlamasıyla kurulur.
+	"""
+	try:
+		from sqlalchemy import inspect, text
+		from .name_search import name_search_keys
 
+		try:
+			column_names = {col["name"] for col in inspect(engine).get_columns("students")}
+		except Exception as e:
+			print(f"students tablosu okunamadi: {e}")
+			return False
+		is_pg = "postgres" in str(engine.url).lower()
+		collation = "" if is_pg else " COLLATE NOCASE"
+		with engine.begin() as conn:
+			for column in STUDENT_NAME_SEARCH_COLUMNS:
+				if column not in column_names:
+					conn.execute(text(
+						f"ALTER TABLE students ADD COLUMN {column} VARCHAR(200){collation} NOT NULL DEFAULT ''"
+					))
+					print(f"students.{column} kolonu eklendi")
+
+		updated = 0
+		last_id = 0
+		while True:
+			with engine.begin() as conn:
+				rows = conn.execute(
+					text("SELECT id, first_name, last_name FROM students WHERE id > :last_id ORDER BY id LIMIT 1000"),
+					{"last_id": last_id},
+				).all()
+				if not rows:
+					break
+				conn.execute(
+					text("""
+						UPDATE students
+						SET search_first_token = :first, search_last_token = :last, search_full_name = :full
+						WHERE id = :id
+					"""),
+					[
+						dict(zip(("first", "last", "full"), name_search_keys(first_name, last_name)), id=student_id)
+						for student_id, first_name, last_name in rows
+					],
+				)
+				updated += len(rows)
+				last_id = rows[-1][0]
+		if updated:
+			print(f"students ad arama anahtarlari dolduruldu: {updated} satir")
+
+		ops = " text_pattern_ops" if is_pg else ""
+		with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+			for column, index_name in zip(
+				STUDENT_NAME_SEARCH_COLUMNS,
+				("ix_students_search_first", "ix_students_search_last", "ix_students_search_full"),
+			):
+				if is_pg:
+					create_index_concurrently(conn, index_name, f"ON students ({column}{ops})")
+				else:
+					conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON students ({column})"))
+		return True
+	except Exception as e:
+		print(f"students ad arama kolonlari kontrol hatasi: {e}")
+		return False
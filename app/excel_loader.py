@@ -1,9 +1,24 @@
+"""durum.xlsx öğretmen listelerinin okunması.
+
+Çalışma kitabı openpyxl salt-okunur (akış) kipinde okunur. Ayrıştırılmış veri
+gzip'li JSON olarak diske yazılır (DURUM_CACHE_PATH); önbellek dosyanın mtime/boyutu
+ve SHA-256 özetiyle eşleşir. Böylece her worker dosyayı yeniden ayrıştırmaz: mtime
+aynıysa önbellek doğrudan okunur, dosyaya yalnızca dokunulmuşsa (içerik aynı) özet
+karşılaştırmasıyla yine önbellek kullanılır. Her sayfanın içerik özeti
+(TeacherRoster.content_hash) artımlı senkronizasyonda değişen sayfaları bulmak için
+kullanılır.
+"""
 from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
 from functools import lru_cache
 from pathlib import Path
+import gzip
+import hashlib
+import json
+import logging
+import os
 import re
 import unicodedata
 from typing import Iterable, List, Optional
@@ -13,6 +28,11 @@ from openpyxl import load_workbook
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 EXCEL_PATH = ROOT_DIR / "durum.xlsx"
+CACHE_PATH = Path(os.getenv("DURUM_CACHE_PATH") or ROOT_DIR / ".cache" / "durum.json.gz")
+# Önbellek biçimi değişirse artırılır; eski dosyalar yok sayılır
+CACHE_FORMAT_VERSION = 1
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -28,6 +48,8 @@ class TeacherRoster:
     teacher_display: str
     search_key: str
     rows: List[RosterRow]
+    # Sayfa başlığı ve satırlarının SHA-256 özeti (artımlı senkronizasyon için)
+    content_hash: str = ""
 
 
 @dataclass(frozen=True)
@@ -39,8 +61,8 @@ class DurumDataset:
 def get_durum_dataset() -> DurumDataset:
     if not EXCEL_PATH.exists():
         return DurumDataset(updated_at=None, rosters=[])
-    cache_key = EXCEL_PATH.stat().st_mtime
-    return _load_dataset(cache_key)
+    stat = EXCEL_PATH.stat()
+    return _load_dataset(stat.st_mtime, stat.st_size)
 
 
 def get_roster_for_teacher(name: str | None) -> Optional[TeacherRoster]:
@@ -74,25 +96,117 @@ def _split_tokens(value: str) -> set[str]:
 
 
 @lru_cache(maxsize=1)
-def _load_dataset(cache_key: float) -> DurumDataset:  # pragma: no cover - IO helper
-    wb = load_workbook(EXCEL_PATH, data_only=True)
+def _load_dataset(mtime: float, size: int) -> DurumDataset:  # pragma: no cover - IO helper
+    cached = _read_cache()
+    if cached is not None and cached.get("mtime") == mtime and cached.get("size") == size:
+        return _dataset_from_cache(cached)
+    file_hash = _file_sha256(EXCEL_PATH)
+    if cached is not None and cached.get("sha256") == file_hash:
+        # Dosyaya dokunulmuş ama içerik aynı: ayrıştırma yok, yalnızca anahtar güncellenir
+        dataset = _dataset_from_cache(cached, updated_at=datetime.fromtimestamp(mtime))
+    else:
+        dataset = _parse_workbook(mtime)
+    _write_cache(dataset, mtime=mtime, size=size, file_hash=file_hash)
+    return dataset
+
+
+def _parse_workbook(mtime: float) -> DurumDataset:  # pragma: no cover - IO helper
+    # read_only: satırlar akış olarak okunur, tüm hücreler belleğe alınmaz
+    wb = load_workbook(EXCEL_PATH, read_only=True, data_only=True)
     rosters: list[TeacherRoster] = []
-    for ws in wb.worksheets:
-        rows = list(_iter_rows(ws.iter_rows(values_only=True)))
-        if not rows:
-            continue
-        sheet_title = ws.title.strip()
-        roster = TeacherRoster(
-            sheet_title=sheet_title,
-            teacher_display=_derive_teacher_display(sheet_title),
-            search_key=_normalize_key(sheet_title),
-            rows=rows,
-        )
-        rosters.append(roster)
-    updated_at = datetime.fromtimestamp(cache_key)
+    try:
+        for ws in wb.worksheets:
+            rows = list(_iter_rows(ws.iter_rows(values_only=True)))
+            if not rows:
+                continue
+            sheet_title = ws.title.strip()
+            roster = TeacherRoster(
+                sheet_title=sheet_title,
+                teacher_display=_derive_teacher_display(sheet_title),
+                search_key=_normalize_key(sheet_title),
+                rows=rows,
+                content_hash=roster_content_hash(sheet_title, rows),
+            )
+            rosters.append(roster)
+    finally:
+        wb.close()
+    updated_at = datetime.fromtimestamp(mtime)
     return DurumDataset(updated_at=updated_at, rosters=rosters)
 
 
+def roster_content_hash(sheet_title: str, rows: Iterable[RosterRow]) -> str:
+    payload = json.dumps(
+        [sheet_title, [[row.student, row.guardian, row.phone] for row in rows]],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_cache() -> dict | None:
+    try:
+        with gzip.open(CACHE_PATH, "rt", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("durum.xlsx önbelleği okunamadı, yeniden ayrıştırılacak: %s", e)
+        return None
+    if data.get("format") != CACHE_FORMAT_VERSION:
+        return None
+    return data
+
+
+def _write_cache(dataset: DurumDataset, *, mtime: float, size: int, file_hash: str) -> None:
+    data = {
+        "format": CACHE_FORMAT_VERSION,
+        "mtime": mtime,
+        "size": size,
+        "sha256": file_hash,
+        "rosters": [
+            {
+                "sheet_title": roster.sheet_title,
+                "teacher_display": roster.teacher_display,
+                "search_key": roster.search_key,
+                "content_hash": roster.content_hash,
+                "rows": [[row.student, row.guardian, row.phone] for row in roster.rows],
+            }
+            for roster in dataset.rosters
+        ],
+    }
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # Aynı anda yazan worker'lar birbirinin yarım dosyasını okumasın
+        tmp_path = CACHE_PATH.with_name(f"{CACHE_PATH.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        logger.warning("durum.xlsx önbelleği yazılamadı: %s", e)
+
+
+def _dataset_from_cache(data: dict, updated_at: datetime | None = None) -> DurumDataset:
+    rosters = [
+        TeacherRoster(
+            sheet_title=item["sheet_title"],
+            teacher_display=item["teacher_display"],
+            search_key=item["search_key"],
+            rows=[RosterRow(student=r[0], guardian=r[1], phone=r[2]) for r in item["rows"]],
+            content_hash=item["content_hash"],
+        )
+        for item in data.get("rosters") or []
+    ]
+    return DurumDataset(updated_at=updated_at or datetime.fromtimestamp(data["mtime"]), rosters=rosters)
+
+
 def _iter_rows(rows: Iterable[tuple]) -> Iterable[RosterRow]:
     seen_header = False
     for raw_row in rows:
@@ -152,8 +266,3 @@ def _normalize_key(value: str) -> str:
     normalized = unicodedata.normalize("NFKD", value or "")
     ascii_text = normalized.encode("ascii", "ignore").decode().upper()
     return re.sub(r"[^A-Z0-9]", "", ascii_text)
-
-
-
-
-
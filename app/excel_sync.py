@@ -2,91 +2,363 @@ from __future__ import annotations
 
 import logging
 import re
+from dataclasses import dataclass, field
 from typing import Tuple, Dict
 
+from sqlalchemy import delete, insert, select, text, update
 from sqlalchemy.orm import Session
 
-from . import crud, schemas, excel_loader
+from . import crud, models, excel_loader
+from .name_search import name_search_keys, turkish_casefold
+from .report_cache import DOMAIN_DIRECTORY, DOMAIN_SCHEDULE, bump_data_version
+from .search_index import mark_search_index_stale
 
 logger = logging.getLogger(__name__)
 
+# Excel'den doldurulan öğrenci alanları; mevcut öğrencide yalnızca boş olanlar doldurulur
+STUDENT_FILL_FIELDS = ("parent_name", "parent_phone", "phone_primary")
 
-def sync_students_from_excel(db: Session):
-    dataset = excel_loader.get_durum_dataset()
-    if not dataset.rosters:
-        crud.reset_teacher_student_links(db)
-        return {"students_created": 0, "students_updated": 0, "skipped": 0, "assignments": 0, "teachers_created": 0}
-
-    crud.reset_teacher_student_links(db)
-    stats = {
-        "students_created": 0,
-        "students_updated": 0,
-        "skipped": 0,
-        "assignments": 0,
-        "teachers_created": 0,
-    }
-    teacher_cache: Dict[str, int] = {}
-    assigned_map: Dict[int, int] = {}
+NameKey = Tuple[str, str]
+
+# app_meta: son senkronize edilen sayfa özetleri ("excel_sheet:<sayfa adı>" -> content_hash)
+SHEET_HASH_META_PREFIX = "excel_sheet:"
+
+
+def _name_key(first_name: str | None, last_name: str | None) -> NameKey:
+    """Ad eşleştirme anahtarı: Türkçe kurallarla küçük harf (Işık = IŞIK = ışık)."""
+    return turkish_casefold(first_name), turkish_casefold(last_name)
+
+
+@dataclass
+class RosterSyncPlan:
+    """Excel ile veritabanı arasındaki fark; apply_roster_sync_plan tek transaction'da uygular."""
+
+    teachers_to_create: Dict[NameKey, Tuple[str, str]] = field(default_factory=dict)
+    students_to_create: Dict[NameKey, dict] = field(default_factory=dict)
+    # öğrenci id -> {alan: yeni değer}
+    students_to_update: Dict[int, dict] = field(default_factory=dict)
+    # öğrenci (id ya da yeni öğrenci anahtarı) -> öğretmen (id ya da yeni öğretmen anahtarı)
+    assignments: Dict[int | NameKey, int | NameKey] = field(default_factory=dict)
+    # mevcut bağlantılar: öğrenci id -> (bağlantı id, öğretmen id)
+    current_links: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    skipped: int = 0
+    # Bağlantısı kaldırılabilecek öğretmenler (None = hepsi; artımlı senkronizasyonda değişen sayfalarınki)
+    link_scope: set[int] | None = None
+    # Excel'in herhangi bir sayfasında geçen öğrenciler ve mevcut öğrencilerin ad anahtarları
+    present_students: set = field(default_factory=set)
+    student_keys: Dict[int, NameKey] = field(default_factory=dict)
+    # kullanıcıya gösterilecek adlar
+    student_names: Dict[int, str] = field(default_factory=dict)
+    teacher_names: Dict[int, str] = field(default_factory=dict)
+
+    def link_changes(self) -> tuple[dict, dict, list[int]]:
+        """(eklenecek {öğrenci: öğretmen}, değişecek {bağlantı id: öğretmen}, silinecek öğrenci id'leri)."""
+        added, changed = {}, {}
+        for student_ref, teacher_ref in self.assignments.items():
+            current = self.current_links.get(student_ref) if isinstance(student_ref, int) else None
+            if current is None:
+                added[student_ref] = teacher_ref
+            elif current[1] != teacher_ref:
+                changed[current[0]] = teacher_ref
+        removed = [
+            sid for sid, (_link_id, tid) in self.current_links.items()
+            if sid not in self.assignments
+            and self.student_keys.get(sid) not in self.present_students
+            and (self.link_scope is None or tid in self.link_scope)
+        ]
+        return added, changed, removed
+
+    def stats(self) -> dict:
+        added, changed, removed = self.link_changes()
+        return {
+            "students_created": len(self.students_to_create),
+            "students_updated": len(self.students_to_update),
+            "skipped": self.skipped,
+            "assignments": len(self.assignments),
+            "teachers_created": len(self.teachers_to_create),
+            "links_added": len(added),
+            "links_changed": len(changed),
+            "links_removed": len(removed),
+        }
+
+    def _student_label(self, ref) -> str:
+        if isinstance(ref, int):
+            return self.student_names.get(ref, f"#{ref}")
+        row = self.students_to_create[ref]
+        return f"{row['first_name']} {row['last_name']}"
+
+    def _teacher_label(self, ref) -> str:
+        if isinstance(ref, int):
+            return self.teacher_names.get(ref, f"#{ref}")
+        return " ".join(self.teachers_to_create[ref])
 
+    def diff(self) -> dict:
+        """Yazmadan gösterilebilecek okunur fark (dry-run)."""
+        added, changed, removed = self.link_changes()
+        link_teacher = {link_id: (sid, tid) for sid, (link_id, tid) in self.current_links.items()}
+        return {
+            "teachers_created": [" ".join(name) for name in self.teachers_to_create.values()],
+            "students_created": [
+                {"name": self._student_label(key), **{f: row[f] for f in STUDENT_FILL_FIELDS}}
+                for key, row in self.students_to_create.items()
+            ],
+            "students_updated": [
+                {"id": sid, "name": self._student_label(sid), "changes": changes}
+                for sid, changes in self.students_to_update.items()
+            ],
+            "links_added": [
+                {"student": self._student_label(s), "teacher": self._teacher_label(t)} for s, t in added.items()
+            ],
+            "links_changed": [
+                {
+                    "student": self._student_label(link_teacher[link_id][0]),
+                    "from": self._teacher_label(link_teacher[link_id][1]),
+                    "to": self._teacher_label(t),
+                }
+                for link_id, t in changed.items()
+            ],
+            "links_removed": [
+                {"student": self._student_label(sid), "teacher": self._teacher_label(self.current_links[sid][1])}
+                for sid in removed
+            ],
+        }
+
+
+def _roster_teacher_name(roster_title: str, teacher_display: str | None) -> Tuple[str, str]:
+    teacher_first, teacher_last = _split_person_name(teacher_display or roster_title)
+    return teacher_first or "Öğretmen", teacher_last or "Ekibimiz"
+
+
+def _roster_student_names(roster: excel_loader.TeacherRoster):
+    """(satır, ad, soyad); adı ayrıştırılamayan satırlarda ad None."""
+    for row in roster.rows:
+        first_name, last_name = _split_person_name(row.student)
+        yield row, first_name, last_name
+
+
+def build_roster_sync_plan(
+    db: Session,
+    dataset: excel_loader.DurumDataset,
+    changed_sheets: set[str] | None = None,
+    removed_sheets: set[str] | None = None,
+) -> RosterSyncPlan:
+    """
+    Öğrenci, öğretmen ve bağlantıları birer sorguyla yükler; farkı bellekte hesaplar.
+    changed_sheets verilirse yalnızca bu sayfaların satırları işlenir; bağlantısı
+    kaldırılabilecek öğrenciler de bu (ve removed_sheets) sayfalarının öğretmenleriyle sınırlıdır.
+    """
+    plan = RosterSyncPlan()
+    students: Dict[NameKey, dict] = {}
+    for sid, first_name, last_name, *values in db.execute(
+        select(
+            models.Student.id,
+            models.Student.first_name,
+            models.Student.last_name,
+            *(getattr(models.Student, f) for f in STUDENT_FILL_FIELDS),
+        ).order_by(models.Student.id)
+    ).all():
+        key = _name_key(first_name, last_name)
+        plan.student_names[sid] = f"{first_name} {last_name}"
+        plan.student_keys[sid] = key
+        # Aynı adlı birden fazla kayıtta en eski kayıt eşleşir
+        students.setdefault(key, {"id": sid, **dict(zip(STUDENT_FILL_FIELDS, values))})
+    teachers: Dict[NameKey, int] = {}
+    for tid, first_name, last_name in db.execute(
+        select(models.Teacher.id, models.Teacher.first_name, models.Teacher.last_name).order_by(models.Teacher.id)
+    ).all():
+        plan.teacher_names[tid] = f"{first_name} {last_name}"
+        teachers.setdefault(_name_key(first_name, last_name), tid)
+    for link_id, sid, tid in db.execute(
+        select(models.TeacherStudent.id, models.TeacherStudent.student_id, models.TeacherStudent.teacher_id)
+    ).all():
+        plan.current_links[sid] = (link_id, tid)
+
+    def teacher_ref(first_name: str, last_name: str):
+        key = _name_key(first_name, last_name)
+        ref = teachers.get(key)
+        if ref is None:
+            plan.teachers_to_create.setdefault(key, (first_name, last_name))
+            return key
+        return ref
+
+    # Aynı öğrenci birden fazla sayfadaysa son görülen öğretmen geçerli (tüm sayfalar üzerinden)
+    student_teacher: Dict[NameKey, Tuple[str, str]] = {}
     for roster in dataset.rosters:
-        teacher_first, teacher_last = _split_person_name(roster.teacher_display or roster.sheet_title)
-        if not teacher_first:
-            teacher_first = "Öğretmen"
-        if not teacher_last:
-            teacher_last = "Ekibimiz"
-        teacher_key = f"{teacher_first.lower()}|{teacher_last.lower()}"
-        teacher_id = teacher_cache.get(teacher_key)
-        if teacher_id is None:
-            teacher, created_flag = crud.get_or_create_teacher(db, teacher_first, teacher_last)
-            teacher_id = teacher.id
-            teacher_cache[teacher_key] = teacher_id
-            if created_flag:
-                stats["teachers_created"] += 1
-
-        for row in roster.rows:
-            first_name, last_name = _split_person_name(row.student)
+        teacher_name = _roster_teacher_name(roster.sheet_title, roster.teacher_display)
+        for _row, first_name, last_name in _roster_student_names(roster):
+            if first_name and last_name:
+                student_teacher[_name_key(first_name, last_name)] = teacher_name
+    plan.present_students = set(student_teacher)
+
+    rosters = dataset.rosters
+    if changed_sheets is not None:
+        rosters = [roster for roster in rosters if roster.sheet_title in changed_sheets]
+        scope_names = [_roster_teacher_name(r.sheet_title, r.teacher_display) for r in rosters]
+        scope_names += [
+            _roster_teacher_name(title, excel_loader._derive_teacher_display(title))
+            for title in removed_sheets or ()
+        ]
+        plan.link_scope = {
+            teachers[key] for key in (_name_key(*name) for name in scope_names) if key in teachers
+        }
+
+    for roster in rosters:
+        for row, first_name, last_name in _roster_student_names(roster):
             if not first_name or not last_name:
-                stats["skipped"] += 1
+                plan.skipped += 1
                 continue
-            student = crud.find_student_by_name(db, first_name, last_name)
-            parent_name = row.guardian
-            phone = row.phone
-            if student:
-                changed = False
-                if parent_name and not student.parent_name:
-                    student.parent_name = parent_name
-                    changed = True
-                if phone:
-                    if not student.parent_phone:
-                        student.parent_phone = phone
-                        changed = True
-                    if not student.phone_primary:
-                        student.phone_primary = phone
-                        changed = True
-                if changed:
-                    stats["students_updated"] += 1
+            incoming = {"parent_name": row.guardian, "parent_phone": row.phone, "phone_primary": row.phone}
+            key = _name_key(first_name, last_name)
+            existing = students.get(key)
+            if existing is not None:
+                for name, value in incoming.items():
+                    if value and not existing[name]:
+                        existing[name] = value
+                        plan.students_to_update.setdefault(existing["id"], {})[name] = value
+                student_ref = existing["id"]
             else:
-                payload = schemas.StudentCreate(
-                    first_name=first_name,
-                    last_name=last_name,
-                    parent_name=parent_name,
-                    parent_phone=phone,
-                    phone_primary=phone,
-                )
-                student = crud.create_student(db, payload)
-                stats["students_created"] += 1
-            if student.id in assigned_map:
-                # aynı öğrenciyi ikinci kez görürsek son görülen öğretmeni baz al
-                if assigned_map[student.id] == teacher_id:
-                    continue
-            # Öğretmen öğrenci eşlemesi
-            crud.assign_student_to_teacher(db, teacher_id, student.id)
-            stats["assignments"] += 1
-            assigned_map[student.id] = teacher_id
-
-    db.commit()
-
-    if stats["students_created"] or stats["students_updated"] or stats["assignments"]:
+                new_row = plan.students_to_create.get(key)
+                if new_row is None:
+                    plan.students_to_create[key] = {"first_name": first_name, "last_name": last_name, **incoming}
+                else:
+                    # Aynı yeni öğrenci tekrar görüldü: boş kalan alanları tamamla
+                    for name, value in incoming.items():
+                        if value and not new_row[name]:
+                            new_row[name] = value
+                student_ref = key
+            plan.assignments[student_ref] = teacher_ref(*student_teacher[key])
+    return plan
+
+
+def apply_roster_sync_plan(db: Session, plan: RosterSyncPlan) -> None:
+    """Planı toplu INSERT / UPDATE / DELETE ifadeleriyle tek transaction'da uygular."""
+    teacher_ids: Dict[NameKey, int] = {}
+    if plan.teachers_to_create:
+        keys = list(plan.teachers_to_create)
+        ids = db.scalars(
+            insert(models.Teacher).returning(models.Teacher.id, sort_by_parameter_order=True),
+            [{"first_name": first, "last_name": last} for first, last in plan.teachers_to_create.values()],
+        ).all()
+        teacher_ids = dict(zip(keys, ids))
+
+    student_ids: Dict[NameKey, int] = {}
+    if plan.students_to_create:
+        keys = list(plan.students_to_create)
+        rows = []
+        for row in plan.students_to_create.values():
+            # Toplu insert ORM olaylarını çalıştırmaz; arama anahtarları burada doldurulur
+            first_token, last_token, full_name = name_search_keys(row["first_name"], row["last_name"])
+            rows.append({
+                **row,
+                "search_first_token": first_token,
+                "search_last_token": last_token,
+                "search_full_name": full_name,
+            })
+        ids = db.scalars(
+            insert(models.Student).returning(models.Student.id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+        student_ids = dict(zip(keys, ids))
+
+    if plan.students_to_update:
+        # Tüm satırlar aynı kolonları taşımalı (executemany); değişmeyen alanlar mevcut değeriyle yazılır
+        current = {
+            sid: dict(zip(STUDENT_FILL_FIELDS, values))
+            for sid, *values in db.execute(
+                select(models.Student.id, *(getattr(models.Student, f) for f in STUDENT_FILL_FIELDS))
+                .where(models.Student.id.in_(list(plan.students_to_update)))
+            ).all()
+        }
+        db.execute(
+            update(models.Student),
+            [{"id": sid, **current[sid], **changes} for sid, changes in plan.students_to_update.items() if sid in current],
+        )
+
+    def resolve_student(ref):
+        return ref if isinstance(ref, int) else student_ids[ref]
+
+    def resolve_teacher(ref):
+        return ref if isinstance(ref, int) else teacher_ids[ref]
+
+    added, changed, removed = plan.link_changes()
+    if removed:
+        db.execute(delete(models.TeacherStudent).where(models.TeacherStudent.student_id.in_(removed)))
+    if changed:
+        db.execute(
+            update(models.TeacherStudent),
+            [{"id": link_id, "teacher_id": resolve_teacher(ref)} for link_id, ref in changed.items()],
+        )
+    if added:
+        db.execute(
+            insert(models.TeacherStudent),
+            [{"student_id": resolve_student(s), "teacher_id": resolve_teacher(t)} for s, t in added.items()],
+        )
+
+    if added or changed or removed or plan.students_to_create:
+        # Öğretmen dağılımı değişti; rollup tek seferde yeniden kurulur
+        crud.rebuild_finance_daily_rollup(db, commit=False)
+        bump_data_version(db, DOMAIN_SCHEDULE)
+    if plan.students_to_create or plan.students_to_update or plan.teachers_to_create:
+        bump_data_version(db, DOMAIN_DIRECTORY)
+
+
+def synced_sheet_hashes(db: Session) -> Dict[str, str]:
+    """Son başarılı senkronizasyondaki sayfa adı -> içerik özeti."""
+    rows = db.execute(
+        text("SELECT key, value FROM app_meta WHERE key LIKE :prefix"),
+        {"prefix": f"{SHEET_HASH_META_PREFIX}%"},
+    ).all()
+    return {key[len(SHEET_HASH_META_PREFIX):]: value for key, value in rows}
+
+
+def _store_sheet_hashes(db: Session, dataset: excel_loader.DurumDataset) -> None:
+    db.execute(text("DELETE FROM app_meta WHERE key LIKE :prefix"), {"prefix": f"{SHEET_HASH_META_PREFIX}%"})
+    rows = [
+        {"k": f"{SHEET_HASH_META_PREFIX}{roster.sheet_title}", "v": roster.content_hash}
+        for roster in dataset.rosters
+        if roster.content_hash
+    ]
+    if rows:
+        db.execute(text("INSERT INTO app_meta (key, value) VALUES (:k, :v)"), rows)
+
+
+def sync_students_from_excel(db: Session, dry_run: bool = False, incremental: bool = False):
+    """
+    durum.xlsx öğrenci listelerini veritabanıyla eşitler: yeni öğrenci/öğretmen ekler,
+    mevcut öğrencilerin boş veli/telefon alanlarını doldurur, öğretmen bağlantılarını
+    Excel'deki dağılıma getirir (Excel'de olmayan öğrencilerin bağlantısı kaldırılır).
+    dry_run=True: hiçbir şey yazılmaz; sayılar ve "diff" döner.
+    incremental=True: yalnızca son senkronizasyondan beri içeriği değişen (ya da silinen)
+    sayfalar işlenir; hiçbir sayfa değişmediyse veritabanına yazılmaz.
+    """
+    dataset = excel_loader.get_durum_dataset()
+    changed_sheets = removed_sheets = None
+    if incremental:
+        previous = synced_sheet_hashes(db)
+        current = {roster.sheet_title: roster.content_hash for roster in dataset.rosters}
+        changed_sheets = {title for title, digest in current.items() if previous.get(title) != digest}
+        removed_sheets = set(previous) - set(current)
+    plan = build_roster_sync_plan(db, dataset, changed_sheets, removed_sheets)
+    stats = plan.stats()
+    if changed_sheets is not None:
+        stats["changed_sheets"] = sorted(changed_sheets | removed_sheets)
+    if dry_run:
+        db.rollback()
+        return {**stats, "dry_run": True, "diff": plan.diff()}
+    if changed_sheets is not None and not stats["changed_sheets"]:
+        db.rollback()
+        return {**stats, "dry_run": False}
+
+    try:
+        apply_roster_sync_plan(db, plan)
+        _store_sheet_hashes(db, dataset)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    mark_search_index_stale()
+
+    if stats["students_created"] or stats["students_updated"] or stats["links_added"] or stats["links_changed"]:
         logger.info(
             "Durum.xlsx senkronizasyonu tamamlandı: %s yeni öğrenci, %s güncelleme, %s atama, %s yeni öğretmen",
             stats["students_created"],
@@ -95,7 +367,7 @@ def sync_students_from_excel(db: Session):
             stats["teachers_created"],
         )
 
-    return stats
+    return {**stats, "dry_run": False}
 
 
 def _split_person_name(full_name: str | None) -> Tuple[str | None, str | None]:
@@ -0,0 +1,84 @@
+"""Derlenmiş HTML parçaları (fragment) için süreç içi önbellek.
+
+Parçalar zlib ile sıkıştırılarak saklanır; toplam sıkıştırılmış boyut
+FRAGMENT_CACHE_MAX_BYTES ile sınırlıdır ve sınır aşılınca en eski kullanılan
+parça (LRU) atılır. Anahtar, parçanın bağlı olduğu veri sürümünü içermelidir;
+önbellek kendisi geçersiz kılma yapmaz.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+
+class FragmentCache:
+	"""İş parçacığı güvenli, bayt sınırlı, sıkıştırılmış LRU önbellek."""
+
+	def __init__(self, max_bytes: int = FRAGMENT_CACHE_MAX_BYTES):
+		self.max_bytes = max(0, int(max_bytes))
+		self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key: Hashable) -> str | None:
+		with self._lock:
+			blob = self._data.get(key)
+			if blob is None:
+				self.misses += 1
+				return None
+			self._data.move_to_end(key)
+			self.hits += 1
+		return zlib.decompress(blob).decode("utf-8")
+
+	def put(self, key: Hashable, html: str) -> None:
+		blob = zlib.compress(html.encode("utf-8"), 6)
+		if len(blob) > self.max_bytes:
+			return
+		with self._lock:
+			previous = self._data.pop(key, None)
+			if previous is not None:
+				self._bytes -= len(previous)
+			self._data[key] = blob
+			self._bytes += len(blob)
+			while self._bytes > self.max_bytes:
+				_, evicted = self._data.popitem(last=False)
+				self._bytes -= len(evicted)
+				self.evictions += 1
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+			self._bytes = 0
+
+	def stats(self) -> dict:
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				"fragments": len(self._data),
+				"bytes": self._bytes,
+				"max_bytes": self.max_bytes,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+			}
+
+
+fragment_cache = FragmentCache()
+
+
+def cached_fragment(key: Hashable, render: Callable[[], str]) -> str:
+	"""Anahtar için saklanan HTML'i döner; yoksa render() çalıştırılır ve saklanır."""
+	html = fragment_cache.get(key)
+	if html is None:
+		html = render()
+		fragment_cache.put(key, html)
+	return html
@@ -2,15 +2,37 @@ from fastapi import FastAPI, Depends, HTTPException, Request, Form, status
 from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
 from fastapi import Response
 from fastapi.templating import Jinja2Templates
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import func, select
+from markupsafe import Markup
 import os
 
 from .db import Base, engine, get_db
 from . import crud, schemas, models
+from .schedule import WEEKDAY_NAMES, get_schedule_snapshot
+from .fragment_cache import cached_fragment, fragment_cache
+from .search_index import (
+    KIND_COURSE,
+    KIND_STUDENT,
+    KIND_TEACHER,
+    mark_search_index_stale,
+    search_directory,
+    search_index_stats,
+)
+from .report_cache import (
+    bump_data_version,
+    cached_report,
+    cache_stats,
+    DOMAIN_ATTENDANCE,
+    DOMAIN_DIRECTORY,
+    DOMAIN_EXPENSES,
+    DOMAIN_PAYMENTS,
+    DOMAIN_SCHEDULE,
+)
 try:
 	from . import push_notify
 except ImportError:
@@ -65,6 +87,18 @@ def attendance_new_url(lesson_id: int, return_to: str | None = None, **query) ->
     return f"/lessons/{lesson_id}/attendance/new" + (f"?{qs}" if qs else "")
 
 
+def duplicate_attendance_student_names(db: Session, error: crud.AttendanceDuplicateError) -> dict[int, str]:
+    """Yoklaması zaten olan öğrencilerin adları (öğrenci id -> ad); tek sorgu."""
+    student_ids = {student_id for _, student_id, _ in error.duplicates}
+    return {
+        sid: f"{first_name} {last_name}"
+        for sid, first_name, last_name in db.execute(
+            select(models.Student.id, models.Student.first_name, models.Student.last_name)
+            .where(models.Student.id.in_(student_ids))
+        ).all()
+    }
+
+
 def calculate_next_lesson_date(original_date):
     """
     Haftalık tekrarlanan dersler için bugünden sonraki ilgili günü hesaplar.
@@ -100,74 +134,17 @@ def filter_students_by_passive_flag(students, show_passive_students: bool):
 	return [s for s in students if getattr(s, "is_active", True)]
 
 
-WEEKDAY_NAMES = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cumartesi", "Pazar"]
-
-
-def dedupe_daily_students_in_schedule(entries: list[dict]) -> list[dict]:
-    """
-    Aynı öğrenci aynı gün birden fazla ders slotunda görünüyorsa tek slotta bırakır.
-    Öncelik: daha geç başlangıç saati, saat eşitse daha yeni lesson id.
-    """
-    chosen: dict[tuple[str, int], dict] = {}
-    for entry in entries:
-        lesson = entry.get("lesson")
-        weekday = entry.get("weekday", "")
-        students = entry.get("students") or []
-        start_time = getattr(lesson, "start_time", None)
-        lesson_id = getattr(lesson, "id", 0) or 0
-        start_sort = (start_time.hour, start_time.minute) if start_time else (-1, -1)
-        for s in students:
-            key = (weekday, getattr(s, "id", 0))
-            prev = chosen.get(key)
-            if not prev:
-                chosen[key] = {"entry": entry, "start_sort": start_sort, "lesson_id": lesson_id}
-                continue
-            if start_sort > prev["start_sort"] or (start_sort == prev["start_sort"] and lesson_id > prev["lesson_id"]):
-                chosen[key] = {"entry": entry, "start_sort": start_sort, "lesson_id": lesson_id}
-
-    filtered_entries: list[dict] = []
-    for entry in entries:
-        weekday = entry.get("weekday", "")
-        kept_students = []
-        for s in entry.get("students") or []:
-            key = (weekday, getattr(s, "id", 0))
-            if chosen.get(key, {}).get("entry") is entry:
-                kept_students.append(s)
-        if kept_students:
-            new_entry = dict(entry)
-            new_entry["students"] = kept_students
-            filtered_entries.append(new_entry)
-    return filtered_entries
-
-
-def format_lessons_for_schedule(entries: list[dict]) -> list[dict]:
-    formatted_lessons = []
-    for entry in entries:
-        lesson = entry["lesson"]
-        students_for_view = filter_students_by_passive_flag(entry["students"], False)
-        if not students_for_view:
-            continue
-        weekday = WEEKDAY_NAMES[lesson.lesson_date.weekday()] if hasattr(lesson.lesson_date, "weekday") else ""
-        current_lesson_date = calculate_next_lesson_date(lesson.lesson_date)
-        formatted_lessons.append({
-            "weekday": weekday,
-            "lesson": lesson,
-            "current_lesson_date": current_lesson_date,
-            "students": students_for_view,
-        })
-    return dedupe_daily_students_in_schedule(formatted_lessons)
-
-
 def build_teachers_schedules(db: Session, teachers: list) -> list[dict]:
-    lessons_by_teacher = crud.lessons_with_students_by_teacher_ids(db, [teacher.id for teacher in teachers])
-    teachers_schedules = []
-    for teacher in teachers:
-        formatted_lessons = format_lessons_for_schedule(lessons_by_teacher.get(teacher.id, []))
-        teachers_schedules.append({
+    # Süreç içi program görüntüsü; yalnızca ders programı sürümü değişince yeniden kurulur
+    snapshot = get_schedule_snapshot(db)
+    return [
+        {
             "teacher": teacher,
-            "lessons": formatted_lessons,
-        })
-    return teachers_schedules
+            "lessons": snapshot.schedule.entries_for(teacher.id),
+            "fragment_key": snapshot.key,
+        }
+        for teacher in teachers
+    ]
 
 
 # Alt klasör desteği için root_path (eğer /piarte altında çalışıyorsa)
@@ -179,33 +156,25 @@ app = FastAPI(title="Piarte Kurs Yönetimi", root_path=ROOT_PATH)
 # Uygulama başlangıcında migration kontrolü
 @app.on_event("startup")
 async def startup_event():
-	"""Uygulama başlangıcında hafif migration kontrolü"""
+	"""Uygulama başlangıcında sürümlü migration kontrolü (güncelse tek sorgu)"""
 	import logging
 	try:
-		from app.db import (
-			ensure_is_active_column,
-			ensure_teacher_is_active_column,
-			ensure_teacher_hourly_rate_column,
-			ensure_lesson_students_backfill_from_attendance,
-			ensure_expenses_table,
-			engine,
-			Base,
-		)
-		ensure_is_active_column()
-		ensure_teacher_is_active_column()
-		ensure_teacher_hourly_rate_column()
-		ensure_lesson_students_backfill_from_attendance()
-		ensure_expenses_table()
-		# Yeni Expense tablosu için metadata create (mevcut tablolara dokunmaz)
-		Base.metadata.create_all(bind=engine, tables=[models.Expense.__table__])
+		from app.migrations import run_migrations
+		from app.search_db import ensure_search_backend
+		run_migrations()
+		ensure_search_backend()
 		if push_notify:
-			push_notify.ensure_push_subscriptions_table()
-			push_notify.ensure_vapid_meta_table()
 			push_notify.get_vapid_keys()
-			Base.metadata.create_all(bind=engine, tables=[models.PushSubscription.__table__])
+			push_notify.start_push_sender()
 	except Exception as e:
 		logging.error(f"Startup migration hatasi: {e}")
 
+
+@app.on_event("shutdown")
+def shutdown_event():
+	if push_notify:
+		push_notify.stop_push_sender()
+
 # CORS ayarları - iframe ve farklı domain'den erişim için
 app.add_middleware(
     CORSMiddleware,
@@ -232,6 +201,28 @@ except ImportError:
 	pass
 templates = Jinja2Templates(directory="templates")
 
+
+def render_schedule_grid(schedule: dict, variant: str, actions: bool = False) -> Markup:
+    """
+    Tek öğretmenin program tablosu (_schedule_grid.html). (öğretmen, program sürümü,
+    görünüm, actions) başına sıkıştırılmış HTML parçası olarak önbellekten gelir.
+    """
+    actions = bool(actions)
+
+    def render() -> str:
+        return templates.get_template("_schedule_grid.html").render(
+            schedule=schedule, variant=variant, actions=actions
+        )
+
+    fragment_key = schedule.get("fragment_key")
+    if fragment_key is None:
+        return Markup(render())
+    key = ("schedule_grid", schedule["teacher"].id, fragment_key, variant, actions)
+    return Markup(cached_fragment(key, render))
+
+
+templates.env.globals["schedule_grid"] = render_schedule_grid
+
 # Static files için - logo ve diğer statik dosyalar (proje root dizini)
 # Logo dosyası root dizininde olduğu için root'u mount ediyoruz
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -388,6 +379,19 @@ def api_push_status(request: Request, db: Session = Depends(get_db)):
         "subscriptions": push_notify.count_admin_subscriptions(db),
         "vapid_sub": claims.get("sub"),
         "has_vapid": bool(push_notify.get_vapid_public_key()),
+        "outbox": push_notify.push_outbox_stats(db),
+    }
+
+
+@app.get("/api/report-cache/stats")
+def api_report_cache_stats(request: Request):
+    """Admin: rapor, HTML parça önbelleği ve arama dizini sayaçları (bu worker süreci için)."""
+    require_admin(request)
+    return {
+        "ok": True,
+        **cache_stats(),
+        "fragments": fragment_cache.stats(),
+        "search_index": search_index_stats(),
     }
 
 
@@ -958,11 +962,10 @@ def dashboard(
         student_name is not None and student_name.strip(),
     ])
     
-    # Eğer hiçbir filtre yoksa, boş liste döndür
-    if not has_filters:
-        attendances = []
-    else:
-        attendances = crud.list_all_attendances(
+    # Eğer hiçbir filtre yoksa, boş liste döndür; varsa ilk sayfa (sonrakiler /api/attendances ile)
+    attendance_page = {"items": [], "next_cursor": None}
+    if has_filters:
+        attendance_page = crud.list_attendance_page(
             db,
             teacher_id=teacher_id_int,
             student_id=student_id_int,
@@ -970,43 +973,10 @@ def dashboard(
             status=status,
             start_date=start_date_obj,
             end_date=end_date_obj,
+            student_name=student_name if not student_id_int else None,
             order_by=order_by,
-            limit=200,
         )
-        if student_name and student_name.strip() and not student_id_int:
-            filtered = []
-            for a in attendances:
-                stu = db.get(models.Student, a.student_id)
-                if not stu:
-                    continue
-                full_name = f"{stu.first_name} {stu.last_name}"
-                if crud.student_name_matches_prefix(full_name, student_name):
-                    filtered.append(a)
-            attendances = filtered
-    
-    # Yoklamaları ders ve öğrenci bilgileriyle birlikte hazırla
-    attendances_with_details = []
-    if attendances:
-        lesson_ids = {att.lesson_id for att in attendances}
-        student_ids = {att.student_id for att in attendances}
-        lessons_map = {l.id: l for l in db.scalars(select(models.Lesson).where(models.Lesson.id.in_(lesson_ids))).all()} if lesson_ids else {}
-        students_map = {s.id: s for s in db.scalars(select(models.Student).where(models.Student.id.in_(student_ids))).all()} if student_ids else {}
-        teacher_ids = {l.teacher_id for l in lessons_map.values() if l.teacher_id}
-        course_ids = {l.course_id for l in lessons_map.values() if l.course_id}
-        teachers_map = {t.id: t for t in db.scalars(select(models.Teacher).where(models.Teacher.id.in_(teacher_ids))).all()} if teacher_ids else {}
-        courses_map = {c.id: c for c in db.scalars(select(models.Course).where(models.Course.id.in_(course_ids))).all()} if course_ids else {}
-        for att in attendances:
-            lesson = lessons_map.get(att.lesson_id)
-            student = students_map.get(att.student_id)
-            teacher = teachers_map.get(lesson.teacher_id) if lesson and lesson.teacher_id else None
-            course = courses_map.get(lesson.course_id) if lesson and lesson.course_id else None
-            attendances_with_details.append({
-                "attendance": att,
-                "lesson": lesson,
-                "student": student,
-                "teacher": teacher,
-                "course": course,
-            })
+    attendances_with_details = attendance_page["items"]
     # Puantaj / öğretmen özeti (filtre uygulandığında)
     attendance_report = []
     attendance_totals_by_teacher = {}
@@ -1071,6 +1041,18 @@ def dashboard(
         "active_students_count": active_students_count,
         "passive_students_count": passive_students_count,
         "attendances": attendances_with_details,
+        "attendance_next_cursor": attendance_page["next_cursor"],
+        "attendance_scroll_url": attendance_scroll_url(
+            "dashboard",
+            teacher_id=teacher_id_int,
+            student_id=student_id_int,
+            course_id=course_id_int,
+            status=status,
+            start_date=start_date,
+            end_date=end_date,
+            student_name=student_name if not student_id_int else None,
+            order_by=order_by,
+        ),
         "attendance_report": attendance_report,
         "attendance_totals_by_teacher": attendance_totals_by_teacher,
         "attendance_teacher_summary": attendance_teacher_summary,
@@ -1371,15 +1353,9 @@ def quick_search(request: Request, q: str, db: Session = Depends(get_db)):
     if user.get("role") == "teacher":
         return RedirectResponse(url="/ui/teacher", status_code=302)
 
-    term = f"%{q.strip()}%"
-    students = db.query(models.Student).filter(
-        (models.Student.first_name.ilike(term)) | (models.Student.last_name.ilike(term))
-    ).limit(20).all()
-    teachers = db.query(models.Teacher).filter(
-        models.Teacher.is_active == True,
-        (models.Teacher.first_name.ilike(term)) | (models.Teacher.last_name.ilike(term))
-    ).limit(20).all()
-    courses = db.query(models.Course).filter(models.Course.name.ilike(term)).limit(20).all()
+    students = search_directory(db, q, KIND_STUDENT, limit=20)
+    teachers = search_directory(db, q, KIND_TEACHER, limit=20)
+    courses = search_directory(db, q, KIND_COURSE, limit=20)
 
     if user.get("role") == "admin" and len(students) == 1 and not teachers and not courses:
         from urllib.parse import urlencode
@@ -1522,9 +1498,6 @@ def teacher_panel(request: Request, selected_teacher_id: int | None = None, star
         # Tüm öğretmenleri getir
         all_teachers = crud.list_teachers(db)
         
-        # Seçilen öğretmenin derslerini getir
-        lessons_with_students = crud.lessons_with_students_by_teacher(db, display_teacher_id)
-        formatted_lessons = format_lessons_for_schedule(lessons_with_students)
         # Öğretmene atanmış öğrencileri getir
         teacher_students = []
         if current_teacher_id:
@@ -1553,6 +1526,11 @@ def teacher_panel(request: Request, selected_teacher_id: int | None = None, star
         
         # Tüm öğretmenler için haftalık ders programını hazırla (saat bazlı grid için)
         teachers_schedules = build_teachers_schedules(db, all_teachers)
+        # Seçilen öğretmenin dersleri (aynı program yapısından)
+        formatted_lessons = next(
+            (item["lessons"] for item in teachers_schedules if item["teacher"].id == display_teacher_id),
+            [],
+        )
         
         # Puantaj raporunu hesapla (sadece kendi öğretmeni için)
         attendance_report = []
@@ -1827,9 +1805,10 @@ def payment_create(
         method=method,
         note=note,
     )
-    payment = crud.create_payment(db, payload)
-    # Nakit / IBAN tahsilat → admin mobil bildirimi (başarısız olsa ödeme yine kayıtlı kalır)
-    if push_notify and push_notify.is_notifiable_payment_method(method):
+    payment = crud.create_payment(db, payload, commit=False)
+    # Nakit / IBAN tahsilat → admin mobil bildirimi; outbox satırları ödemeyle aynı transaction'da yazılır
+    notify = bool(push_notify and push_notify.is_notifiable_payment_method(method))
+    if notify:
         student = crud.get_student(db, student_id)
         student_name = (
             f"{student.first_name} {student.last_name}".strip()
@@ -1842,13 +1821,17 @@ def payment_create(
             actor_label = actor_name
         else:
             actor_label = f"{actor_name} ({role})"
-        push_notify.schedule_admin_cash_notify(
+        push_notify.enqueue_admin_cash_notify(
+            db,
             student_name=student_name,
             amount_try=float(amount_try),
             staff_name=actor_label,
             payment_id=getattr(payment, "id", None),
             method=method,
         )
+    db.commit()
+    if notify:
+        push_notify.wake_push_sender()
     set_flash_success(request, "Ödeme başarıyla kaydedildi.")
     return RedirectResponse(url=safe_return_url(return_to, default_panel_url(user)), status_code=302)
 
@@ -2038,6 +2021,7 @@ def lesson_create(
                 from datetime import timedelta
                 delta = requested_day - actual_day
                 lesson.lesson_date = lesson.lesson_date + timedelta(days=delta)
+                bump_data_version(db, DOMAIN_SCHEDULE)
                 db.commit()
                 db.refresh(lesson)
         except Exception:
@@ -2106,9 +2090,10 @@ def attendance_form(
     attendance_map = {att.student_id: att.status for att in existing_attendances}
     
     # Her öğrenci için ödeme durumunu ve mevcut yoklama durumunu kontrol et
+    payment_needed = crud.check_students_payment_status(db, [student.id for student in students])
     students_with_payment_status = []
     for student in students:
-        needs_payment = crud.check_student_payment_status(db, student.id)
+        needs_payment = payment_needed.get(student.id, True)
         current_status = attendance_map.get(student.id, "")
         students_with_payment_status.append({
             "student": student,
@@ -2141,70 +2126,10 @@ def attendance_form(
         error_message = request.session.get("attendance_errors", "Lütfen en az bir öğrenci için durum seçin.")
         request.session.pop("attendance_errors", None)
     
-    # Öğretmen için o gün alınan yoklamaları getir
+    # Öğretmen için o gün alınan yoklamaların ders bazlı özeti (tek sorgu)
     today_attendances_summary = None
     if user.get("role") == "teacher" and lesson.teacher_id == user.get("teacher_id"):
-        from sqlalchemy import func
-        from datetime import datetime
-        today = date_cls.today()
-        today_start = datetime.combine(today, datetime.min.time())
-        today_end = datetime.combine(today, datetime.max.time())
-        
-        # Öğretmenin bugün aldığı tüm yoklamaları getir
-        today_attendances = db.scalars(
-            select(models.Attendance)
-            .join(models.Lesson)
-            .where(
-                models.Lesson.teacher_id == user.get("teacher_id"),
-                models.Attendance.marked_at >= today_start,
-                models.Attendance.marked_at <= today_end
-            )
-            .order_by(models.Attendance.marked_at.desc())
-        ).all()
-        
-        # Özet bilgileri hazırla
-        if today_attendances:
-            summary_by_lesson = {}
-            for att in today_attendances:
-                lesson_obj = db.get(models.Lesson, att.lesson_id)
-                if not lesson_obj:
-                    continue
-                
-                lesson_key = f"{lesson_obj.id}_{lesson_obj.course.name if lesson_obj.course else 'Bilinmeyen'}"
-                if lesson_key not in summary_by_lesson:
-                    summary_by_lesson[lesson_key] = {
-                        "lesson_id": lesson_obj.id,
-                        "course_name": lesson_obj.course.name if lesson_obj.course else "Bilinmeyen",
-                        "lesson_time": lesson_obj.start_time.strftime("%H:%M") if lesson_obj.start_time else "",
-                        "attendances": [],
-                        "counts": {
-                            "PRESENT": 0,
-                            "EXCUSED_ABSENT": 0,
-                            "TELAFI": 0,
-                            "UNEXCUSED_ABSENT": 0,
-                            "LATE": 0  # Eski kayıtlar için
-                        }
-                    }
-                
-                student = db.get(models.Student, att.student_id)
-                if student:
-                    status = att.status
-                    # Eski LATE ve ABSENT değerlerini normalize et
-                    if status == "LATE":
-                        status = "TELAFI"
-                    elif status == "ABSENT":
-                        status = "UNEXCUSED_ABSENT"
-                    
-                    summary_by_lesson[lesson_key]["attendances"].append({
-                        "student_name": f"{student.first_name} {student.last_name}",
-                        "status": status,
-                        "marked_at": att.marked_at.strftime("%H:%M") if att.marked_at else ""
-                    })
-                    
-                    if status in summary_by_lesson[lesson_key]["counts"]:
-                        summary_by_lesson[lesson_key]["counts"][status] += 1
-            
-            today_attendances_summary = list(summary_by_lesson.values())
+        today_attendances_summary = crud.build_teacher_day_attendance_summary(db, user.get("teacher_id")) or None
 
     resolved_return_to = safe_return_url(return_to, default_panel_url(user))
 
@@ -2224,6 +2149,107 @@ def attendance_form(
     )
 
 
+@app.get("/api/teacher/attendance/today")
+def api_teacher_attendance_today(request: Request, db: Session = Depends(get_db)):
+    """Öğretmen: bugün alınan yoklamaların ders bazlı özeti (formu yenilemeden güncellemek için)."""
+    user = request.session.get("user")
+    if not user or user.get("role") != "teacher" or not user.get("teacher_id"):
+        raise HTTPException(status_code=403, detail="Yalnızca öğretmenler")
+    from datetime import date as date_cls
+    today = date_cls.today()
+    return {
+        "date": today.isoformat(),
+        "lessons": crud.build_teacher_day_attendance_summary(db, user.get("teacher_id"), today),
+    }
+
+
+ATTENDANCE_ROW_TEMPLATES = {
+    "dashboard": "_attendance_dashboard_rows.html",
+    "student": "_attendance_student_rows.html",
+}
+
+
+def attendance_scroll_url(view: str, **filters) -> str:
+    """Sonsuz kaydırmanın sonraki sayfaları isteyeceği /api/attendances adresi (imleç hariç)."""
+    from urllib.parse import urlencode
+    params = {"view": view}
+    params.update({key: value for key, value in filters.items() if value not in (None, "")})
+    return f"/api/attendances?{urlencode(params)}"
+
+
+@app.get("/api/attendances")
+def api_attendances(
+    request: Request,
+    db: Session = Depends(get_db),
+    teacher_id: int | None = None,
+    student_id: int | None = None,
+    course_id: int | None = None,
+    status: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    student_name: str | None = None,
+    order_by: str = "marked_at_desc",
+    cursor: str | None = None,
+    limit: int = crud.ATTENDANCE_PAGE_SIZE,
+    view: str | None = None,
+):
+    """
+    Yoklamalar; (marked_at, id) imleciyle sayfalı, ders/kurs/öğretmen/öğrenci bilgisi hazır.
+    view verilirse ('dashboard' | 'student') satırlar ilgili şablonla da çizilir
+    (rows_html / cards_html); sayfalar bu alanlarla sonsuz kaydırmada eklenir.
+    """
+    user = request.session.get("user")
+    if not user:
+        raise HTTPException(status_code=401, detail="Giriş gerekli")
+    if user.get("role") == "teacher":
+        raise HTTPException(status_code=403, detail="Yetki yok")
+    from datetime import date as date_cls
+    try:
+        start_date_obj = date_cls.fromisoformat(start_date) if start_date else None
+        end_date_obj = date_cls.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz tarih")
+
+    page = crud.list_attendance_page(
+        db,
+        teacher_id=teacher_id,
+        student_id=student_id,
+        course_id=course_id,
+        status=status,
+        start_date=start_date_obj,
+        end_date=end_date_obj,
+        student_name=student_name if not student_id else None,
+        order_by=order_by,
+        cursor=cursor,
+        limit=limit,
+    )
+    result = {
+        "ok": True,
+        "items": jsonable_encoder(page["items"]),
+        "next_cursor": page["next_cursor"],
+    }
+    template_name = ATTENDANCE_ROW_TEMPLATES.get((view or "").strip())
+    if template_name:
+        template = templates.env.get_template(template_name)
+        context = {
+            "request": request,
+            "attendances": page["items"],
+            # Dashboard'daki "Sil" formu dönüşte filtreleri korur
+            "filters": {
+                "teacher_id": str(teacher_id) if teacher_id else "",
+                "student_id": str(student_id) if student_id else "",
+                "course_id": str(course_id) if course_id else "",
+                "status": status or "",
+                "start_date": start_date or "",
+                "end_date": end_date or "",
+                "order_by": order_by,
+            },
+        }
+        result["rows_html"] = template.render(part="rows", **context)
+        result["cards_html"] = template.render(part="cards", **context)
+    return result
+
+
 @app.get("/lessons/{lesson_id}/attendance/correct", response_class=HTMLResponse)
 def correct_attendance_from_schedule(
     lesson_id: int,
@@ -2415,31 +2441,6 @@ async def attendance_create(lesson_id: int, request: Request, db: Session = Depe
             )
         )
 
-    if marked_at_dt and user.get("role") in ("teacher", "staff") and to_create:
-        duplicate_ids = crud.find_attendance_duplicate_student_ids(
-            db,
-            lesson_id=lesson_id,
-            student_ids=[item.student_id for item in to_create],
-            attendance_date=marked_at_dt.date(),
-        )
-        if duplicate_ids:
-            duplicate_students = []
-            for item in to_create:
-                if item.student_id in duplicate_ids:
-                    student = db.get(models.Student, item.student_id)
-                    if student:
-                        duplicate_students.append(f"{student.first_name} {student.last_name}")
-            if duplicate_students:
-                duplicate_message = (
-                    f"Daha önce bu öğrenci{'ler' if len(duplicate_students) > 1 else ''} "
-                    f"için yoklama almışsınız: {', '.join(duplicate_students)}"
-                )
-                request.session["attendance_duplicate_warning"] = duplicate_message
-                return RedirectResponse(
-                    url=attendance_new_url(lesson_id, return_to_value, duplicate_warning="true"),
-                    status_code=302,
-                )
-
     if not to_create:
         if user.get("role") == "teacher" and passive_attempted_student_names:
             names = ", ".join(dict.fromkeys(passive_attempted_student_names))
@@ -2456,8 +2457,21 @@ async def attendance_create(lesson_id: int, request: Request, db: Session = Depe
             status_code=302,
         )
 
+    # Öğretmen/personel seçilen tarihe ikinci kez yoklama giremez
+    reject_duplicates = bool(marked_at_dt) and user.get("role") in ("teacher", "staff")
     try:
-        success_count = crud.create_attendances_bulk(db, to_create)
+        success_count = len(crud.create_attendances_bulk(db, to_create, reject_duplicates=reject_duplicates))
+    except crud.AttendanceDuplicateError as dup:
+        names = duplicate_attendance_student_names(db, dup)
+        duplicate_students = [names[item.student_id] for item in to_create if item.student_id in names]
+        request.session["attendance_duplicate_warning"] = (
+            f"Daha önce bu öğrenci{'ler' if len(duplicate_students) > 1 else ''} "
+            f"için yoklama almışsınız: {', '.join(duplicate_students)}"
+        )
+        return RedirectResponse(
+            url=attendance_new_url(lesson_id, return_to_value, duplicate_warning="true"),
+            status_code=302,
+        )
     except Exception as exc:
         db.rollback()
         logging.error("Yoklama kaydedilemedi: %s", exc)
@@ -2631,6 +2645,7 @@ def update_attendance_endpoint(
 					description=lesson.description,
 				))
 				attendance.lesson_id = new_lesson.id
+				bump_data_version(db, DOMAIN_ATTENDANCE)
 				db.commit()
 				db.refresh(attendance)
 		
@@ -2749,25 +2764,17 @@ def list_students(db: Session = Depends(get_db)):
 
 @app.get("/api/students/search")
 def search_students(q: str = None, db: Session = Depends(get_db)):
-	"""Öğrenci arama API endpoint'i - autocomplete için (en az 3 harf)"""
+	"""Öğrenci arama API endpoint'i - autocomplete için (en az 3 harf; ad, soyad veya telefon)"""
 	if not q or len(q.strip()) < 3:
 		return []
-	from sqlalchemy import or_
-	search_prefix = f"{q.strip()[:3]}%"
-	students = db.query(models.Student).filter(
-		or_(
-			models.Student.first_name.ilike(search_prefix),
-			models.Student.last_name.ilike(search_prefix),
-			(models.Student.first_name + " " + models.Student.last_name).ilike(search_prefix),
-		)
-	).limit(10).all()
+	students = search_directory(db, q, KIND_STUDENT, limit=10)
 	return [
 		{
 			"id": s.id,
 			"first_name": s.first_name,
 			"last_name": s.last_name,
 			"full_name": f"{s.first_name} {s.last_name}",
-			"phone": s.phone_primary or s.phone_secondary or None,
+			"phone": s.phone,
 			"type": "student"
 		}
 		for s in students
@@ -2779,12 +2786,7 @@ def search_teachers(q: str = None, db: Session = Depends(get_db)):
 	"""Öğretmen arama API endpoint'i - autocomplete için"""
 	if not q or len(q.strip()) < 3:
 		return []
-	search_prefix = f"{q.strip()[:3]}%"
-	teachers = db.query(models.Teacher).filter(
-		models.Teacher.is_active == True,
-		(models.Teacher.first_name.ilike(search_prefix)) | 
-		(models.Teacher.last_name.ilike(search_prefix))
-	).limit(10).all()
+	teachers = search_directory(db, q, KIND_TEACHER, limit=10)
 	return [
 		{
 			"id": t.id,
@@ -2802,10 +2804,7 @@ def search_courses(q: str = None, db: Session = Depends(get_db)):
 	"""Kurs arama API endpoint'i - autocomplete için"""
 	if not q or len(q.strip()) < 3:
 		return []
-	search_term = f"%{q.strip()}%"
-	courses = db.query(models.Course).filter(
-		models.Course.name.ilike(search_term)
-	).limit(10).all()
+	courses = search_directory(db, q, KIND_COURSE, limit=10)
 	return [
 		{
 			"id": c.id,
@@ -2821,15 +2820,10 @@ def search_all(q: str = None, db: Session = Depends(get_db)):
 	"""İsim bazlı arama API endpoint'i - autocomplete için (öğrenci, öğretmen)"""
 	if not q or len(q.strip()) < 3:
 		return []
-	search_prefix = f"{q.strip()[:3]}%"
 	results = []
 	
 	# Öğrenciler
-	students = db.query(models.Student).filter(
-		(models.Student.first_name.ilike(search_prefix)) | 
-		(models.Student.last_name.ilike(search_prefix))
-	).limit(5).all()
-	for s in students:
+	for s in search_directory(db, q, KIND_STUDENT, limit=5):
 		results.append({
 			"id": s.id,
 			"name": f"{s.first_name} {s.last_name}",
@@ -2838,12 +2832,7 @@ def search_all(q: str = None, db: Session = Depends(get_db)):
 		})
 	
 	# Öğretmenler
-	teachers = db.query(models.Teacher).filter(
-		models.Teacher.is_active == True,
-		(models.Teacher.first_name.ilike(search_prefix)) |
-		(models.Teacher.last_name.ilike(search_prefix))
-	).limit(5).all()
-	for t in teachers:
+	for t in search_directory(db, q, KIND_TEACHER, limit=5):
 		results.append({
 			"id": t.id,
 			"name": f"{t.first_name} {t.last_name}",
@@ -3146,7 +3135,10 @@ def lesson_delete(lesson_id: int, request: Request, db: Session = Depends(get_db
 # Attendance
 @app.post("/attendance", response_model=schemas.AttendanceOut)
 def mark_attendance(payload: schemas.AttendanceCreate, db: Session = Depends(get_db)):
-	return crud.mark_attendance(db, payload)
+	try:
+		return crud.mark_attendance(db, payload)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/lessons/{lesson_id}/attendance", response_model=list[schemas.AttendanceOut])
@@ -3189,32 +3181,17 @@ def ui_student_detail(student_id: int, request: Request, db: Session = Depends(g
     # enrollments and courses
     enrollments = db.query(models.Enrollment).filter(models.Enrollment.student_id == student_id).all()
     
-    # Öğrencinin yoklama kayıtlarını getir (detaylı bilgilerle)
-    attendances_raw = crud.list_all_attendances(db, student_id=student_id, limit=1000, order_by="marked_at_desc")
-    
-    # Yoklama kayıtlarını detaylı bilgilerle formatla
-    attendances_with_details = []
-    for att in attendances_raw:
-        lesson = db.get(models.Lesson, att.lesson_id) if att.lesson_id else None
-        course = None
-        teacher = None
-        if lesson:
-            course = db.get(models.Course, lesson.course_id) if lesson.course_id else None
-            teacher = db.get(models.Teacher, lesson.teacher_id) if lesson.teacher_id else None
-        
-        attendances_with_details.append({
-            "attendance": att,
-            "lesson": lesson,
-            "course": course,
-            "teacher": teacher,
-        })
+    # Öğrencinin yoklama kayıtları: ilk sayfa; eski kayıtlar kaydırdıkça /api/attendances ile gelir
+    attendance_page = crud.list_attendance_page(db, student_id=student_id, order_by="marked_at_desc")
     
     return templates.TemplateResponse("student_detail.html", {
         "request": request,
         "student": student,
         "payments": payments,
         "enrollments": enrollments,
-        "attendances": attendances_with_details
+        "attendances": attendance_page["items"],
+        "attendance_next_cursor": attendance_page["next_cursor"],
+        "attendance_scroll_url": attendance_scroll_url("student", student_id=student_id),
     })
 
 
@@ -3277,19 +3254,54 @@ def _default_finance_range(start: str | None, end: str | None):
     return start_date, end_date, (start_date.isoformat() if start_date else ""), (end_date.isoformat() if end_date else "")
 
 
+def _cached_finance_overview(db: Session, start_date, end_date) -> dict:
+    """Finans özeti; tahsilat/gider/atama sürümleri değişmedikçe önbellekten."""
+    return cached_report(
+        db,
+        "finance_overview",
+        {"start": start_date, "end": end_date},
+        (DOMAIN_PAYMENTS, DOMAIN_EXPENSES, DOMAIN_SCHEDULE),
+        lambda: crud.build_finance_overview(db, start_date=start_date, end_date=end_date),
+    )
+
+
+def _cached_teacher_pay_report(db: Session, start_date, end_date, teacher_id) -> dict:
+    return cached_report(
+        db,
+        "teacher_pay",
+        {"start": start_date, "end": end_date, "teacher_id": teacher_id},
+        (DOMAIN_ATTENDANCE, DOMAIN_SCHEDULE),
+        lambda: crud.build_teacher_pay_report(
+            db, start_date=start_date, end_date=end_date, teacher_id=teacher_id
+        ),
+    )
+
+
+def _cached_payment_report(db: Session, **filters) -> dict:
+    """Ödeme raporu satırları ve toplamı (HTML ve CSV aynı önbellek kaydını paylaşır)."""
+    return cached_report(
+        db,
+        "payment_report",
+        filters,
+        (DOMAIN_PAYMENTS, DOMAIN_SCHEDULE),
+        lambda: crud.build_payment_report(db, **filters),
+    )
+
+
 # UI: Finans (admin only)
 @app.get("/ui/finance", response_class=HTMLResponse)
 def ui_finance(request: Request, start: str | None = None, end: str | None = None, db: Session = Depends(get_db)):
     require_admin(request)
     start_date, end_date, start_s, end_s = _default_finance_range(start, end)
-    income_by_method = crud.sum_payments_by_method(db, start_date=start_date, end_date=end_date)
-    income_total = crud.sum_payments_total(db, start_date=start_date, end_date=end_date)
-    expense_total = crud.sum_expenses(db, start_date=start_date, end_date=end_date)
-    net = income_total - expense_total
-    income_monthly = crud.monthly_payment_totals(db, start_date=start_date, end_date=end_date)
-    expense_monthly = crud.monthly_expense_totals(db, start_date=start_date, end_date=end_date)
-    expense_by_category = crud.expense_totals_by_category(db, start_date=start_date, end_date=end_date)
-    by_teacher = crud.payment_totals_by_teacher(db, start_date=start_date, end_date=end_date)
+    overview = _cached_finance_overview(db, start_date, end_date)
+    income_by_method = overview["income_by_method"]
+    income_total = overview["income_total"]
+    expense_total = overview["expense_total"]
+    net = overview["net"]
+    income_monthly = overview["income_monthly"]
+    expense_monthly = overview["expense_monthly"]
+    expense_by_category = overview["expense_by_category"]
+    by_teacher = overview["by_teacher"]
     from . import finance_export as fexp
     return templates.TemplateResponse(
         "finance.html",
@@ -3362,13 +3374,26 @@ def ui_finance_income(
         for p in items
     ]
 
-    income_by_method = crud.sum_payments_by_method(db, start_date=start_date, end_date=end_date)
-    income_total = crud.sum_payments_total(db, start_date=start_date, end_date=end_date)
     filtered_total = float(sum(float(p.amount_try or 0) for p in items))
-    income_monthly = crud.monthly_payment_totals(db, start_date=start_date, end_date=end_date)
-    by_teacher = crud.payment_totals_by_teacher(
-        db, start_date=start_date, end_date=end_date, method=db_method
+    # Dönem toplamları filtre listesinden bağımsız; yalnızca tahsilat/atama değişince yeniden hesaplanır
+    income_summary = cached_report(
+        db,
+        "finance_income_summary",
+        {"start": start_date, "end": end_date, "method": db_method},
+        (DOMAIN_PAYMENTS, DOMAIN_SCHEDULE),
+        lambda: {
+            "by_method": crud.sum_payments_by_method(db, start_date=start_date, end_date=end_date),
+            "total": crud.sum_payments_total(db, start_date=start_date, end_date=end_date),
+            "monthly": crud.monthly_payment_totals(db, start_date=start_date, end_date=end_date),
+            "by_teacher": crud.payment_totals_by_teacher(
+                db, start_date=start_date, end_date=end_date, method=db_method
+            ),
+        },
     )
+    income_by_method = income_summary["by_method"]
+    income_total = income_summary["total"]
+    income_monthly = income_summary["monthly"]
+    by_teacher = income_summary["by_teacher"]
     teachers = crud.list_teachers(db)
     from . import finance_export as fexp
 
@@ -3430,6 +3455,7 @@ def ui_finance_payment_detail(
         except (ValueError, TypeError):
             teacher_id_int = None
 
+    only_cross = (only_cross_month or "").strip() in {"1", "true", "on", "yes"}
     analysis = crud.build_payment_package_details(
         db,
         payment_start=start_date,
@@ -3438,48 +3464,12 @@ def ui_finance_payment_detail(
         coverage_end=cov_end,
         student_id=student_id_int,
         teacher_id=teacher_id_int,
+        only_cross_month=only_cross,
     )
-    rows = analysis["rows"]
-    if (only_cross_month or "").strip() in {"1", "true", "on", "yes"}:
-        rows = [r for r in rows if r.get("crosses_month")]
-        analysis = dict(analysis)
-        analysis["rows"] = rows
-        # Yeniden özet
-        view_cash: dict[str, float] = {}
-        view_accrual: dict[str, float] = {}
-        view_prepaid: dict[str, float] = {}
-        for row in rows:
-            pm = row["payment_month"]
-            view_cash[pm] = view_cash.get(pm, 0.0) + row["amount"]
-            for ym, val in row["month_split"].items():
-                if "(bekleyen)" in ym:
-                    base = ym.replace(" (bekleyen)", "")
-                    view_prepaid[base] = view_prepaid.get(base, 0.0) + val
-                else:
-                    view_accrual[ym] = view_accrual.get(ym, 0.0) + val
-        months = sorted(set(view_cash) | set(view_accrual) | set(view_prepaid))
-        analysis["monthly_compare"] = [
-            {
-                "month": m,
-                "cash": round(view_cash.get(m, 0.0), 2),
-                "accrued": round(view_accrual.get(m, 0.0), 2),
-                "prepaid": round(view_prepaid.get(m, 0.0), 2),
-                "delta": round(view_cash.get(m, 0.0) - view_accrual.get(m, 0.0), 2),
-            }
-            for m in months
-        ]
-        analysis["totals"] = {
-            "cash": round(sum(r["amount"] for r in rows), 2),
-            "accrued": round(sum(view_accrual.values()), 2),
-            "prepaid": round(sum(view_prepaid.values()), 2),
-            "cross_month_packages": len(rows),
-            "package_count": len(rows),
-        }
 
     selected_student = db.get(models.Student, student_id_int) if student_id_int else None
     teachers = crud.list_teachers(db)
     from . import finance_export as fexp
-    only_cross = (only_cross_month or "").strip() in {"1", "true", "on", "yes"}
     return templates.TemplateResponse(
         "finance_payment_detail.html",
         {
@@ -3524,12 +3514,7 @@ def ui_finance_teacher_pay(
             teacher_id_int = int(str(teacher_id).strip())
         except (ValueError, TypeError):
             teacher_id_int = None
-    report = crud.build_teacher_pay_report(
-        db,
-        start_date=start_date,
-        end_date=end_date,
-        teacher_id=teacher_id_int,
-    )
+    report = _cached_teacher_pay_report(db, start_date, end_date, teacher_id_int)
     teachers = crud.list_teachers(db, active_only=True)
     from . import finance_export as fexp
     return templates.TemplateResponse(
@@ -3703,43 +3688,8 @@ def _finance_payment_detail_analysis(
         coverage_end=cov_end,
         student_id=student_id_int,
         teacher_id=teacher_id_int,
+        only_cross_month=(only_cross_month or "").strip() in {"1", "true", "on", "yes"},
     )
-    rows = analysis["rows"]
-    cross = (only_cross_month or "").strip() in {"1", "true", "on", "yes"}
-    if cross:
-        rows = [r for r in rows if r.get("crosses_month")]
-        analysis = dict(analysis)
-        analysis["rows"] = rows
-        view_cash: dict[str, float] = {}
-        view_accrual: dict[str, float] = {}
-        view_prepaid: dict[str, float] = {}
-        for row in rows:
-            pm = row["payment_month"]
-            view_cash[pm] = view_cash.get(pm, 0.0) + row["amount"]
-            for ym, val in row["month_split"].items():
-                if "(bekleyen)" in ym:
-                    base = ym.replace(" (bekleyen)", "")
-                    view_prepaid[base] = view_prepaid.get(base, 0.0) + val
-                else:
-                    view_accrual[ym] = view_accrual.get(ym, 0.0) + val
-        months = sorted(set(view_cash) | set(view_accrual) | set(view_prepaid))
-        analysis["monthly_compare"] = [
-            {
-                "month": m,
-                "cash": round(view_cash.get(m, 0.0), 2),
-                "accrued": round(view_accrual.get(m, 0.0), 2),
-                "prepaid": round(view_prepaid.get(m, 0.0), 2),
-                "delta": round(view_cash.get(m, 0.0) - view_accrual.get(m, 0.0), 2),
-            }
-            for m in months
-        ]
-        analysis["totals"] = {
-            "cash": round(sum(r["amount"] for r in rows), 2),
-            "accrued": round(sum(view_accrual.values()), 2),
-            "prepaid": round(sum(view_prepaid.values()), 2),
-            "cross_month_packages": len(rows),
-            "package_count": len(rows),
-        }
     return analysis, start_s, end_s
 
 
@@ -3758,12 +3708,13 @@ def finance_export_overview(
     if fmt not in ("xlsx", "pdf"):
         raise HTTPException(status_code=404)
     start_date, end_date, start_s, end_s = _default_finance_range(start, end)
-    income_by_method = crud.sum_payments_by_method(db, start_date=start_date, end_date=end_date)
-    income_total = crud.sum_payments_total(db, start_date=start_date, end_date=end_date)
-    expense_total = crud.sum_expenses(db, start_date=start_date, end_date=end_date)
-    net = income_total - expense_total
-    by_teacher = crud.payment_totals_by_teacher(db, start_date=start_date, end_date=end_date)
-    expense_by_category = crud.expense_totals_by_category(db, start_date=start_date, end_date=end_date)
+    overview = _cached_finance_overview(db, start_date, end_date)
+    income_by_method = overview["income_by_method"]
+    income_total = overview["income_total"]
+    expense_total = overview["expense_total"]
+    net = overview["net"]
+    by_teacher = overview["by_teacher"]
+    expense_by_category = overview["expense_by_category"]
     stamp = dt.now().strftime("%Y%m%d_%H%M")
     meta = [fexp.period_label(start_s, end_s)]
 
@@ -3989,6 +3940,7 @@ def finance_export_teacher_pay(
     start: str | None = None,
     end: str | None = None,
     teacher_id: str | None = None,
+    by_month: str | None = None,
     db: Session = Depends(get_db),
 ):
     require_admin(request)
@@ -3999,9 +3951,7 @@ def finance_export_teacher_pay(
         raise HTTPException(status_code=404)
     start_date, end_date, start_s, end_s = _default_finance_range(start, end)
     teacher_id_int = _finance_parse_int(teacher_id)
-    report = crud.build_teacher_pay_report(
-        db, start_date=start_date, end_date=end_date, teacher_id=teacher_id_int
-    )
+    report = _cached_teacher_pay_report(db, start_date, end_date, teacher_id_int)
     headers = ["Öğretmen", "Saat ücreti (₺)", "Ders saati", "Hak ediş (₺)"]
     rows = [
         [
@@ -4019,9 +3969,33 @@ def finance_export_teacher_pay(
         f"Toplam ders saati: {float(totals.get('hours') or 0):.2f} | Toplam hak ediş: {float(totals.get('amount') or 0):.2f} ₺",
     ]
     if fmt == "xlsx":
+        sheets = [("Hak ediş", headers, rows)]
+        if by_month in ("1", "true", "on"):
+            # Öğretmen × ay matrisi (tek gruplu sorgu); ayrı sayfa olarak eklenir
+            matrix = cached_report(
+                db,
+                "teacher_pay_matrix",
+                {"start": start_date, "end": end_date, "teacher_id": teacher_id_int},
+                (DOMAIN_ATTENDANCE, DOMAIN_SCHEDULE),
+                lambda: crud.build_teacher_pay_matrix(
+                    db, start_date=start_date, end_date=end_date, teacher_id=teacher_id_int
+                ),
+            )
+            months = matrix.get("months") or []
+            month_headers = ["Öğretmen"] + [f"{m} ders" for m in months] + [f"{m} hak ediş (₺)" for m in months]
+            month_rows = [
+                [r["teacher_name"]]
+                + [r["months"][m]["lessons"] for m in months]
+                + [
+                    round(float(r["months"][m]["amount"]), 2) if r["months"][m]["amount"] is not None else ""
+                    for m in months
+                ]
+                for r in (matrix.get("rows") or [])
+            ]
+            sheets.append(("Aylık", month_headers, month_rows))
         return fexp.excel_response(
             filename=f"finans_ogretmen_hak_edis_{stamp}.xlsx",
-            sheets=[("Hak ediş", headers, rows)],
+            sheets=sheets,
         )
     return fexp.pdf_response(
         filename=f"finans_ogretmen_hak_edis_{stamp}.pdf",
@@ -4133,53 +4107,17 @@ def payment_reports(request: Request, start: str | None = None, end: str | None
         except (ValueError, TypeError):
             student_id_int = None
     
-    # Get teacher's students if teacher filter is applied
-    teacher_student_ids = None
-    if teacher_id_int:
-        teacher_students = crud.list_students_by_teacher(db, teacher_id_int)
-        if teacher_students:
-            teacher_student_ids = [s.id for s in teacher_students]
-        else:
-            # If teacher has no students, use impossible ID to return no results
-            teacher_student_ids = [-1]
-    
-    # query payments with optional filters and total sum
-    q = db.query(models.Payment).join(models.Student)
-    # optional joins for filters
-    # Filter by course or teacher through enrollments and lessons/payments if needed (basic: by course via enrollments)
-    if course_id_int:
-        q = q.join(models.Enrollment, models.Enrollment.student_id == models.Payment.student_id).filter(models.Enrollment.course_id == course_id_int)
-    if teacher_student_ids is not None:
-        # Filter payments by students assigned to the selected teacher
-        q = q.filter(models.Payment.student_id.in_(teacher_student_ids))
-    if student_id_int:
-        # Filter payments by selected student
-        q = q.filter(models.Payment.student_id == student_id_int)
-    if method and method.strip():
-        # Filter payments by payment method
-        q = q.filter(models.Payment.method == method.strip())
-    if start_date:
-        q = q.filter(models.Payment.payment_date >= start_date)
-    if end_date:
-        q = q.filter(models.Payment.payment_date <= end_date)
-    items = q.order_by(models.Payment.payment_date.desc()).all()
-    sum_q = db.query(func.coalesce(func.sum(models.Payment.amount_try), 0)).join(models.Student)
-    if course_id_int:
-        sum_q = sum_q.join(models.Enrollment, models.Enrollment.student_id == models.Payment.student_id).filter(models.Enrollment.course_id == course_id_int)
-    if teacher_student_ids is not None:
-        # Filter sum by students assigned to the selected teacher
-        sum_q = sum_q.filter(models.Payment.student_id.in_(teacher_student_ids))
-    if student_id_int:
-        # Filter sum by selected student
-        sum_q = sum_q.filter(models.Payment.student_id == student_id_int)
-    if method and method.strip():
-        # Filter sum by payment method
-        sum_q = sum_q.filter(models.Payment.method == method.strip())
-    if start_date:
-        sum_q = sum_q.filter(models.Payment.payment_date >= start_date)
-    if end_date:
-        sum_q = sum_q.filter(models.Payment.payment_date <= end_date)
-    total = float(sum_q.scalar() or 0)
+    report = _cached_payment_report(
+        db,
+        start_date=start_date,
+        end_date=end_date,
+        course_id=course_id_int,
+        teacher_id=teacher_id_int,
+        student_id=student_id_int,
+        method=(method or "").strip() or None,
+    )
+    items = report["items"]
+    total = report["total"]
     courses = crud.list_courses(db)
     teachers = crud.list_teachers(db)
     # Get selected student info if student_id is provided
@@ -4235,38 +4173,21 @@ def payment_reports_csv(request: Request, start: str | None = None, end: str | N
         except (ValueError, TypeError):
             student_id_int = None
     
-    # Get teacher's students if teacher filter is applied
-    teacher_student_ids = None
-    if teacher_id_int:
-        teacher_students = crud.list_students_by_teacher(db, teacher_id_int)
-        if teacher_students:
-            teacher_student_ids = [s.id for s in teacher_students]
-        else:
-            # If teacher has no students, use impossible ID to return no results
-            teacher_student_ids = [-1]
-    
-    q = db.query(models.Payment).join(models.Student)
-    if course_id_int:
-        q = q.join(models.Enrollment, models.Enrollment.student_id == models.Payment.student_id).filter(models.Enrollment.course_id == course_id_int)
-    if teacher_student_ids is not None:
-        # Filter payments by students assigned to the selected teacher
-        q = q.filter(models.Payment.student_id.in_(teacher_student_ids))
-    if student_id_int:
-        # Filter payments by selected student
-        q = q.filter(models.Payment.student_id == student_id_int)
-    if method and method.strip():
-        # Filter payments by payment method
-        q = q.filter(models.Payment.method == method.strip())
-    if start_date:
-        q = q.filter(models.Payment.payment_date >= start_date)
-    if end_date:
-        q = q.filter(models.Payment.payment_date <= end_date)
-    items = q.order_by(models.Payment.payment_date.desc()).all()
+    report = _cached_payment_report(
+        db,
+        start_date=start_date,
+        end_date=end_date,
+        course_id=course_id_int,
+        teacher_id=teacher_id_int,
+        student_id=student_id_int,
+        method=(method or "").strip() or None,
+    )
+    items = report["items"]
     buf = StringIO()
     writer = csv.writer(buf)
     writer.writerow(["Tarih", "Öğrenci", "Tutar", "Yöntem", "Not"])
     for p in items:
-        writer.writerow([str(p.payment_date), f"{p.student.first_name} {p.student.last_name}", f"{p.amount_try}", p.method or "", p.note or ""]) 
+        writer.writerow([str(p["payment_date"]), f"{p['student']['first_name']} {p['student']['last_name']}", f"{p['amount_try']}", p["method"] or "", p["note"] or ""]) 
     return Response(content=buf.getvalue(), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=odeme_raporu.csv"})
 
 
@@ -4566,14 +4487,12 @@ def staff_panel(
                 (models.Student.first_name.ilike(search_term)) | 
                 (models.Student.last_name.ilike(search_term))
             ).limit(20).all()
-            # Her öğrenci için ödeme durumunu kontrol et
-            search_results = []
-            for student in students_found:
-                needs_payment = crud.check_student_payment_status(db, student.id)
-                search_results.append({
-                    "student": student,
-                    "needs_payment": needs_payment
-                })
+            # Ödeme durumları tek seferde
+            payment_needed = crud.check_students_payment_status(db, [student.id for student in students_found])
+            search_results = [
+                {"student": student, "needs_payment": payment_needed.get(student.id, True)}
+                for student in students_found
+            ]
         
         if student_id_int:
             # Seçilen öğrencinin bilgilerini ve derslerini getir
@@ -4796,18 +4715,9 @@ def staff_panel(
                 start_date=start_date_obj,
                 end_date=end_date_obj,
                 order_by=order_by,
+                student_name=attendance_student_name,
                 limit=200,
             )
-            if attendance_student_name and attendance_student_name.strip() and not attendance_student_id_int:
-                filtered = []
-                for a in attendances:
-                    stu = db.get(models.Student, a.student_id)
-                    if not stu:
-                        continue
-                    full_name = f"{stu.first_name} {stu.last_name}"
-                    if crud.student_name_matches_prefix(full_name, attendance_student_name):
-                        filtered.append(a)
-                attendances = filtered
 
             if attendances:
                 lesson_ids = {att.lesson_id for att in attendances}
@@ -4912,8 +4822,8 @@ async def staff_retrospective_attendance(
         form_data = await request.form()
         attendance_date = datetime.strptime(selected_date, "%Y-%m-%d").date()
         
-        # Yoklama kayıtlarını oluştur
-        attendance_count = 0
+        # Yoklama kayıtlarını bellekte topla; tek insert ve tek commit ile yazılır
+        to_create: list[schemas.AttendanceCreate] = []
         for key, value in form_data.items():
             if key.startswith("status_"):
                 # Format: status_lessonId_studentId
@@ -4942,16 +4852,22 @@ async def staff_retrospective_attendance(
                             # Saat girilmemişse günün başlangıcını kullan
                             marked_at_datetime = datetime.combine(attendance_date, datetime.min.time())
                         
-                        # Yoklama kaydı oluştur
-                        attendance_data = schemas.AttendanceCreate(
+                        to_create.append(schemas.AttendanceCreate(
                             lesson_id=lesson_id,
                             student_id=student_id,
                             status=status_value,
                             marked_at=marked_at_datetime,
                             note=f"Geçmişe dönük kayıt - {selected_date}"
-                        )
-                        crud.mark_attendance(db, attendance_data, commit=True)
-                        attendance_count += 1
+                        ))
+        
+        try:
+            attendance_count = len(crud.create_attendances_bulk(db, to_create, reject_duplicates=True))
+        except crud.AttendanceDuplicateError as dup:
+            names = sorted(duplicate_attendance_student_names(db, dup).values())
+            return RedirectResponse(
+                url=f"/ui/staff?teacher_id={teacher_id}&selected_date={selected_date}&error=Bu tarihte yoklaması zaten olan öğrenciler: {', '.join(names)}",
+                status_code=303
+            )
         
         if attendance_count > 0:
             return RedirectResponse(
@@ -5020,7 +4936,10 @@ def toggle_student_active(student_id: int, request: Request, db: Session = Depen
     if student:
         # Aktif/pasif durumunu tersine çevir
         student.is_active = not student.is_active
+        # Arama dizini aktif öğrencileri önce sıralar; dizin de yenilenmeli
+        bump_data_version(db, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
         db.commit()
+        mark_search_index_stale()
         db.refresh(student)
         status_text = "aktif" if student.is_active else "pasif"
         request.session["student_toggle_success"] = f"Öğrenci {status_text} yapıldı"
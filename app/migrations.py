@@ -0,0 +1,243 @@
+"""Sürümlü şema migration'ları.
+
+Her adım bir kez çalışır; uygulanan son sürüm app_meta tablosunda
+(key = 'schema_version') tutulur. Sıcak açılışta yalnızca tek bir sürüm
+okuması yapılır. Adımlar veritabanı kilidi altında çalışır; böylece aynı anda
+açılan uvicorn worker'ları ALTER TABLE üzerinde yarışmaz.
+
+Bekleyen adımlardan önce models'deki eksik tablolar create_all ile kurulur
+(boş veritabanında adımların üzerinde çalışacağı tablolar hazır olsun diye).
+Bir adım başarısız olursa (False döner ya da istisna yükselir) sürüm yazılmaz ve
+kalan adımlar çalıştırılmaz; adım bir sonraki açılışta yeniden denenir.
+
+Yeni adım eklemek için MIGRATIONS listesinin sonuna artan sürüm numarasıyla
+bir Migration ekleyin. Adımlar başarıda True döndürmeli ve idempotent olmalıdır
+(yarıda kalan bir çalışma tekrarlandığında sorun çıkarmamalı).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from .db import (
+	Base,
+	engine,
+	ensure_is_active_column,
+	ensure_teacher_is_active_column,
+	ensure_teacher_hourly_rate_column,
+	ensure_attendance_lesson_fk_restrict,
+	ensure_lesson_students_backfill_from_attendance,
+	ensure_expenses_table,
+	ensure_student_financial_state_table,
+	ensure_hot_path_indexes,
+	ensure_payment_lesson_allocations_table,
+	ensure_finance_daily_rollup_table,
+	ensure_student_name_search_columns,
+)
+from .report_cache import ensure_data_version_rows
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_KEY = "schema_version"
+LOCK_KEY = "schema_migration_lock"
+# pg_advisory_lock anahtarı (uygulamaya özgü sabit)
+_PG_ADVISORY_LOCK_ID = 724_310_001
+# SQLite kilit satırı bu süreden eskiyse (çöken worker) devralınır
+_LOCK_STALE_SECONDS = 600
+_LOCK_WAIT_SECONDS = 900
+
+
+class Migration(NamedTuple):
+	version: int
+	name: str
+	apply: Callable[[], bool]
+
+
+def _is_postgres() -> bool:
+	return "postgres" in str(engine.url).lower()
+
+
+def _push_outbox_table() -> bool:
+	from .push_notify import ensure_push_outbox_table
+	return ensure_push_outbox_table()
+
+
+def _push_outbox_digest_column() -> bool:
+	from .push_notify import ensure_push_outbox_digest_column
+	return ensure_push_outbox_digest_column()
+
+
+def _push_tables() -> bool:
+	from .push_notify import ensure_push_subscriptions_table, ensure_vapid_meta_table
+	return ensure_push_subscriptions_table() and ensure_vapid_meta_table()
+
+
+MIGRATIONS: list[Migration] = [
+	Migration(1, "students.is_active kolonu", ensure_is_active_column),
+	Migration(2, "teachers.is_active kolonu", ensure_teacher_is_active_column),
+	Migration(3, "teachers.hourly_rate_try kolonu", ensure_teacher_hourly_rate_column),
+	Migration(4, "attendances.lesson_id FK RESTRICT", ensure_attendance_lesson_fk_restrict),
+	Migration(5, "lesson_students yoklama backfill", ensure_lesson_students_backfill_from_attendance),
+	Migration(6, "expenses tablosu", ensure_expenses_table),
+	Migration(7, "push tabloları", _push_tables),
+	Migration(8, "student_financial_state tablosu", ensure_student_financial_state_table),
+	Migration(9, "sıcak sorgu yolu indeksleri", ensure_hot_path_indexes),
+	Migration(10, "payment_lesson_allocations paket defteri", ensure_payment_lesson_allocations_table),
+	Migration(11, "finance_daily_rollup tablosu", ensure_finance_daily_rollup_table),
+	Migration(12, "rapor önbelleği veri sürümleri", ensure_data_version_rows),
+	Migration(13, "students ad arama anahtarları", ensure_student_name_search_columns),
+	Migration(14, "arama dizini veri sürümü", ensure_data_version_rows),
+	Migration(15, "push_outbox tablosu", _push_outbox_table),
+	Migration(16, "push_outbox.digest_key kolonu", _push_outbox_digest_column),
+]
+
+
+def latest_version() -> int:
+	return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def _ensure_app_meta_table() -> None:
+	with engine.begin() as conn:
+		conn.execute(text("""
+			CREATE TABLE IF NOT EXISTS app_meta (
+				key VARCHAR(100) PRIMARY KEY,
+				value VARCHAR(255),
+				created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+			)
+		"""))
+
+
+def read_schema_version() -> int | None:
+	"""app_meta'daki şema sürümü; tablo veya kayıt yoksa None."""
+	try:
+		with engine.connect() as conn:
+			row = conn.execute(
+				text("SELECT value FROM app_meta WHERE key = :k"),
+				{"k": SCHEMA_VERSION_KEY},
+			).fetchone()
+	except Exception:
+		return None
+	if not row or row[0] is None:
+		return None
+	try:
+		return int(row[0])
+	except (TypeError, ValueError):
+		return None
+
+
+def _write_schema_version(version: int) -> None:
+	with engine.begin() as conn:
+		updated = conn.execute(
+			text("UPDATE app_meta SET value = :v WHERE key = :k"),
+			{"k": SCHEMA_VERSION_KEY, "v": str(version)},
+		).rowcount
+		if not updated:
+			conn.execute(
+				text("INSERT INTO app_meta (key, value) VALUES (:k, :v)"),
+				{"k": SCHEMA_VERSION_KEY, "v": str(version)},
+			)
+
+
+@contextmanager
+def _pg_migration_lock():
+	conn = engine.connect()
+	try:
+		conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _PG_ADVISORY_LOCK_ID})
+		conn.commit()
+		try:
+			_ensure_app_meta_table()
+			yield
+		finally:
+			conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _PG_ADVISORY_LOCK_ID})
+			conn.commit()
+	finally:
+		conn.close()
+
+
+@contextmanager
+def _row_migration_lock():
+	"""SQLite vb.: app_meta'ya kilit satırı ekleyen (PRIMARY KEY ile tekil) kilit."""
+	_ensure_app_meta_table()
+	deadline = time.monotonic() + _LOCK_WAIT_SECONDS
+	while True:
+		try:
+			with engine.begin() as conn:
+				conn.execute(
+					text("DELETE FROM app_meta WHERE key = :k AND created_at < :stale"),
+					{"k": LOCK_KEY, "stale": datetime.utcnow() - timedelta(seconds=_LOCK_STALE_SECONDS)},
+				)
+				conn.execute(
+					text("INSERT INTO app_meta (key, value, created_at) VALUES (:k, :v, :ts)"),
+					{"k": LOCK_KEY, "v": str(os.getpid()), "ts": datetime.utcnow()},
+				)
+			break
+		except IntegrityError:
+			if time.monotonic() > deadline:
+				raise TimeoutError("Migration kilidi alınamadı")
+			time.sleep(0.5)
+	try:
+		yield
+	finally:
+		with engine.begin() as conn:
+			conn.execute(text("DELETE FROM app_meta WHERE key = :k"), {"k": LOCK_KEY})
+
+
+def migration_lock():
+	return _pg_migration_lock() if _is_postgres() else _row_migration_lock()
+
+
+def _create_missing_tables() -> None:
+	from . import models  # noqa: F401 — tablo metadata'sı için
+	Base.metadata.create_all(bind=engine)
+
+
+def run_migrations() -> int:
+	"""
+	Bekleyen migration adımlarını sırayla uygular ve uygulanan son sürümü döndürür.
+	Sürüm güncelse tek bir SELECT ile döner; bir adım başarısız olursa orada durur.
+	"""
+	target = latest_version()
+	current = read_schema_version()
+	if current is not None and current >= target:
+		return current
+
+	with migration_lock():
+		# Kilidi beklerken başka bir worker tamamlamış olabilir
+		current = read_schema_version() or 0
+		if current >= target:
+			return current
+		_create_missing_tables()
+		for migration in MIGRATIONS:
+			if migration.version <= current:
+				continue
+			started = time.perf_counter()
+			print(f"Migration {migration.version} ({migration.name}) uygulaniyor...")
+			try:
+				applied = migration.apply()
+			except Exception:
+				logger.exception("Migration %s (%s) hata verdi", migration.version, migration.name)
+				applied = False
+			if not applied:
+				logger.error(
+					"Migration %s (%s) başarısız; şema sürümü %s olarak kaldı, sonraki açılışta yeniden denenecek",
+					migration.version,
+					migration.name,
+					current,
+				)
+				break
+			_write_schema_version(migration.version)
+			current = migration.version
+			logger.info(
+				"Migration %s (%s) %.2fs",
+				migration.version,
+				migration.name,
+				time.perf_counter() - started,
+			)
+	return current
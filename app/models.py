@@ -1,8 +1,13 @@
 from datetime import datetime, date, time
-from sqlalchemy import Column, Integer, String, Date, DateTime, Time, ForeignKey, Numeric, Text, UniqueConstraint, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, Time, ForeignKey, Numeric, Text, UniqueConstraint, Boolean, Index, event
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from .db import Base
+from .name_search import name_search_keys
+
+# Ad arama anahtarları zaten küçük harf; SQLite'ta NOCASE harmanlaması LIKE 'abc%' önekinin
+# indeksle çözülmesini sağlar (PostgreSQL'de indeks text_pattern_ops ile kurulur)
+NameSearchKey = String(200).with_variant(String(200, collation="NOCASE"), "sqlite")
 
 
 class User(Base):
@@ -19,6 +24,11 @@ class User(Base):
 
 class Student(Base):
 	__tablename__ = "students"
+	__table_args__ = (
+		Index("ix_students_search_first", "search_first_token", postgresql_ops={"search_first_token": "text_pattern_ops"}),
+		Index("ix_students_search_last", "search_last_token", postgresql_ops={"search_last_token": "text_pattern_ops"}),
+		Index("ix_students_search_full", "search_full_name", postgresql_ops={"search_full_name": "text_pattern_ops"}),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
 	first_name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -31,10 +41,23 @@ class Student(Base):
 	phone_secondary: Mapped[str | None] = mapped_column(String(50), nullable=True)
 	is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
 	created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+	# Ad filtresi için Türkçe katlanmış anahtarlar (name_search.name_search_keys); kayıtta otomatik dolar
+	search_first_token: Mapped[str] = mapped_column(NameSearchKey, nullable=False, default="", server_default="")
+	search_last_token: Mapped[str] = mapped_column(NameSearchKey, nullable=False, default="", server_default="")
+	search_full_name: Mapped[str] = mapped_column(NameSearchKey, nullable=False, default="", server_default="")
 
 	enrollments = relationship("Enrollment", back_populates="student", cascade="all, delete-orphan")
 	payments = relationship("Payment", back_populates="student", cascade="all, delete-orphan")
 	teacher_link = relationship("TeacherStudent", back_populates="student", uselist=False, cascade="all, delete-orphan")
+	financial_state = relationship("StudentFinancialState", back_populates="student", uselist=False, cascade="all, delete-orphan")
+
+
+@event.listens_for(Student, "before_insert")
+@event.listens_for(Student, "before_update")
+def _fill_student_name_search_keys(mapper, connection, target: Student) -> None:
+	target.search_first_token, target.search_last_token, target.search_full_name = name_search_keys(
+		target.first_name, target.last_name
+	)
 
 
 class Teacher(Base):
@@ -81,6 +104,9 @@ class Enrollment(Base):
 
 class Lesson(Base):
 	__tablename__ = "lessons"
+	__table_args__ = (
+		Index("ix_lessons_teacher_date", "teacher_id", "lesson_date"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
 	course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"), nullable=False)
@@ -102,6 +128,11 @@ class Attendance(Base):
 	__tablename__ = "attendances"
 	# Unique constraint kaldırıldı - aynı ders ve öğrenci için birden fazla yoklama kaydı olabilir
 	# lesson_id RESTRICT: Ders silinirken yoklama varsa DB silmeyi reddeder; yoklamaların kendiliğinden silinmesi önlenir
+	__table_args__ = (
+		Index("ix_attendances_student_status", "student_id", "status"),
+		Index("ix_attendances_lesson_marked_at", "lesson_id", "marked_at"),
+		Index("ix_attendances_marked_at", "marked_at"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
 	lesson_id: Mapped[int] = mapped_column(ForeignKey("lessons.id", ondelete="RESTRICT"), nullable=False)
@@ -115,6 +146,10 @@ class Attendance(Base):
 
 class Payment(Base):
 	__tablename__ = "payments"
+	__table_args__ = (
+		Index("ix_payments_student_date", "student_id", "payment_date"),
+		Index("ix_payments_date_method", "payment_date", "method"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
 	student_id: Mapped[int] = mapped_column(ForeignKey("students.id", ondelete="CASCADE"), nullable=False)
@@ -127,6 +162,44 @@ class Payment(Base):
 	student = relationship("Student", back_populates="payments")
 
 
+class StudentFinancialState(Base):
+	"""Öğrenci başına ödeme durumu özeti (yoklama/ödeme yazımlarında güncellenir)."""
+	__tablename__ = "student_financial_state"
+
+	student_id: Mapped[int] = mapped_column(ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+	lessons_consumed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # PRESENT + TELAFI + UNEXCUSED_ABSENT
+	packages_paid: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # ödeme sayısı (1 ödeme = 1 paket)
+	last_payment_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+	payment_status_class: Mapped[str] = mapped_column(String(20), nullable=False, index=True)  # needs_payment, waiting, paid
+	updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+	student = relationship("Student", back_populates="financial_state")
+
+
+class PaymentLessonAllocation(Base):
+	"""
+	Ödeme → ders paket defteri. Her ödeme PACKAGE_LESSON_SIZE satırdır (sequence 1..4);
+	attendance_id sayılan yoklamayı, NULL ise henüz kullanılmamış (ön ödeme) slotu gösterir.
+	Yoklama/ödeme yazımlarında öğrenci bazında güncellenir.
+	"""
+	__tablename__ = "payment_lesson_allocations"
+	__table_args__ = (
+		UniqueConstraint("payment_id", "sequence", name="uq_payment_allocation_slot"),
+		Index("ix_payment_allocations_student", "student_id"),
+		Index("ix_payment_allocations_attendance", "attendance_id"),
+		Index("ix_payment_allocations_lesson_date", "lesson_date"),
+	)
+
+	id: Mapped[int] = mapped_column(Integer, primary_key=True)
+	student_id: Mapped[int] = mapped_column(ForeignKey("students.id", ondelete="CASCADE"), nullable=False)
+	payment_id: Mapped[int] = mapped_column(ForeignKey("payments.id", ondelete="CASCADE"), nullable=False)
+	package_index: Mapped[int] = mapped_column(Integer, nullable=False)  # öğrencinin kaçıncı paketi (1..)
+	sequence: Mapped[int] = mapped_column(Integer, nullable=False)  # paket içindeki ders sırası (1..4)
+	attendance_id: Mapped[int | None] = mapped_column(ForeignKey("attendances.id", ondelete="CASCADE"), nullable=True)
+	lesson_date: Mapped[date | None] = mapped_column(Date, nullable=True)  # yoklamanın marked_at günü
+	amount_share: Mapped[float] = mapped_column(Numeric(12, 4), nullable=False)
+
+
 class Invoice(Base):
     __tablename__ = "invoices"
 
@@ -143,6 +216,7 @@ class TeacherStudent(Base):
 	__tablename__ = "teacher_students"
 	__table_args__ = (
 		UniqueConstraint("student_id", name="uq_teacher_student_student"),
+		Index("ix_teacher_students_teacher", "teacher_id"),
 	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -158,6 +232,7 @@ class LessonStudent(Base):
 	__tablename__ = "lesson_students"
 	__table_args__ = (
 		UniqueConstraint("lesson_id", "student_id", name="uq_lesson_student"),
+		Index("ix_lesson_students_student", "student_id"),
 	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -172,6 +247,9 @@ class LessonStudent(Base):
 class Expense(Base):
 	"""İşletme giderleri (kira, fatura vb.) — admin Finans modülü"""
 	__tablename__ = "expenses"
+	__table_args__ = (
+		Index("ix_expenses_date_category", "expense_date", "category"),
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True)
 	title: Mapped[str] = mapped_column(String(120), nullable=False)
@@ -183,6 +261,27 @@ class Expense(Base):
 	created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class FinanceDailyRollup(Base):
+	"""
+	Günlük finans özeti. kind='payment': (gün, yöntem, öğretmen) tahsilat toplamı;
+	kind='expense': (gün, yöntem, kategori) gider toplamı. Ödeme/gider yazımlarında
+	etkilenen günler ham tablolardan yeniden yazılır.
+	"""
+	__tablename__ = "finance_daily_rollup"
+	__table_args__ = (
+		Index("ix_finance_daily_rollup_kind_day", "kind", "day"),
+	)
+
+	id: Mapped[int] = mapped_column(Integer, primary_key=True)
+	day: Mapped[date | None] = mapped_column(Date, nullable=True)
+	kind: Mapped[str] = mapped_column(String(10), nullable=False)  # payment, expense
+	method: Mapped[str | None] = mapped_column(String(30), nullable=True)
+	teacher_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # TeacherStudent üzerinden; None = Atanmamış
+	category: Mapped[str | None] = mapped_column(String(40), nullable=True)
+	amount_try: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+	row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class PushSubscription(Base):
 	"""Admin cihaz Web Push abonelikleri (staff nakit tahsilat bildirimi)."""
 	__tablename__ = "push_subscriptions"
@@ -197,4 +296,29 @@ class PushSubscription(Base):
 	updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class PushOutbox(Base):
+	"""
+	Gönderilecek Web Push bildirimleri; abonelik başına bir satır. Ödemeyle aynı
+	transaction'da yazılır, push_notify gönderici havuzu boşaltır.
+	status: pending (gönderilecek / yeniden denenecek), sent, failed (deneme sınırı doldu),
+	gone (abonelik 404/410 döndü ya da silindi).
+	"""
+	__tablename__ = "push_outbox"
+	__table_args__ = (
+		Index("ix_push_outbox_status_next_attempt", "status", "next_attempt_at"),
+	)
+
+	id: Mapped[int] = mapped_column(Integer, primary_key=True)
+	subscription_id: Mapped[int] = mapped_column(ForeignKey("push_subscriptions.id", ondelete="CASCADE"), nullable=False)
+	payload: Mapped[str] = mapped_column(Text, nullable=False)  # JSON
+	status: Mapped[str] = mapped_column(String(10), nullable=False, default="pending")
+	# Aynı anahtarlı, aynı pencerede bekleyen satırlar tek özet bildirim olarak gönderilir
+	digest_key: Mapped[str | None] = mapped_column(String(20), nullable=True)
+	attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+	next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+	created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+	sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+	last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
 
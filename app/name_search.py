@@ -0,0 +1,43 @@
+"""Ad aramaları için Türkçe büyük/küçük harf katlama ve öğrenci ad anahtarları.
+
+students tablosundaki search_first_token / search_last_token / search_full_name
+kolonları buradaki kurallarla doldurulur (models.Student kayıt/güncelleme
+olayları); SQL'deki önek filtresi ve Python tarafındaki eşleştirme aynı
+anahtarları kullandığı için sonuçları birebir aynıdır.
+"""
+from __future__ import annotations
+
+# str.lower() 'I' harfini 'i', 'İ' harfini 'i̇' (i + birleşik nokta) yapar; Türkçede I→ı, İ→i
+_TURKISH_UPPER = str.maketrans({"I": "ı", "İ": "i"})
+
+# Türkçe klavyesiz yazımlar için (ışık -> isik); yalnızca arama dizininde kullanılır
+_TURKISH_DIACRITICS = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+
+NAME_PREFIX_LENGTH = 3
+
+
+def turkish_casefold(value: str | None) -> str:
+	"""Türkçe kurallarla küçük harf; baştaki/sondaki boşluk atılır, ara boşluklar teklenir."""
+	return " ".join((value or "").translate(_TURKISH_UPPER).lower().split())
+
+
+def ascii_fold(value: str | None) -> str:
+	"""turkish_casefold + Türkçe harflerin ASCII karşılıkları ('Işıklı' -> 'isikli')."""
+	return turkish_casefold(value).translate(_TURKISH_DIACRITICS)
+
+
+def name_search_keys(first_name: str | None, last_name: str | None) -> tuple[str, str, str]:
+	"""(ilk kelime, son kelime, tam ad); tek kelimelik adlarda son kelime boştur."""
+	full_name = turkish_casefold(f"{first_name or ''} {last_name or ''}")
+	parts = full_name.split()
+	first = parts[0] if parts else ""
+	last = parts[-1] if len(parts) > 1 else ""
+	return first, last, full_name
+
+
+def name_search_prefix(term: str | None) -> str | None:
+	"""Aranan metnin ilk 3 harfi (katlanmış); 3 harften kısa aramalarda None."""
+	term = turkish_casefold(term)
+	if len(term) < NAME_PREFIX_LENGTH:
+		return None
+	return term[:NAME_PREFIX_LENGTH]
@@ -1,6 +1,14 @@
 """Web Push bildirimleri — nakit tahsilat → admin cihazları.
 
-Ödeme kaydını bozmaz: gönderim hataları yutulur, abonelik 410 ise silinir.
+Ödeme kaydını bozmaz: bildirimler ödemeyle aynı transaction'da push_outbox tablosuna
+(abonelik başına bir satır) yazılır ve sabit boyutlu bir gönderici havuzu tarafından
+gönderilir. Süreç yeniden başlasa da bekleyen bildirimler kaybolmaz. Geçici hatalar
+(ağ, 429, 5xx) üstel geri çekilmeyle yeniden denenir; 404/410 dönen abonelikler
+toplu silinir.
+
+Birden fazla worker süreci aynı tabloyu boşaltabilir: satırlar koşullu UPDATE ile
+kiralanır (next_attempt_at ileri alınır), kiralayan süreç çökerse satır kira süresi
+dolunca yeniden gönderilir.
 """
 from __future__ import annotations
 
@@ -9,9 +17,14 @@ import json
 import logging
 import os
 import threading
-from typing import Any
-
-from sqlalchemy import or_, text
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+from urllib.parse import urlsplit
+
+from sqlalchemy import delete, func, or_, select, text, update
 from sqlalchemy.orm import Session
 
 from . import models
@@ -21,18 +34,40 @@ logger = logging.getLogger(__name__)
 
 _VAPID_CACHE: dict[str, str] | None = None
 
+# Gönderici havuzu (worker süreci başına); 0 = bu süreçte gönderici çalışmaz.
+# Bir bildirimin abonelikleri bu kadar eşzamanlı istekle gönderilir.
+PUSH_SENDER_WORKERS = int(os.getenv("PUSH_SENDER_WORKERS", "8"))
+PUSH_POLL_SECONDS = float(os.getenv("PUSH_POLL_SECONDS", "15"))
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", "6"))
+PUSH_RETRY_BASE_SECONDS = float(os.getenv("PUSH_RETRY_BASE_SECONDS", "30"))
+PUSH_RETRY_MAX_SECONDS = 3600
+# Kiralanan satır bu süre içinde sonuçlanmazsa (süreç çöktü) yeniden gönderilir
+PUSH_LEASE_SECONDS = 120
+PUSH_BATCH_SIZE = 50
+PUSH_OUTBOX_RETENTION_DAYS = 7
+PUSH_TTL_SECONDS = 86400
+# Tahsilat bildirimleri bu pencerede bekletilir; pencerede biriken ödemeler cihaz başına
+# tek özet bildirim olarak gider (0 = birleştirme kapalı, her ödeme hemen gönderilir)
+PUSH_DIGEST_WINDOW_SECONDS = float(os.getenv("PUSH_DIGEST_WINDOW_SECONDS", "15"))
+DIGEST_CASH = "cash"
+DIGEST_TAG = "pay-digest"
+PUSH_HTTP_TIMEOUT_SECONDS = 10
+# İmzalı VAPID JWT ömrü (push servisleri en fazla 24 saat kabul eder) ve yenileme payı
+VAPID_JWT_TTL_SECONDS = 12 * 60 * 60
+VAPID_JWT_REFRESH_MARGIN_SECONDS = 10 * 60
+
 
 def _b64url(data: bytes) -> str:
 	return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
 
 
-def ensure_push_subscriptions_table() -> None:
+def ensure_push_subscriptions_table() -> bool:
 	try:
 		from sqlalchemy import inspect
 
 		inspector = inspect(engine)
 		if "push_subscriptions" in set(inspector.get_table_names()):
-			return
+			return True
 		print("push_subscriptions tablosu bulunamadi, olusturuluyor...")
 		is_pg = "postgres" in str(engine.url).lower()
 		ddl = """
@@ -63,16 +98,19 @@ def ensure_push_subscriptions_table() -> None:
 			db.execute(text(ddl))
 			db.commit()
 			print("push_subscriptions tablosu olusturuldu")
+			return True
 		except Exception as e:
 			db.rollback()
 			print(f"push_subscriptions tablo olusturma: {e}")
+			return False
 		finally:
 			db.close()
 	except Exception as e:
 		print(f"push_subscriptions tablo kontrol hatasi: {e}")
+		return False
 
 
-def ensure_vapid_meta_table() -> None:
+def ensure_vapid_meta_table() -> bool:
 	"""VAPID anahtarları için TEXT değerli meta tablosu."""
 	try:
 		db = SessionLocal()
@@ -86,13 +124,49 @@ def ensure_vapid_meta_table() -> None:
 				)
 			"""))
 			db.commit()
+			return True
 		except Exception as e:
 			db.rollback()
 			print(f"push_vapid_keys tablo: {e}")
+			return False
 		finally:
 			db.close()
 	except Exception as e:
 		print(f"push_vapid_keys kontrol: {e}")
+		return False
+
+
+def ensure_push_outbox_table() -> bool:
+	try:
+		from sqlalchemy import inspect
+
+		if "push_outbox" in set(inspect(engine).get_table_names()):
+			return True
+		print("push_outbox tablosu bulunamadi, olusturuluyor...")
+		from .db import Base
+
+		Base.metadata.create_all(bind=engine, tables=[models.PushOutbox.__table__])
+		return True
+	except Exception as e:
+		print(f"push_outbox tablo kontrol hatasi: {e}")
+		return False
+
+
+def ensure_push_outbox_digest_column() -> bool:
+	"""push_outbox.digest_key kolonu (özet bildirim birleştirme anahtarı)."""
+	try:
+		from sqlalchemy import inspect
+
+		inspector = inspect(engine)
+		if "digest_key" in {col["name"] for col in inspector.get_columns("push_outbox")}:
+			return True
+		print("push_outbox.digest_key kolonu ekleniyor...")
+		with engine.begin() as conn:
+			conn.execute(text("ALTER TABLE push_outbox ADD COLUMN digest_key VARCHAR(20)"))
+		return True
+	except Exception as e:
+		print(f"push_outbox.digest_key kolon hatasi: {e}")
+		return False
 
 
 def _generate_vapid_keypair() -> tuple[str, str]:
@@ -296,44 +370,173 @@ def payment_method_label(method: str | None) -> str:
 	return (method or "Ödeme").strip() or "Ödeme"
 
 
-def _send_one(subscription: models.PushSubscription, payload: dict[str, Any], private_key: str | Any) -> tuple[bool, str | None]:
-	"""(keep_subscription, error_message). keep=False → abonelik silinmeli."""
+_signers: dict[str, Any] = {}
+# (push servisi origin'i, sub) -> (Authorization/Crypto-Key başlıkları, exp)
+_vapid_headers: dict[tuple[str, str], tuple[dict[str, str], int]] = {}
+_vapid_lock = threading.Lock()
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _vapid_signer(private_key: str | Any):
+	"""Anahtar bir kez ayrıştırılır; Vapid nesnesi verilmişse olduğu gibi kullanılır."""
+	if not isinstance(private_key, str):
+		return private_key
+	signer = _signers.get(private_key)
+	if signer is None:
+		from py_vapid import Vapid
+
+		signer = _signers[private_key] = Vapid.from_string(private_key=private_key)
+	return signer
+
+
+def vapid_headers(endpoint: str, private_key: str | Any) -> dict[str, str]:
+	"""
+	Push servisi origin'i (aud) için imzalı VAPID başlıkları. JWT süresi dolmadan
+	VAPID_JWT_REFRESH_MARGIN_SECONDS öncesine kadar önbellekten döner; her abonelik
+	için yeniden ECDSA imzası atılmaz.
+	"""
+	parts = urlsplit(endpoint)
+	audience = f"{parts.scheme}://{parts.netloc}"
+	sub = vapid_claims()["sub"]
+	key = (audience, sub)
+	now = int(time.time())
+	with _vapid_lock:
+		cached = _vapid_headers.get(key)
+		if cached and cached[1] - VAPID_JWT_REFRESH_MARGIN_SECONDS > now:
+			return cached[0]
+		exp = now + VAPID_JWT_TTL_SECONDS
+		headers = _vapid_signer(private_key).sign({"aud": audience, "exp": exp, "sub": sub})
+		_vapid_headers[key] = (headers, exp)
+		return headers
+
+
+def _get_http_session():
+	"""Gönderici thread'lerinin paylaştığı bağlantı havuzlu requests oturumu."""
+	global _http_session
+	if _http_session is None:
+		with _http_session_lock:
+			if _http_session is None:
+				import requests
+				from requests.adapters import HTTPAdapter
+
+				session = requests.Session()
+				pool_size = max(PUSH_SENDER_WORKERS, 1)
+				adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+				session.mount("https://", adapter)
+				session.mount("http://", adapter)
+				_http_session = session
+	return _http_session
+
+
+def _deliver(endpoint: str, p256dh: str, auth: str, payload: str, private_key: str | Any) -> tuple[int | None, str | None]:
+	"""Tek uç noktaya gönderim: (HTTP durumu, hata mesajı); başarıda hata None."""
 	try:
-		from pywebpush import webpush
+		from pywebpush import WebPusher
 	except ImportError:
 		logger.error("pywebpush yüklü değil; push atlandı")
 		print("PUSH_ERROR: pywebpush yüklü değil")
-		return True, "pywebpush yüklü değil"
+		return None, "pywebpush yüklü değil"
 
 	try:
-		claims = vapid_claims()
-		webpush(
-			subscription_info={
-				"endpoint": subscription.endpoint,
-				"keys": {"p256dh": subscription.p256dh, "auth": subscription.auth},
-			},
-			data=json.dumps(payload, ensure_ascii=False),
-			vapid_private_key=private_key,
-			vapid_claims=claims,
-			ttl=86400,
+		response = WebPusher(
+			{"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}},
+			requests_session=_get_http_session(),
+		).send(
+			payload,
+			headers=dict(vapid_headers(endpoint, private_key)),
+			ttl=PUSH_TTL_SECONDS,
+			timeout=PUSH_HTTP_TIMEOUT_SECONDS,
 		)
-		print(f"PUSH_OK endpoint={subscription.endpoint[:48]}… sub={claims.get('sub')}")
-		return True, None
 	except Exception as e:
-		status = getattr(getattr(e, "response", None), "status_code", None)
-		body = ""
-		try:
-			resp = getattr(e, "response", None)
-			if resp is not None and getattr(resp, "text", None):
-				body = (resp.text or "")[:300]
-		except Exception:
-			pass
-		err = f"status={status} err={e} body={body}"
+		err = f"status=None err={e}"
+		print(f"PUSH_FAIL {err}")
+		logger.warning("Push gönderilemedi: %s", err)
+		return None, err
+	status = response.status_code
+	if status > 202:
+		err = f"status={status} err={response.reason} body={(response.text or '')[:300]}"
 		print(f"PUSH_FAIL {err}")
 		logger.warning("Push gönderilemedi: %s", err)
-		if status in (404, 410):
-			return False, err
-		return True, err
+		return status, err
+	print(f"PUSH_OK endpoint={endpoint[:48]}… status={status}")
+	return status, None
+
+
+def _map_concurrently(fn, items: list) -> list:
+	"""Bir bildirimin aboneliklerine eşzamanlı gönderim; çalışan gönderici havuzu varsa o kullanılır."""
+	if len(items) <= 1:
+		return [fn(item) for item in items]
+	sender = _sender
+	if sender is not None:
+		return list(sender.executor.map(fn, items))
+	with ThreadPoolExecutor(max_workers=min(len(items), max(PUSH_SENDER_WORKERS, 1))) as executor:
+		return list(executor.map(fn, items))
+
+
+def _send_one(subscription: models.PushSubscription, payload: dict[str, Any], private_key: str | Any) -> tuple[bool, str | None]:
+	"""(keep_subscription, error_message). keep=False → abonelik silinmeli."""
+	status, err = _deliver(
+		subscription.endpoint,
+		subscription.p256dh,
+		subscription.auth,
+		json.dumps(payload, ensure_ascii=False),
+		private_key,
+	)
+	return status not in (404, 410), err
+
+
+def cash_notify_payload(
+	*,
+	student_name: str,
+	amount_try: float,
+	staff_name: str,
+	payment_id: int | None = None,
+	method: str | None = None,
+) -> dict[str, Any]:
+	method_label = payment_method_label(method) if method else "Nakit"
+	return {
+		"title": f"{method_label} tahsilat",
+		"body": f"{staff_name}: {student_name} — {amount_try:.2f} ₺",
+		"url": "/ui/finance/income",
+		"tag": f"pay-{payment_id}" if payment_id else "payment",
+		# Özet bildirim için; cihaza gönderilmez
+		"digest": {"student": student_name, "amount_try": float(amount_try), "method": method_label},
+	}
+
+
+def format_try(amount: float) -> str:
+	"""Türkçe tutar: 3200 -> '3.200 ₺', 1250.5 -> '1.250,50 ₺'."""
+	whole = round(amount, 2) == int(amount)
+	text_value = f"{amount:,.0f}" if whole else f"{amount:,.2f}"
+	return text_value.replace(",", "_").replace(".", ",").replace("_", ".") + " ₺"
+
+
+def digest_payload(payloads: list[dict[str, Any]]) -> dict[str, Any]:
+	"""
+	Pencerede biriken tahsilat bildirimlerini tek bildirime indirger ("5 tahsilat — 3.200 ₺").
+	Sabit tag sayesinde cihaz önceki özeti değiştirir, üst üste yığmaz.
+	"""
+	items = [p.get("digest") or {} for p in payloads]
+	total = sum(float(item.get("amount_try") or 0) for item in items)
+	methods = sorted({item.get("method") for item in items if item.get("method")})
+	latest = [f"{item.get('student')} {format_try(float(item.get('amount_try') or 0))}" for item in items[-3:]]
+	body = ", ".join(reversed(latest))
+	if len(items) > 3:
+		body += f" ve {len(items) - 3} diğer"
+	return {
+		"title": f"{len(items)} tahsilat — {format_try(total)}",
+		"body": f"{' / '.join(methods)}: {body}" if methods else body,
+		"url": "/ui/finance/income",
+		"tag": DIGEST_TAG,
+	}
+
+
+def _wire_payload(payloads: list[dict[str, Any]]) -> str:
+	"""Cihaza gidecek JSON; birden fazla kayıt özet bildirime dönüşür."""
+	payload = digest_payload(payloads) if len(payloads) > 1 else dict(payloads[0])
+	payload.pop("digest", None)
+	return json.dumps(payload, ensure_ascii=False)
 
 
 def notify_admins_staff_cash(
@@ -361,12 +564,13 @@ def notify_admins_staff_cash(
 	_, private_key = keys
 	result["vapid_sub"] = vapid_claims().get("sub")
 	method_label = payment_method_label(method) if method else "Nakit"
-	payload = {
-		"title": f"{method_label} tahsilat",
-		"body": f"{staff_name}: {student_name} — {amount_try:.2f} ₺",
-		"url": "/ui/finance/income",
-		"tag": f"pay-{payment_id}" if payment_id else "payment",
-	}
+	payload = cash_notify_payload(
+		student_name=student_name,
+		amount_try=amount_try,
+		staff_name=staff_name,
+		payment_id=payment_id,
+		method=method,
+	)
 	db = SessionLocal()
 	try:
 		subs = list_admin_subscriptions(db)
@@ -378,8 +582,8 @@ def notify_admins_staff_cash(
 			print("PUSH_SKIP: admin aboneliği yok")
 			return result
 		stale_ids: list[int] = []
-		for sub in subs:
-			keep, err = _send_one(sub, payload, private_key)
+		results = _map_concurrently(lambda sub: _send_one(sub, payload, private_key), subs)
+		for sub, (keep, err) in zip(subs, results):
 			if err:
 				result["failed"] += 1
 				result["errors"].append(err)
@@ -406,23 +610,374 @@ def notify_admins_staff_cash(
 	return result
 
 
-def schedule_admin_cash_notify(
+def _open_digest_windows(db: Session, digest_key: str, subscription_ids: list[int], now: datetime) -> dict[int, datetime]:
+	"""Abonelik -> henüz gönderilmemiş (hiç denenmemiş) özet penceresinin gönderim zamanı."""
+	if not subscription_ids:
+		return {}
+	return dict(db.execute(
+		select(models.PushOutbox.subscription_id, func.min(models.PushOutbox.next_attempt_at))
+		.where(
+			models.PushOutbox.subscription_id.in_(subscription_ids),
+			models.PushOutbox.digest_key == digest_key,
+			models.PushOutbox.status == "pending",
+			models.PushOutbox.attempts == 0,
+			models.PushOutbox.next_attempt_at > now,
+		)
+		.group_by(models.PushOutbox.subscription_id)
+	).all())
+
+
+def enqueue_admin_notification(db: Session, payload: dict[str, Any], *, digest_key: str | None = None) -> int:
+	"""
+	Her admin aboneliği için bir push_outbox satırı ekler. Commit yapmaz: çağıranın
+	transaction'ıyla (ör. ödeme) birlikte kalıcı olur; commit sonrası wake_push_sender().
+	digest_key verilirse satır açık pencereye katılır (yoksa PUSH_DIGEST_WINDOW_SECONDS
+	sonrası için yeni pencere açar); aynı pencerenin satırları tek bildirim olarak gider.
+	"""
+	subscription_ids = [sub.id for sub in list_admin_subscriptions(db)]
+	body = json.dumps(payload, ensure_ascii=False)
+	now = datetime.utcnow()
+	if digest_key and PUSH_DIGEST_WINDOW_SECONDS > 0:
+		windows = _open_digest_windows(db, digest_key, subscription_ids, now)
+		window_end = now + timedelta(seconds=PUSH_DIGEST_WINDOW_SECONDS)
+	else:
+		digest_key, windows, window_end = None, {}, now
+	db.add_all(
+		models.PushOutbox(
+			subscription_id=sid,
+			payload=body,
+			digest_key=digest_key,
+			next_attempt_at=windows.get(sid, window_end),
+			created_at=now,
+		)
+		for sid in subscription_ids
+	)
+	return len(subscription_ids)
+
+
+def enqueue_admin_cash_notify(
+	db: Session,
 	*,
 	student_name: str,
 	amount_try: float,
 	staff_name: str,
 	payment_id: int | None = None,
 	method: str | None = None,
-) -> None:
-	"""Ödeme yanıtından bağımsız thread."""
-	threading.Thread(
-		target=notify_admins_staff_cash,
-		kwargs={
-			"student_name": student_name,
-			"amount_try": amount_try,
-			"staff_name": staff_name,
-			"payment_id": payment_id,
-			"method": method,
-		},
-		daemon=True,
-	).start()
+) -> int:
+	"""Tahsilat bildirimini outbox'a yazar (commit yapmaz)."""
+	count = enqueue_admin_notification(db, cash_notify_payload(
+		student_name=student_name,
+		amount_try=amount_try,
+		staff_name=staff_name,
+		payment_id=payment_id,
+		method=method,
+	), digest_key=DIGEST_CASH)
+	print(f"PUSH_ENQUEUE count={count} method={payment_method_label(method)} student={student_name!r} by={staff_name!r}")
+	return count
+
+
+class _OutboxJob(NamedTuple):
+	id: int
+	subscription_id: int
+	endpoint: str | None
+	p256dh: str | None
+	auth: str | None
+	payload: str
+	attempts: int
+	created_at: datetime | None
+	digest_key: str | None
+
+
+class _Outcome(NamedTuple):
+	jobs: list[_OutboxJob]  # özet bildirimde pencerenin tüm satırları
+	status: int | None
+	error: str | None
+	seconds: float
+
+
+def retry_delay_seconds(attempts: int) -> float:
+	"""attempts. denemeden sonra bekleme: 30 s, 60 s, 120 s, ... (en fazla 1 saat)."""
+	return min(PUSH_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), PUSH_RETRY_MAX_SECONDS)
+
+
+def _is_retryable(status: int | None) -> bool:
+	return status is None or status == 429 or status >= 500
+
+
+_stats_lock = threading.Lock()
+_counters = {"sent": 0, "retried": 0, "failed": 0, "gone": 0, "cleaned_subscriptions": 0, "coalesced": 0}
+# Son gönderimlerin kuyrukta bekleme (oluşturma → gönderim) ve gönderim süreleri
+_queue_latencies: deque[float] = deque(maxlen=500)
+_send_durations: deque[float] = deque(maxlen=500)
+
+
+def _claim_jobs(db: Session, limit: int) -> list[_OutboxJob]:
+	"""Vadesi gelen satırları kiralar; aynı satırı iki süreç alamaz (koşullu UPDATE)."""
+	now = datetime.utcnow()
+	due_ids = db.scalars(
+		select(models.PushOutbox.id)
+		.where(models.PushOutbox.status == "pending", models.PushOutbox.next_attempt_at <= now)
+		.order_by(models.PushOutbox.next_attempt_at, models.PushOutbox.id)
+		.limit(limit)
+	).all()
+	if not due_ids:
+		return []
+	claimed_ids = db.scalars(
+		update(models.PushOutbox)
+		.where(
+			models.PushOutbox.id.in_(due_ids),
+			models.PushOutbox.status == "pending",
+			models.PushOutbox.next_attempt_at <= now,
+		)
+		.values(
+			next_attempt_at=now + timedelta(seconds=PUSH_LEASE_SECONDS),
+			attempts=models.PushOutbox.attempts + 1,
+		)
+		.returning(models.PushOutbox.id)
+		.execution_options(synchronize_session=False)
+	).all()
+	db.commit()
+	if not claimed_ids:
+		return []
+	rows = db.execute(
+		select(
+			models.PushOutbox.id,
+			models.PushOutbox.subscription_id,
+			models.PushSubscription.endpoint,
+			models.PushSubscription.p256dh,
+			models.PushSubscription.auth,
+			models.PushOutbox.payload,
+			models.PushOutbox.attempts,
+			models.PushOutbox.created_at,
+			models.PushOutbox.digest_key,
+		)
+		.outerjoin(models.PushSubscription, models.PushSubscription.id == models.PushOutbox.subscription_id)
+		.where(models.PushOutbox.id.in_(claimed_ids))
+		.order_by(models.PushOutbox.id)
+	).all()
+	return [_OutboxJob(*row) for row in rows]
+
+
+def _group_jobs(jobs: list[_OutboxJob]) -> list[list[_OutboxJob]]:
+	"""Aynı aboneliğin aynı özet anahtarlı satırları tek gönderim; diğerleri tek tek."""
+	groups: dict[tuple, list[_OutboxJob]] = {}
+	for job in jobs:
+		key = (job.subscription_id, job.digest_key) if job.digest_key else ("job", job.id)
+		groups.setdefault(key, []).append(job)
+	return list(groups.values())
+
+
+def _send_group(jobs: list[_OutboxJob], private_key: str | Any) -> _Outcome:
+	first = jobs[0]
+	if first.endpoint is None:
+		# Abonelik gönderimden önce silinmiş
+		return _Outcome(jobs, 410, "abonelik yok", 0.0)
+	started = time.monotonic()
+	payload = _wire_payload([json.loads(job.payload) for job in jobs])
+	status, err = _deliver(first.endpoint, first.p256dh, first.auth, payload, private_key)
+	return _Outcome(jobs, status, err, time.monotonic() - started)
+
+
+def _record_outcomes(db: Session, outcomes: list[_Outcome]) -> None:
+	"""Sonuçları toplu yazar; 404/410 abonelikleri tek sorguda silinir."""
+	now = datetime.utcnow()
+	sent_ids, gone_ids, updates = [], [], []
+	gone_subscription_ids = set()
+	retried = failed = coalesced = 0
+	for outcome in outcomes:
+		jobs = outcome.jobs
+		# Özetin satırları birlikte yeniden denenir (aynı pencerede kalır)
+		attempts = max(job.attempts for job in jobs)
+		if outcome.error is None:
+			sent_ids.extend(job.id for job in jobs)
+			coalesced += len(jobs) - 1
+			with _stats_lock:
+				_queue_latencies.extend((now - job.created_at).total_seconds() for job in jobs if job.created_at)
+				_send_durations.append(outcome.seconds)
+		elif outcome.status in (404, 410):
+			gone_ids.extend(job.id for job in jobs)
+			gone_subscription_ids.add(jobs[0].subscription_id)
+		elif _is_retryable(outcome.status) and attempts < PUSH_MAX_ATTEMPTS:
+			retried += len(jobs)
+			next_attempt_at = now + timedelta(seconds=retry_delay_seconds(attempts))
+			updates.extend(
+				{"id": job.id, "next_attempt_at": next_attempt_at, "last_error": outcome.error[:1000]}
+				for job in jobs
+			)
+		else:
+			failed += len(jobs)
+			updates.extend({"id": job.id, "status": "failed", "last_error": outcome.error[:1000]} for job in jobs)
+	if sent_ids:
+		db.execute(
+			update(models.PushOutbox)
+			.where(models.PushOutbox.id.in_(sent_ids))
+			.values(status="sent", sent_at=now, last_error=None)
+			.execution_options(synchronize_session=False)
+		)
+	if gone_ids:
+		db.execute(
+			update(models.PushOutbox)
+			.where(models.PushOutbox.id.in_(gone_ids))
+			.values(status="gone")
+			.execution_options(synchronize_session=False)
+		)
+	if updates:
+		db.execute(update(models.PushOutbox), updates)
+	cleaned = 0
+	if gone_subscription_ids:
+		cleaned = db.execute(
+			delete(models.PushSubscription).where(models.PushSubscription.id.in_(gone_subscription_ids))
+		).rowcount or 0
+	db.commit()
+	if cleaned:
+		print(f"PUSH_CLEANED stale={cleaned}")
+	with _stats_lock:
+		_counters["sent"] += len(sent_ids)
+		_counters["gone"] += len(gone_ids)
+		_counters["retried"] += retried
+		_counters["failed"] += failed
+		_counters["cleaned_subscriptions"] += cleaned
+		_counters["coalesced"] += coalesced
+
+
+def drain_push_outbox_once(executor: ThreadPoolExecutor | None = None, limit: int = PUSH_BATCH_SIZE) -> int:
+	"""
+	Vadesi gelen en fazla limit satırı gönderir ve sonuçları yazar; işlenen satır sayısı.
+	executor verilmezse gönderimler sırayla bu thread'de yapılır (betikler / deneme için).
+	"""
+	keys = get_vapid_keys()
+	if not keys:
+		return 0
+	_, private_key = keys
+	db = SessionLocal()
+	try:
+		jobs = _claim_jobs(db, limit)
+	finally:
+		db.close()
+	if not jobs:
+		return 0
+	# Gönderim sırasında veritabanı bağlantısı tutulmaz; abonelikler eşzamanlı gönderilir
+	groups = _group_jobs(jobs)
+	if executor is None:
+		outcomes = [_send_group(group, private_key) for group in groups]
+	else:
+		outcomes = list(executor.map(lambda group: _send_group(group, private_key), groups))
+	db = SessionLocal()
+	try:
+		_record_outcomes(db, outcomes)
+	finally:
+		db.close()
+	return len(jobs)
+
+
+def purge_push_outbox(db: Session, retention_days: int = PUSH_OUTBOX_RETENTION_DAYS) -> int:
+	"""Sonuçlanmış (pending olmayan) eski satırları siler."""
+	cutoff = datetime.utcnow() - timedelta(days=retention_days)
+	deleted = db.execute(
+		delete(models.PushOutbox).where(models.PushOutbox.status != "pending", models.PushOutbox.created_at < cutoff)
+	).rowcount or 0
+	db.commit()
+	return deleted
+
+
+class _PushSender:
+	"""Outbox'ı boşaltan tek dağıtıcı thread ve sabit boyutlu gönderim havuzu."""
+
+	def __init__(self, workers: int):
+		self.workers = workers
+		self.wake = threading.Event()
+		self.stop = threading.Event()
+		self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="push-send")
+		self.thread = threading.Thread(target=self._run, name="push-outbox", daemon=True)
+		self.purged_at = 0.0
+
+	def _run(self) -> None:
+		while not self.stop.is_set():
+			processed = 0
+			try:
+				processed = drain_push_outbox_once(self.executor, PUSH_BATCH_SIZE)
+				if time.monotonic() - self.purged_at > 3600:
+					self.purged_at = time.monotonic()
+					db = SessionLocal()
+					try:
+						purge_push_outbox(db)
+					finally:
+						db.close()
+			except Exception as e:
+				logger.error("Push outbox gönderici hatası: %s", e)
+			if processed < PUSH_BATCH_SIZE:
+				# Kuyruk boşaldı: yeni ödeme (wake) ya da sıradaki yeniden deneme zamanına kadar bekle
+				self.wake.wait(PUSH_POLL_SECONDS)
+				self.wake.clear()
+
+
+_sender: _PushSender | None = None
+_sender_lock = threading.Lock()
+
+
+def start_push_sender(workers: int = PUSH_SENDER_WORKERS) -> bool:
+	global _sender
+	if workers <= 0:
+		return False
+	with _sender_lock:
+		if _sender is None:
+			_sender = _PushSender(workers)
+			_sender.thread.start()
+	return True
+
+
+def stop_push_sender(timeout: float = 5.0) -> None:
+	global _sender
+	with _sender_lock:
+		sender, _sender = _sender, None
+	if sender is None:
+		return
+	sender.stop.set()
+	sender.wake.set()
+	sender.thread.join(timeout)
+	sender.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def wake_push_sender() -> None:
+	"""Outbox'a yazan transaction commit edildikten sonra çağrılır."""
+	sender = _sender
+	if sender is not None:
+		sender.wake.set()
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+	if not values:
+		return None
+	ordered = sorted(values)
+	return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+
+def push_outbox_stats(db: Session) -> dict[str, Any]:
+	"""Kuyruk derinliği (veritabanı, tüm süreçler) ve bu sürecin gönderim sayaçları."""
+	now = datetime.utcnow()
+	by_status = dict(
+		db.execute(select(models.PushOutbox.status, func.count()).group_by(models.PushOutbox.status)).all()
+	)
+	due, oldest_pending = db.execute(
+		select(
+			func.count().filter(models.PushOutbox.next_attempt_at <= now),
+			func.min(models.PushOutbox.created_at),
+		).where(models.PushOutbox.status == "pending")
+	).one()
+	with _stats_lock:
+		latencies = list(_queue_latencies)
+		durations = list(_send_durations)
+		counters = dict(_counters)
+	sender = _sender
+	return {
+		"pending": by_status.get("pending", 0),
+		"due": due or 0,
+		"by_status": by_status,
+		"oldest_pending_seconds": round((now - oldest_pending).total_seconds(), 1) if oldest_pending else None,
+		"queue_latency_p50": _percentile(latencies, 0.5),
+		"queue_latency_p95": _percentile(latencies, 0.95),
+		"send_seconds_p95": _percentile(durations, 0.95),
+		"workers": sender.workers if sender else 0,
+		"running": bool(sender and sender.thread.is_alive()),
+		**counters,
+	}
@@ -0,0 +1,206 @@
+"""Finans/rapor sayfaları için sürümlü sonuç önbelleği.
+
+Anahtar = (rapor adı, normalize parametreler, veri sürümleri). Veri sürümleri
+alan (domain) bazında app_meta tablosunda tutulur ve crud yazma fonksiyonları
+tarafından aynı transaction içinde artırılır; böylece tüm uvicorn worker'ları
+geçersiz kılmayı bir sonraki istekte görür (süreç içi bellek paylaşılmaz,
+yalnızca sayaç okunur). Önbellek boyutu sınırlıdır, en eski kullanılan kayıt
+(LRU) atılır.
+
+Önbellekten dönen değerler paylaşılır; çağıran taraf değiştirmemelidir.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+DOMAIN_PAYMENTS = "payments"
+DOMAIN_EXPENSES = "expenses"
+DOMAIN_ATTENDANCE = "attendance"
+DOMAIN_SCHEDULE = "schedule"  # öğrenci/öğretmen/kurs/ders programı ve atamalar
+DOMAIN_DIRECTORY = "directory"  # öğrenci/öğretmen/kurs adları ve telefonları (arama dizini)
+DOMAINS = (DOMAIN_PAYMENTS, DOMAIN_EXPENSES, DOMAIN_ATTENDANCE, DOMAIN_SCHEDULE, DOMAIN_DIRECTORY)
+
+_VERSION_KEY_PREFIX = "data_version:"
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "128"))
+
+
+def _version_key(domain: str) -> str:
+	return f"{_VERSION_KEY_PREFIX}{domain}"
+
+
+def bump_data_version(db: Session, *domains: str) -> None:
+	"""
+	Verilen alanların sürüm sayacını artırır. Commit yapmaz; yazan crud
+	fonksiyonunun commit'i ile birlikte kalıcı olur.
+	"""
+	for domain in sorted(set(domains)):
+		key = _version_key(domain)
+		updated = db.execute(
+			text("UPDATE app_meta SET value = CAST(CAST(value AS INTEGER) + 1 AS VARCHAR(255)) WHERE key = :k"),
+			{"k": key},
+		).rowcount
+		if not updated:
+			db.execute(text("INSERT INTO app_meta (key, value) VALUES (:k, '1')"), {"k": key})
+
+
+def ensure_data_version_rows() -> bool:
+	"""
+	Her alan için sürüm satırını (değer 0) önceden oluşturur; böylece ilk yazmalar
+	bump_data_version içinde INSERT yarışına girmez.
+	"""
+	from .db import engine
+	with engine.begin() as conn:
+		existing = {
+			row[0]
+			for row in conn.execute(
+				text("SELECT key FROM app_meta WHERE key LIKE :prefix"),
+				{"prefix": f"{_VERSION_KEY_PREFIX}%"},
+			)
+		}
+		for domain in DOMAINS:
+			key = _version_key(domain)
+			if key not in existing:
+				conn.execute(text("INSERT INTO app_meta (key, value) VALUES (:k, '0')"), {"k": key})
+	return True
+
+
+def get_data_versions(db: Session, domains: Iterable[str]) -> tuple[int, ...]:
+	"""Alanların güncel sürümleri (verilen sırada); tek SELECT."""
+	domains = tuple(domains)
+	if not domains:
+		return ()
+	keys = [_version_key(domain) for domain in domains]
+	params = {f"k{i}": key for i, key in enumerate(keys)}
+	placeholders = ", ".join(f":k{i}" for i in range(len(keys)))
+	rows = db.execute(
+		text(f"SELECT key, value FROM app_meta WHERE key IN ({placeholders})"),
+		params,
+	).all()
+	values = {key: value for key, value in rows}
+	out = []
+	for key in keys:
+		try:
+			out.append(int(values.get(key) or 0))
+		except (TypeError, ValueError):
+			out.append(0)
+	return tuple(out)
+
+
+def _normalize_param(value: Any) -> Any:
+	if value is None:
+		return None
+	if isinstance(value, (date, datetime)):
+		return value.isoformat()
+	if isinstance(value, str):
+		value = value.strip()
+		return value or None
+	if isinstance(value, (list, tuple, set, frozenset)):
+		return tuple(sorted(_normalize_param(v) for v in value))
+	return value
+
+
+def normalize_params(params: dict[str, Any] | None) -> tuple:
+	"""Boş string/None eşit sayılır; sıralı (ad, değer) çiftleri döner."""
+	items = []
+	for name, value in sorted((params or {}).items()):
+		normalized = _normalize_param(value)
+		if normalized is None:
+			continue
+		items.append((name, normalized))
+	return tuple(items)
+
+
+class ReportCache:
+	"""İş parçacığı güvenli, boyutu sınırlı LRU önbellek; isabet/ıska sayaçlarıyla."""
+
+	def __init__(self, maxsize: int = REPORT_CACHE_SIZE):
+		self.maxsize = max(0, int(maxsize))
+		self._data: OrderedDict[tuple, Any] = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._report_hits: dict[str, int] = {}
+		self._report_misses: dict[str, int] = {}
+
+	def get(self, key: tuple) -> tuple[bool, Any]:
+		report = key[0]
+		with self._lock:
+			if key in self._data:
+				self._data.move_to_end(key)
+				self.hits += 1
+				self._report_hits[report] = self._report_hits.get(report, 0) + 1
+				return True, self._data[key]
+			self.misses += 1
+			self._report_misses[report] = self._report_misses.get(report, 0) + 1
+			return False, None
+
+	def put(self, key: tuple, value: Any) -> None:
+		if self.maxsize == 0:
+			return
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+				self.evictions += 1
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			lookups = self.hits + self.misses
+			reports = sorted(set(self._report_hits) | set(self._report_misses))
+			return {
+				"size": len(self._data),
+				"maxsize": self.maxsize,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+				"reports": {
+					name: {
+						"hits": self._report_hits.get(name, 0),
+						"misses": self._report_misses.get(name, 0),
+					}
+					for name in reports
+				},
+			}
+
+
+report_cache = ReportCache()
+
+
+def cached_report(
+	db: Session,
+	report: str,
+	params: dict[str, Any] | None,
+	domains: Iterable[str],
+	compute: Callable[[], Any],
+) -> Any:
+	"""
+	(report, params, alan sürümleri) anahtarıyla önbellekten döner; yoksa compute()
+	çalıştırılır ve sonuç saklanır. Sürüm okuması her çağrıda yapılır (tek SELECT),
+	bu yüzden başka worker'daki yazma da önbelleği geçersiz kılar.
+	"""
+	domains = tuple(sorted(set(domains)))
+	key = (report, normalize_params(params), domains, get_data_versions(db, domains))
+	found, value = report_cache.get(key)
+	if found:
+		return value
+	value = compute()
+	report_cache.put(key, value)
+	return value
+
+
+def cache_stats() -> dict:
+	return report_cache.stats()
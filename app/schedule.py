@@ -0,0 +1,246 @@
+"""Haftalık ders programı (dashboard, öğretmen ve personel panelleri).
+
+Tüm öğretmenlerin programı tek sorguda (ders, kurs, öğretmen, öğrenci satırları)
+okunur ve ORM nesnesi taşımayan küçük (slots) dataclass'lara dönüştürülür.
+Aynı öğrencinin aynı gün birden fazla slotta görünmesini engelleyen kural da
+aynı geçişte uygulanır.
+
+Program süreç içinde bir anlık görüntü (snapshot) olarak tutulur; app_meta'daki
+'schedule' veri sürümü (report_cache.DOMAIN_SCHEDULE) değişmedikçe ya da gün
+dönmedikçe yeniden kurulmaz. Görüntü değişmez veriden oluşur, iş parçacıkları
+arasında paylaşılabilir.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from datetime import date, time, timedelta
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .report_cache import DOMAIN_SCHEDULE, get_data_versions
+
+WEEKDAY_NAMES = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cumartesi", "Pazar"]
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleCourse:
+	id: int
+	name: str
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleTeacher:
+	id: int
+	first_name: str
+	last_name: str
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleStudent:
+	id: int
+	first_name: str
+	last_name: str
+	is_active: bool = True
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleLesson:
+	id: int
+	teacher_id: int
+	lesson_date: date
+	start_time: time | None
+	end_time: time | None
+	course: ScheduleCourse
+	teacher: ScheduleTeacher
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleEntry:
+	"""Programdaki tek ders slotu; şablonlar entry.lesson / entry.students / entry.weekday okur."""
+	weekday: str
+	lesson: ScheduleLesson
+	current_lesson_date: date
+	students: tuple[ScheduleStudent, ...]
+
+
+@dataclass(slots=True)
+class WeeklySchedule:
+	"""Öğretmen → haftanın günü (0=Pazartesi) → girişler (kurulduktan sonra değişmez)."""
+	by_teacher: dict[int, tuple[tuple[ScheduleEntry, ...], ...]] = field(default_factory=dict)
+
+	def entries_for(self, teacher_id: int) -> list[ScheduleEntry]:
+		"""Öğretmenin tüm girişleri (gün sırasıyla; gün içinde tarih/saat sırası korunur)."""
+		days = self.by_teacher.get(teacher_id)
+		if not days:
+			return []
+		return [entry for day in days for entry in day]
+
+	def entries_on(self, teacher_id: int, weekday: int) -> list[ScheduleEntry]:
+		days = self.by_teacher.get(teacher_id)
+		return list(days[weekday]) if days else []
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleSnapshot:
+	version: int
+	day: date
+	schedule: WeeklySchedule
+
+	@property
+	def key(self) -> tuple[int, str]:
+		"""Bu görüntüden türetilen önbellek kayıtları (HTML parçaları vb.) için anahtar."""
+		return self.version, self.day.isoformat()
+
+
+_snapshot: ScheduleSnapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def next_lesson_date(original_date: date, today: date) -> date:
+	"""Haftalık tekrarlanan ders için bugün veya bugünden sonraki ilgili gün."""
+	days_ahead = original_date.weekday() - today.weekday()
+	if days_ahead < 0:
+		days_ahead += 7
+	return today + timedelta(days=days_ahead)
+
+
+def build_weekly_schedule(
+	db: Session,
+	teacher_ids: Iterable[int] | None = None,
+	*,
+	today: date | None = None,
+) -> WeeklySchedule:
+	"""
+	Verilen öğretmenlerin (None: tüm öğretmenler) haftalık programı; tek sorgu.
+	Yalnızca LessonStudent atamaları ve aktif öğrenciler gösterilir; aktif öğrencisi
+	olmayan dersler programa girmez. Aynı öğrenci aynı gün aynı öğretmenin birden
+	fazla dersinde görünüyorsa daha geç başlayan (eşitse daha yeni id'li) derste kalır.
+	"""
+	if teacher_ids is not None:
+		teacher_ids = list(dict.fromkeys(teacher_ids))
+		if not teacher_ids:
+			return WeeklySchedule()
+	today = today or date.today()
+
+	stmt = (
+		select(
+			models.Lesson.id,
+			models.Lesson.teacher_id,
+			models.Lesson.lesson_date,
+			models.Lesson.start_time,
+			models.Lesson.end_time,
+			models.Course.id,
+			models.Course.name,
+			models.Teacher.first_name,
+			models.Teacher.last_name,
+			models.Student.id,
+			models.Student.first_name,
+			models.Student.last_name,
+		)
+		.join(models.Course, models.Course.id == models.Lesson.course_id)
+		.join(models.Teacher, models.Teacher.id == models.Lesson.teacher_id)
+		.join(models.LessonStudent, models.LessonStudent.lesson_id == models.Lesson.id)
+		.join(models.Student, models.Student.id == models.LessonStudent.student_id)
+		.where(models.Student.is_active == True)
+		.order_by(
+			models.Lesson.teacher_id.asc(),
+			models.Lesson.lesson_date.asc(),
+			models.Lesson.start_time.asc(),
+			models.Lesson.id.asc(),
+			models.LessonStudent.student_id.asc(),
+		)
+	)
+	if teacher_ids is not None:
+		stmt = stmt.where(models.Lesson.teacher_id.in_(teacher_ids))
+	rows = db.execute(stmt).all()
+
+	lessons: dict[int, ScheduleLesson] = {}
+	lesson_order: list[int] = []
+	students_by_lesson: dict[int, list[ScheduleStudent]] = {}
+	courses: dict[int, ScheduleCourse] = {}
+	teachers: dict[int, ScheduleTeacher] = {}
+	by_teacher: dict[int, list[list[ScheduleEntry]]] = {}
+	# (öğretmen, gün, öğrenci) -> (başlangıç sırası, ders id); en büyüğü kazanır
+	winners: dict[tuple[int, int, int], tuple[tuple[int, int], int]] = {}
+	for (
+		lesson_id, teacher_id, lesson_date, start_time, end_time,
+		course_id, course_name, teacher_first, teacher_last,
+		student_id, student_first, student_last,
+	) in rows:
+		if lesson_id not in lessons:
+			course = courses.get(course_id)
+			if course is None:
+				course = courses[course_id] = ScheduleCourse(course_id, course_name or "")
+			teacher = teachers.get(teacher_id)
+			if teacher is None:
+				teacher = teachers[teacher_id] = ScheduleTeacher(teacher_id, teacher_first or "", teacher_last or "")
+			lessons[lesson_id] = ScheduleLesson(
+				lesson_id, teacher_id, lesson_date, start_time, end_time, course, teacher
+			)
+			lesson_order.append(lesson_id)
+			students_by_lesson[lesson_id] = []
+		students_by_lesson[lesson_id].append(ScheduleStudent(student_id, student_first or "", student_last or ""))
+
+		start_sort = (start_time.hour, start_time.minute) if start_time else (-1, -1)
+		key = (teacher_id, lesson_date.weekday(), student_id)
+		candidate = (start_sort, lesson_id)
+		if key not in winners or candidate > winners[key]:
+			winners[key] = candidate
+
+	for lesson_id in lesson_order:
+		lesson = lessons[lesson_id]
+		weekday = lesson.lesson_date.weekday()
+		kept = tuple(
+			student for student in students_by_lesson[lesson_id]
+			if winners[(lesson.teacher_id, weekday, student.id)][1] == lesson_id
+		)
+		if not kept:
+			continue
+		days = by_teacher.get(lesson.teacher_id)
+		if days is None:
+			days = by_teacher[lesson.teacher_id] = [[] for _ in WEEKDAY_NAMES]
+		days[weekday].append(ScheduleEntry(
+			weekday=WEEKDAY_NAMES[weekday],
+			lesson=lesson,
+			current_lesson_date=next_lesson_date(lesson.lesson_date, today),
+			students=kept,
+		))
+	return WeeklySchedule({
+		teacher_id: tuple(tuple(day) for day in days)
+		for teacher_id, days in by_teacher.items()
+	})
+
+
+def get_schedule_snapshot(db: Session) -> ScheduleSnapshot:
+	"""
+	Tüm öğretmenlerin programı; süreç içi anlık görüntüden. İstek başına yalnızca
+	sürüm okunur (tek SELECT); sürüm veya gün değiştiyse program yeniden kurulur.
+	"""
+	global _snapshot
+	today = date.today()
+	(version,) = get_data_versions(db, [DOMAIN_SCHEDULE])
+	current = _snapshot
+	if current is not None and current.version == version and current.day == today:
+		return current
+	with _snapshot_lock:
+		current = _snapshot
+		if current is not None and current.version == version and current.day == today:
+			return current
+		# Sürüm veriden önce okunduğu için arada gelen yazma bir sonraki istekte yeniden kurulur
+		_snapshot = ScheduleSnapshot(version, today, build_weekly_schedule(db, today=today))
+		return _snapshot
+
+
+def get_weekly_schedule(db: Session) -> WeeklySchedule:
+	return get_schedule_snapshot(db).schedule
+
+
+def invalidate_schedule_snapshot() -> None:
+	"""Süreç içi görüntüyü bırakır (script/testlerde veri elle değiştiğinde)."""
+	global _snapshot
+	with _snapshot_lock:
+		_snapshot = None
@@ -0,0 +1,347 @@
+"""Veritabanı tabanlı arama arka ucu (SEARCH_BACKEND=database).
+
+Süreç içi dizin (search_index) istenmeyen kurulumlar için: PostgreSQL'de pg_trgm
+trigram GIN ifade indeksleri, SQLite'ta trigram ayrıştırıcılı FTS5 gölge tablosu
+(search_fts) kullanılır. Gölge tablo students / teachers / courses üzerindeki
+tetikleyicilerle güncel tutulur; satır kimliği (rowid) kayıt id'si ve türden
+türetilir (id * 4 + tür kodu).
+
+Adlar iki tarafta da aynı katlamayla karşılaştırılır (Türkçe harfler ASCII'ye,
+küçük harf; name_search.ascii_fold ile aynı sonuç). Eşleşme: adın içinde geçen
+metin (alt dize) ya da trigram benzerliği (yazım hatası toleransı); sıralama
+önce alt dize eşleşmesi, sonra benzerlik puanı.
+
+Tablolar / indeksler şema migration'ı değildir: yalnızca SEARCH_BACKEND=database
+iken açılışta ensure_search_backend ile kurulur.
+"""
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .name_search import ascii_fold
+from .search_index import (
+	KIND_COURSE,
+	KIND_STUDENT,
+	KIND_TEACHER,
+	PHONE_MIN_DIGITS,
+	SearchEntry,
+	is_phone_query,
+	normalize_phone_digits,
+	search_entry,
+)
+
+logger = logging.getLogger(__name__)
+
+FOLD_FROM = "ÇĞİIÖŞÜÂÎÛçğıöşüâîû"
+FOLD_TO = "cgiiosuaiucgiosuaiu"
+PHONE_SEPARATORS = " -()+./"
+# pg_trgm word_similarity eşiğiyle (<% operatörü, varsayılan 0.6) aynı
+SIMILARITY_THRESHOLD = 0.6
+# SQLite'ta trigram eşleşmesiyle gelen aday üst sınırı (puanlama Python'da)
+FTS_CANDIDATE_LIMIT = 200
+FTS_ROWID_STRIDE = 4
+_KIND_CODES = {KIND_STUDENT: 1, KIND_TEACHER: 2, KIND_COURSE: 3}
+
+# tür -> (tablo, ad kolonları, telefon kolonları, seçilen kolonlar, ek koşul)
+_TABLES = {
+	KIND_STUDENT: (
+		"students",
+		("first_name", "last_name"),
+		("phone_primary", "phone_secondary", "parent_phone"),
+		"id, first_name, last_name, phone_primary, phone_secondary, parent_phone, is_active",
+		"",
+	),
+	KIND_TEACHER: (
+		"teachers",
+		("first_name", "last_name"),
+		("phone",),
+		"id, first_name, last_name, phone, is_active",
+		"is_active = TRUE",
+	),
+	KIND_COURSE: ("courses", ("name",), (), "id, name", ""),
+}
+
+
+def _name_sql(columns: tuple[str, ...], row: str | None = None) -> str:
+	prefix = f"{row}." if row else ""
+	return " || ' ' || ".join(f"{prefix}{col}" for col in columns)
+
+
+def _is_postgres(db: Session) -> bool:
+	return db.get_bind().dialect.name == "postgresql"
+
+
+def _pg_fold(expr: str) -> str:
+	return f"lower(translate({expr}, '{FOLD_FROM}', '{FOLD_TO}'))"
+
+
+def _pg_digits(columns: tuple[str, ...]) -> str:
+	return " || ' ' || ".join(f"regexp_replace(coalesce({col}, ''), '[^0-9]', '', 'g')" for col in columns)
+
+
+def _sqlite_fold(expr: str) -> str:
+	for source, target in zip(FOLD_FROM, FOLD_TO):
+		expr = f"replace({expr}, '{source}', '{target}')"
+	return f"lower({expr})"
+
+
+def _sqlite_digits(columns: tuple[str, ...], row: str) -> str:
+	parts = []
+	for col in columns:
+		expr = f"coalesce({row}.{col}, '')"
+		for separator in PHONE_SEPARATORS:
+			expr = f"replace({expr}, '{separator}', '')"
+		parts.append(expr)
+	return " || ' ' || ".join(parts) if parts else "''"
+
+
+def _like_pattern(value: str) -> str:
+	escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+	return f"%{escaped}%"
+
+
+def _entry_from_row(kind: str, row) -> SearchEntry:
+	if kind == KIND_STUDENT:
+		sid, first_name, last_name, phone_primary, phone_secondary, parent_phone, is_active = row
+		return search_entry(
+			kind, sid, first_name, last_name,
+			phone=phone_primary or phone_secondary or None,
+			phones=(phone_primary, phone_secondary, parent_phone),
+			is_active=is_active,
+		)
+	if kind == KIND_TEACHER:
+		tid, first_name, last_name, phone, is_active = row
+		return search_entry(kind, tid, first_name, last_name, phone=phone, phones=(phone,), is_active=is_active)
+	cid, name = row
+	return search_entry(kind, cid, name, "")
+
+
+def _trigrams(value: str) -> set[str]:
+	"""pg_trgm ile aynı: her kelime '  ' ile başlatılıp ' ' ile bitirilerek üçlülere bölünür."""
+	grams = set()
+	for word in value.split():
+		padded = f"  {word} "
+		grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+	return grams
+
+
+def word_similarity(query: str, body: str) -> float:
+	"""pg_trgm word_similarity yaklaşığı: sorgu trigramlarının gövdede bulunan oranı
+	(word_similarity('word', 'two words') = 0.8)."""
+	query_grams = _trigrams(query)
+	if not query_grams:
+		return 0.0
+	return len(query_grams & _trigrams(body)) / len(query_grams)
+
+
+def _search_postgres(db: Session, query: str, kind: str, limit: int) -> list[SearchEntry]:
+	table, name_columns, phone_columns, columns, condition = _TABLES[kind]
+	name_expr = _name_sql(name_columns)
+	extra = f" AND {condition}" if condition else ""
+	if is_phone_query(query):
+		digits = normalize_phone_digits(query)
+		if len(digits) < PHONE_MIN_DIGITS or not phone_columns:
+			return []
+		rows = db.execute(text(f"""
+			SELECT {columns} FROM {table}
+			WHERE {_pg_digits(phone_columns)} LIKE :pattern{extra}
+			ORDER BY {_pg_fold(name_expr)}
+			LIMIT :limit
+		"""), {"pattern": _like_pattern(digits), "limit": limit}).all()
+		return [_entry_from_row(kind, row) for row in rows]
+	folded = ascii_fold(query)
+	if not folded:
+		return []
+	name_sql = _pg_fold(name_expr)
+	rows = db.execute(text(f"""
+		SELECT {columns} FROM {table}
+		WHERE ({name_sql} LIKE :pattern OR :q <% {name_sql}){extra}
+		ORDER BY ({name_sql} LIKE :pattern) DESC, word_similarity(:q, {name_sql}) DESC, {name_sql}
+		LIMIT :limit
+	"""), {"q": folded, "pattern": _like_pattern(folded), "limit": limit}).all()
+	return [_entry_from_row(kind, row) for row in rows]
+
+
+def _load_entries(db: Session, kind: str, ids: list[int]) -> dict[int, SearchEntry]:
+	if not ids:
+		return {}
+	table, _name_columns, _phone_columns, columns, condition = _TABLES[kind]
+	params = {f"id{i}": value for i, value in enumerate(ids)}
+	placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+	extra = f" AND {condition}" if condition else ""
+	rows = db.execute(text(f"SELECT {columns} FROM {table} WHERE id IN ({placeholders}){extra}"), params).all()
+	return {row[0]: _entry_from_row(kind, row) for row in rows}
+
+
+def _search_sqlite(db: Session, query: str, kind: str, limit: int) -> list[SearchEntry]:
+	code = _KIND_CODES[kind]
+	if is_phone_query(query):
+		digits = normalize_phone_digits(query)
+		if len(digits) < PHONE_MIN_DIGITS:
+			return []
+		rows = db.execute(text("""
+			SELECT rowid FROM search_fts
+			WHERE search_fts MATCH :match AND rowid % :stride = :code
+			LIMIT :cap
+		"""), {"match": f'phones : "{digits}"', "stride": FTS_ROWID_STRIDE, "code": code, "cap": FTS_CANDIDATE_LIMIT}).all()
+		entries = _load_entries(db, kind, [rowid // FTS_ROWID_STRIDE for (rowid,) in rows])
+		return sorted(entries.values(), key=lambda e: (not e.is_active, e.folded, e.id))[:limit]
+
+	folded = ascii_fold(query)
+	if not folded:
+		return []
+	grams = sorted({folded[i:i + 3] for i in range(len(folded) - 2)})
+	if grams:
+		match = "body : (" + " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams) + ")"
+		rows = db.execute(text("""
+			SELECT rowid, body FROM search_fts
+			WHERE search_fts MATCH :match AND rowid % :stride = :code
+			ORDER BY rank
+			LIMIT :cap
+		"""), {"match": match, "stride": FTS_ROWID_STRIDE, "code": code, "cap": FTS_CANDIDATE_LIMIT}).all()
+	else:
+		# 3 harften kısa sorgu: trigram yok, alt dize taraması
+		rows = db.execute(text("""
+			SELECT rowid, body FROM search_fts
+			WHERE body LIKE :pattern ESCAPE '\\' AND rowid % :stride = :code
+			LIMIT :cap
+		"""), {"pattern": _like_pattern(folded), "stride": FTS_ROWID_STRIDE, "code": code, "cap": FTS_CANDIDATE_LIMIT}).all()
+
+	scored = {}
+	for rowid, body in rows:
+		contains = folded in (body or "")
+		score = word_similarity(folded, body or "")
+		if contains or score >= SIMILARITY_THRESHOLD:
+			scored[rowid // FTS_ROWID_STRIDE] = (not contains, -score)
+	entries = _load_entries(db, kind, list(scored))
+	ranked = sorted(entries.values(), key=lambda e: (*scored[e.id], not e.is_active, e.folded, e.id))
+	return ranked[:limit]
+
+
+def search(db: Session, query: str | None, kind: str, limit: int = 10) -> list[SearchEntry]:
+	"""search_index.SearchIndex.search ile aynı sözleşme; sonuçlar SearchEntry listesi."""
+	query = (query or "").strip()
+	if kind not in _TABLES or not query or limit <= 0:
+		return []
+	if _is_postgres(db):
+		return _search_postgres(db, query, kind, limit)
+	return _search_sqlite(db, query, kind, limit)
+
+
+def _sqlite_fts_values(kind: str, row: str) -> tuple[str, str, str]:
+	"""search_fts için (rowid, body, phones) SQL ifadeleri; row: 'new' ya da tablo adı."""
+	_table, name_columns, phone_columns, _columns, _condition = _TABLES[kind]
+	rowid = f"{row}.id * {FTS_ROWID_STRIDE} + {_KIND_CODES[kind]}"
+	return rowid, _sqlite_fold(_name_sql(name_columns, row)), _sqlite_digits(phone_columns, row)
+
+
+def _index_specs() -> list[tuple[str, str, str]]:
+	"""PostgreSQL trigram indeksleri: (indeks adı, tablo, ifade)."""
+	specs = []
+	for table, name_columns, phone_columns, _columns, _condition in _TABLES.values():
+		specs.append((f"ix_{table}_name_trgm", table, _pg_fold(_name_sql(name_columns))))
+		if phone_columns:
+			specs.append((f"ix_{table}_phone_trgm", table, _pg_digits(phone_columns)))
+	return specs
+
+
+def _trigger_names() -> list[str]:
+	return [f"search_fts_{table}_{suffix}" for table, *_rest in _TABLES.values() for suffix in ("ai", "au", "ad")]
+
+
+def _missing_sqlite_objects(conn) -> set[str]:
+	existing = {
+		row[0]
+		for row in conn.execute(text(
+			"SELECT name FROM sqlite_master WHERE name = 'search_fts' OR (type = 'trigger' AND name LIKE 'search_fts_%')"
+		))
+	}
+	return {"search_fts", *_trigger_names()} - existing
+
+
+def _search_backend_ready() -> bool:
+	from .db import engine
+
+	with engine.connect() as conn:
+		if engine.dialect.name == "postgresql":
+			names = [name for name, _table, _expr in _index_specs()]
+			params = {f"n{i}": name for i, name in enumerate(names)}
+			valid = conn.execute(text(f"""
+				SELECT COUNT(*) FROM pg_class c
+				JOIN pg_index i ON i.indexrelid = c.oid
+				WHERE i.indisvalid AND c.relname IN ({", ".join(f":{key}" for key in params)})
+			"""), params).scalar()
+			return valid == len(names)
+		return not _missing_sqlite_objects(conn)
+
+
+def ensure_search_backend_tables() -> bool:
+	"""
+	PostgreSQL: pg_trgm eklentisi ve ad/telefon ifadeleri için trigram GIN indeksleri
+	(CONCURRENTLY). SQLite: search_fts FTS5 tablosu ve eşitleme tetikleyicileri; tablo
+	ya da tetikleyicilerden biri yeni kurulduysa tablo mevcut kayıtlarla yeniden doldurulur.
+	Kurulamazsa (eklenti / FTS5 trigram yok) uyarı yazılır ve False döner.
+	"""
+	from .db import create_index_concurrently, engine
+
+	try:
+		if engine.dialect.name == "postgresql":
+			with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+				conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+				for index_name, table, expr in _index_specs():
+					create_index_concurrently(conn, index_name, f"ON {table} USING gin (({expr}) gin_trgm_ops)")
+			return True
+
+		with engine.begin() as conn:
+			if not _missing_sqlite_objects(conn):
+				return True
+			conn.execute(text(
+				"CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(body, phones, tokenize = 'trigram')"
+			))
+			# Tetikleyicisiz geçen süredeki değişiklikler kaçmış olabilir: baştan doldurulur
+			conn.execute(text("DELETE FROM search_fts"))
+			for kind, (table, name_columns, phone_columns, _columns, _condition) in _TABLES.items():
+				watched = ", ".join(name_columns + phone_columns)
+				rowid, body, phones = _sqlite_fts_values(kind, "new")
+				old_rowid = f"old.id * {FTS_ROWID_STRIDE} + {_KIND_CODES[kind]}"
+				insert = f"INSERT INTO search_fts(rowid, body, phones) VALUES ({rowid}, {body}, {phones});"
+				delete = f"DELETE FROM search_fts WHERE rowid = {old_rowid};"
+				for suffix, statement in (
+					("ai", f"AFTER INSERT ON {table} BEGIN {insert} END"),
+					("au", f"AFTER UPDATE OF {watched} ON {table} BEGIN {delete} {insert} END"),
+					("ad", f"AFTER DELETE ON {table} BEGIN {delete} END"),
+				):
+					conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS search_fts_{table}_{suffix} {statement}"))
+				rowid, body, phones = _sqlite_fts_values(kind, table)
+				conn.execute(text(
+					f"INSERT INTO search_fts(rowid, body, phones) SELECT {rowid}, {body}, {phones} FROM {table}"
+				))
+		return True
+	except Exception as e:
+		logger.warning("Veritabanı arama dizinleri kurulamadı: %s", e)
+		return False
+
+
+def ensure_search_backend() -> None:
+	"""
+	Açılışta çağrılır. SEARCH_BACKEND=database değilse hiçbir şey yapmaz; dizinler eksikse
+	migration kilidi altında kurar (aynı anda açılan worker'lar birlikte doldurmasın).
+	Şema sürümüne bağlı değildir: arka uç sonradan açılırsa bir sonraki açılışta kurulur.
+	Kurulamazsa aramalar süreç içi dizinle devam eder.
+	"""
+	from .migrations import migration_lock
+	from .search_index import SEARCH_BACKEND
+
+	if SEARCH_BACKEND != "database":
+		return
+	try:
+		if _search_backend_ready():
+			return
+	except Exception as e:
+		logger.warning("Veritabanı arama dizinleri kontrol edilemedi: %s", e)
+		return
+	with migration_lock():
+		ensure_search_backend_tables()
@@ -0,0 +1,279 @@
+"""Otomatik tamamlama ve hızlı arama için süreç içi önek dizini.
+
+Öğrenci, (aktif) öğretmen ve kurs adları Türkçe kurallarla katlanıp kelimelere
+bölünür; anahtarlar Türkçe harfleri ASCII'ye indirilmiş haldedir (name_search.ascii_fold),
+böylece 'isik' yazımı 'Işık' ile eşleşir, harfi harfine eşleşen sonuçlar ise üstte
+sıralanır. Telefonlar yalnızca rakam olarak saklanır. Her tür için anahtarlar sıralı
+bir dizide tutulur ve önek araması bisect ile yapılır; arama veritabanına dokunmaz.
+
+Dizin app_meta'daki 'directory' veri sürümüne (report_cache.DOMAIN_DIRECTORY)
+bağlıdır. Sürüm her istekte değil, en fazla SEARCH_INDEX_RECHECK_SECONDS'ta bir
+okunur; aynı süreçteki crud yazmaları mark_search_index_stale() ile bir sonraki
+aramada sürümün hemen okunmasını sağlar. Diğer worker'lar değişikliği en geç bu
+süre sonunda görür.
+
+SEARCH_BACKEND=database ile aramalar veritabanına yönlendirilir (search_db: alt dize
+ve yazım hatası toleranslı eşleşme); veritabanı araması hata verirse bu dizine düşülür.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import models
+from .name_search import ascii_fold, turkish_casefold
+from .report_cache import DOMAIN_DIRECTORY, get_data_versions
+
+logger = logging.getLogger(__name__)
+
+# memory: süreç içi önek dizini; database: pg_trgm / FTS5 (search_db)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").strip().lower()
+SEARCH_INDEX_RECHECK_SECONDS = float(os.getenv("SEARCH_INDEX_RECHECK_SECONDS", "5"))
+# Telefon araması için sorguda en az bu kadar rakam olmalı
+PHONE_MIN_DIGITS = 3
+
+KIND_STUDENT = "student"
+KIND_TEACHER = "teacher"
+KIND_COURSE = "course"
+KINDS = (KIND_STUDENT, KIND_TEACHER, KIND_COURSE)
+
+_PHONE_QUERY_RE = re.compile(r"^[\d\s()+\-./]+$")
+
+
+def normalize_phone_digits(value: str | None) -> str:
+	"""Yalnızca rakamlar; +90 / 0 öneki atılır ('0532 123 45 67' -> '5321234567')."""
+	digits = re.sub(r"\D", "", value or "")
+	if digits.startswith("90") and len(digits) > 10:
+		digits = digits[2:]
+	return digits.lstrip("0")
+
+
+def is_phone_query(query: str) -> bool:
+	"""Yalnızca rakam ve telefon ayraçlarından oluşan sorgu telefonlarda aranır."""
+	return bool(_PHONE_QUERY_RE.match(query))
+
+
+@dataclass(slots=True, frozen=True)
+class SearchEntry:
+	"""Dizindeki tek kayıt; şablonlar ORM nesnesi gibi id / first_name / last_name / name okur."""
+	kind: str
+	id: int
+	first_name: str
+	last_name: str
+	phone: str | None
+	is_active: bool
+	folded: str  # turkish_casefold(tam ad)
+	tokens: tuple[str, ...]  # ascii_fold(tam ad) kelimeleri; dizin anahtarları
+	phones: tuple[str, ...]
+
+	@property
+	def name(self) -> str:
+		return f"{self.first_name} {self.last_name}".strip()
+
+
+def search_entry(kind: str, entry_id: int, first_name: str | None, last_name: str | None, *, phone=None, phones=(), is_active=True) -> SearchEntry:
+	first_name = first_name or ""
+	last_name = last_name or ""
+	full_name = f"{first_name} {last_name}"
+	digits = tuple(dict.fromkeys(d for d in (normalize_phone_digits(p) for p in phones) if d))
+	return SearchEntry(
+		kind, entry_id, first_name, last_name, phone, bool(is_active),
+		turkish_casefold(full_name), tuple(ascii_fold(full_name).split()), digits,
+	)
+
+
+class _KindIndex:
+	"""Tek tür için sıralı (anahtar, kayıt sırası) dizileri."""
+
+	__slots__ = ("entries", "_name_keys", "_name_refs", "_phone_keys", "_phone_refs")
+
+	def __init__(self, entries: list[SearchEntry]):
+		self.entries = entries
+		name_pairs = sorted({(token, i) for i, entry in enumerate(entries) for token in entry.tokens})
+		phone_pairs = sorted({(digits, i) for i, entry in enumerate(entries) for digits in entry.phones})
+		self._name_keys = [key for key, _ in name_pairs]
+		self._name_refs = [ref for _, ref in name_pairs]
+		self._phone_keys = [key for key, _ in phone_pairs]
+		self._phone_refs = [ref for _, ref in phone_pairs]
+
+	@staticmethod
+	def _prefix_refs(keys: list[str], refs: list[int], prefix: str) -> set[int]:
+		found = set()
+		i = bisect_left(keys, prefix)
+		while i < len(keys) and keys[i].startswith(prefix):
+			found.add(refs[i])
+			i += 1
+		return found
+
+	def name_matches(self, words: list[str]) -> set[int]:
+		"""Her kelime kaydın bir kelimesinin öneki olmalı."""
+		matched: set[int] | None = None
+		for word in sorted(set(words), key=len, reverse=True):
+			refs = self._prefix_refs(self._name_keys, self._name_refs, word)
+			matched = refs if matched is None else matched & refs
+			if not matched:
+				return set()
+		return matched or set()
+
+	def phone_matches(self, digits: str) -> set[int]:
+		return self._prefix_refs(self._phone_keys, self._phone_refs, digits)
+
+
+def _name_rank(entry: SearchEntry, folded_query: str, words: list[str]) -> tuple[int, bool]:
+	"""Eşleşme kalitesi (küçük = daha iyi) ve Türkçe harflerin birebir tutmadığı eşleşme mi."""
+	exact_words = all(
+		any(token.startswith(word) for token in entry.folded.split()) for word in folded_query.split()
+	)
+	ascii_name = " ".join(entry.tokens)
+	query = " ".join(words)
+	if ascii_name == query:
+		quality = 0
+	elif ascii_name.startswith(query):
+		quality = 1
+	elif entry.tokens and entry.tokens[0].startswith(words[0]):
+		quality = 2
+	else:
+		quality = 3
+	return quality, not exact_words
+
+
+class SearchIndex:
+	def __init__(self, version: int, entries: list[SearchEntry]):
+		self.version = version
+		self.built_at = time.time()
+		self.size = len(entries)
+		self._kinds = {kind: _KindIndex([e for e in entries if e.kind == kind]) for kind in KINDS}
+
+	def search(self, query: str | None, kind: str, limit: int = 10) -> list[SearchEntry]:
+		"""
+		Önek araması: sorgudaki her kelime ad/soyad kelimelerinden birinin başıyla eşleşmeli
+		(Türkçe harfler ASCII karşılıklarıyla da eşleşir); yalnızca rakamlardan oluşan sorgular
+		(en az 3 rakam) telefonlarda aranır. Sonuçlar eşleşme kalitesine (tam ad, ad öneki,
+		ilk kelime, herhangi bir kelime; Türkçe harfleri birebir tutanlar önce), sonra
+		aktifliğe ve ada göre sıralanır.
+		"""
+		index = self._kinds.get(kind)
+		query = (query or "").strip()
+		if index is None or not query or limit <= 0:
+			return []
+		ranked = []
+		if is_phone_query(query):
+			digits = normalize_phone_digits(query)
+			if len(digits) < PHONE_MIN_DIGITS:
+				return []
+			for ref in index.phone_matches(digits):
+				entry = index.entries[ref]
+				rank = (0 if digits in entry.phones else 1, False)
+				ranked.append((rank, not entry.is_active, entry.folded, entry.id, ref))
+		else:
+			folded_query = turkish_casefold(query)
+			words = ascii_fold(query).split()
+			for ref in index.name_matches(words):
+				entry = index.entries[ref]
+				ranked.append((_name_rank(entry, folded_query, words), not entry.is_active, entry.folded, entry.id, ref))
+		return [index.entries[item[-1]] for item in heapq.nsmallest(limit, ranked)]
+
+	def stats(self) -> dict:
+		return {
+			"version": self.version,
+			"entries": self.size,
+			"by_kind": {kind: len(index.entries) for kind, index in self._kinds.items()},
+			"age_seconds": round(time.time() - self.built_at, 1),
+		}
+
+
+_index: SearchIndex | None = None
+_checked_at = 0.0
+_rebuilds = 0
+_lock = threading.Lock()
+
+
+def build_search_index(db: Session, version: int = 0) -> SearchIndex:
+	"""Öğrenciler (pasifler dahil), aktif öğretmenler ve kurslar; üç hafif sorgu."""
+	entries: list[SearchEntry] = []
+	for sid, first_name, last_name, phone_primary, phone_secondary, parent_phone, is_active in db.execute(
+		select(
+			models.Student.id,
+			models.Student.first_name,
+			models.Student.last_name,
+			models.Student.phone_primary,
+			models.Student.phone_secondary,
+			models.Student.parent_phone,
+			models.Student.is_active,
+		)
+	).all():
+		entries.append(search_entry(
+			KIND_STUDENT, sid, first_name, last_name,
+			phone=phone_primary or phone_secondary or None,
+			phones=(phone_primary, phone_secondary, parent_phone),
+			is_active=is_active,
+		))
+	for tid, first_name, last_name, phone in db.execute(
+		select(models.Teacher.id, models.Teacher.first_name, models.Teacher.last_name, models.Teacher.phone)
+		.where(models.Teacher.is_active == True)
+	).all():
+		entries.append(search_entry(KIND_TEACHER, tid, first_name, last_name, phone=phone, phones=(phone,)))
+	for cid, name in db.execute(select(models.Course.id, models.Course.name)).all():
+		entries.append(search_entry(KIND_COURSE, cid, name, ""))
+	return SearchIndex(version, entries)
+
+
+def get_search_index(db: Session) -> SearchIndex:
+	"""Güncel dizin; sürüm en fazla SEARCH_INDEX_RECHECK_SECONDS'ta bir okunur."""
+	global _index, _checked_at, _rebuilds
+	now = time.monotonic()
+	current = _index
+	if current is not None and now - _checked_at < SEARCH_INDEX_RECHECK_SECONDS:
+		return current
+	with _lock:
+		current = _index
+		if current is not None and time.monotonic() - _checked_at < SEARCH_INDEX_RECHECK_SECONDS:
+			return current
+		(version,) = get_data_versions(db, [DOMAIN_DIRECTORY])
+		if current is None or current.version != version:
+			# Sürüm veriden önce okunduğu için arada gelen yazma bir sonraki kontrolde yakalanır
+			current = _index = build_search_index(db, version)
+			_rebuilds += 1
+		_checked_at = time.monotonic()
+		return current
+
+
+def mark_search_index_stale() -> None:
+	"""Yazma commit edildikten sonra çağrılır; sıradaki arama sürümü hemen kontrol eder."""
+	global _checked_at
+	_checked_at = 0.0
+
+
+def search_directory(db: Session, query: str | None, kind: str, limit: int = 10) -> list[SearchEntry]:
+	"""Uç noktaların kullandığı arama; SEARCH_BACKEND'e göre veritabanı ya da süreç içi dizin."""
+	if SEARCH_BACKEND == "database":
+		from . import search_db
+
+		try:
+			return search_db.search(db, query, kind, limit)
+		except DBAPIError as e:
+			# Dizin tablosu / eklenti yoksa (kurulamamış) süreç içi dizine düş
+			db.rollback()
+			logger.warning("Veritabanı araması başarısız, süreç içi dizin kullanılıyor: %s", e)
+	return get_search_index(db).search(query, kind, limit)
+
+
+def search_index_stats() -> dict:
+	current = _index
+	return {
+		"backend": SEARCH_BACKEND,
+		"built": current is not None,
+		"rebuilds": _rebuilds,
+		"recheck_seconds": SEARCH_INDEX_RECHECK_SECONDS,
+		**(current.stats() if current is not None else {}),
+	}
@@ -0,0 +1,124 @@
+"""
+Sık kullanılan crud sorgularının sorgu planlarını (EXPLAIN) gösterir ve büyük
+tablolarda sıralı tarama (Seq Scan / SCAN) yapan sorguları işaretler.
+Çalıştırma (proje kökünden):
+  python -m scripts.explain_hot_queries
+  python -m scripts.explain_hot_queries --verbose   # tüm planları yazdır
+Çıkış kodu: sıralı tarama bulunursa 1, yoksa 0.
+"""
+import sys
+import os
+import re
+from datetime import date, timedelta
+
+# Proje kökünü path'e ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, select, func
+from app.db import SessionLocal, engine, HOT_PATH_INDEX_TABLES
+from app import models
+from app import crud
+
+# Sıralı taraması işaretlenen tablolar (students: ad önek filtresi indeksleri)
+CHECKED_TABLES = set(HOT_PATH_INDEX_TABLES) | {"students"}
+
+
+def _capture_statements(fn):
+    """fn() çalışırken motorun gönderdiği (SQL, parametre) çiftlerini toplar."""
+    captured = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    return captured
+
+
+def _explain(db, statement, parameters) -> list[str]:
+    conn = db.connection()
+    if engine.dialect.name == "postgresql":
+        rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).fetchall()
+        return [row[0] for row in rows]
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def _sequential_scans(plan_lines: list[str]) -> list[str]:
+    flagged = []
+    for line in plan_lines:
+        if engine.dialect.name == "postgresql":
+            match = re.search(r"Seq Scan on (\w+)", line)
+        else:
+            match = re.match(r"\s*SCAN (?:TABLE )?(\w+)", line)
+            if match and "USING" in line:
+                match = None
+        if match and match.group(1) in CHECKED_TABLES:
+            flagged.append(line.strip())
+    return flagged
+
+
+def main():
+    verbose = "--verbose" in sys.argv
+    db = SessionLocal()
+    try:
+        today = date.today()
+        month_start = today.replace(day=1)
+        student_ids = list(db.scalars(select(models.Student.id).limit(500)).all()) or [0]
+        sample_student_id = student_ids[0]
+        sample_teacher_id = db.scalar(select(func.min(models.Teacher.id))) or 0
+
+        checks = [
+            ("_batch_attendance_counts", lambda: crud._batch_attendance_counts(db, student_ids)),
+            ("list_all_attendances (öğrenci)", lambda: crud.list_all_attendances(db, student_id=sample_student_id, limit=100)),
+            (
+                "list_all_attendances (öğretmen + tarih)",
+                lambda: crud.list_all_attendances(
+                    db,
+                    teacher_id=sample_teacher_id,
+                    start_date=month_start - timedelta(days=90),
+                    end_date=today,
+                    limit=200,
+                ),
+            ),
+            (
+                "student_name_prefix_filter",
+                lambda: db.scalars(select(models.Student.id).where(crud.student_name_prefix_filter("can"))).all(),
+            ),
+            ("list_all_attendances (öğrenci adı)", lambda: crud.list_all_attendances(db, student_name="can", limit=200)),
+            ("build_teacher_pay_report", lambda: crud.build_teacher_pay_report(db, start_date=month_start, end_date=today)),
+            (
+                "build_payment_package_details",
+                lambda: crud.build_payment_package_details(db, payment_start=month_start, payment_end=today),
+            ),
+            ("build_finance_overview", lambda: crud.build_finance_overview(db, start_date=month_start, end_date=today)),
+            ("payment_totals_by_teacher", lambda: crud.payment_totals_by_teacher(db, start_date=month_start, end_date=today)),
+        ]
+
+        flagged_total = 0
+        for label, fn in checks:
+            statements = _capture_statements(fn)
+            print(f"\n== {label}: {len(statements)} sorgu")
+            for statement, parameters in statements:
+                plan = _explain(db, statement, parameters)
+                scans = _sequential_scans(plan)
+                flagged_total += len(scans)
+                if verbose or scans:
+                    print("  " + " ".join(statement.split())[:160])
+                    for line in plan:
+                        print(f"    {line}")
+                for line in scans:
+                    print(f"  !! sıralı tarama: {line}")
+
+        print(f"\nToplam {flagged_total} sıralı tarama işaretlendi.")
+        return 1 if flagged_total else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
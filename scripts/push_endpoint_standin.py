@@ -0,0 +1,154 @@
+"""
+Yerel sahte Web Push uç noktası: push_outbox göndericisini gerçek tarayıcı servisi
+olmadan denemek için.
+Çalıştırma (proje kökünden):
+  python -m scripts.push_endpoint_standin                      # ok, flaky, gone aboneliklerini kaydet, bir bildirim gönder
+  python -m scripts.push_endpoint_standin --modes ok,ok,slow --workers 4
+  python -m scripts.push_endpoint_standin --serve              # yalnızca sunucu; bildirimleri uygulama üretir
+Uç nokta davranışları (adres yolunun ilk parçası):
+  ok     201 döner
+  flaky  ilk 2 istekte 503, sonra 201 (yeniden deneme)
+  gone   410 döner (abonelik toplu silinir)
+  slow   1 sn bekleyip 201 döner
+Kaydedilen abonelikler ilk admin kullanıcısına bağlanır ve çıkışta silinir.
+Yeniden denemeleri beklememek için PUSH_RETRY_BASE_SECONDS=0 ile çalıştırın.
+"""
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Proje kökünü path'e ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from app.db import SessionLocal
+from app import models
+from app import push_notify
+
+FLAKY_FAILURES = 2
+_hits: Counter = Counter()
+_hits_lock = threading.Lock()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        mode = self.path.strip("/").split("/", 1)[0]
+        with _hits_lock:
+            _hits[self.path] += 1
+            count = _hits[self.path]
+        if mode == "gone":
+            code = 410
+        elif mode == "flaky" and count <= FLAKY_FAILURES:
+            code = 503
+        else:
+            if mode == "slow":
+                time.sleep(1)
+            code = 201
+        print(f"  {self.path} #{count} -> {code}")
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _subscription_keys() -> tuple[str, str]:
+    """Tarayıcı gibi (p256dh, auth) üretir; pywebpush şifrelemesi için geçerli anahtar gerekir."""
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+    public = ec.generate_private_key(ec.SECP256R1()).public_key()
+    raw = public.public_bytes(Encoding.X962, PublicFormat.UncompressedPoint)
+    encode = lambda data: base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+    return encode(raw), encode(os.urandom(16))
+
+
+def register_subscriptions(db, base_url: str, modes: list[str]) -> list[int]:
+    admin = db.scalars(select(models.User).where(models.User.role == "admin").order_by(models.User.id)).first()
+    if admin is None:
+        raise SystemExit("Admin kullanıcısı yok; önce bir admin oluşturun.")
+    ids = []
+    for i, mode in enumerate(modes):
+        p256dh, auth = _subscription_keys()
+        row = push_notify.upsert_subscription(
+            db,
+            user_id=admin.id,
+            endpoint=f"{base_url}/{mode}/{i}",
+            p256dh=p256dh,
+            auth=auth,
+            user_agent="push-endpoint-standin",
+        )
+        ids.append(row.id)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", default="ok,flaky,gone")
+    parser.add_argument("--workers", type=int, default=push_notify.PUSH_SENDER_WORKERS or 2)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--serve", action="store_true", help="yalnızca sunucuyu çalıştır")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"Sahte push uç noktası: {base_url}")
+    if args.serve:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return 0
+
+    push_notify.ensure_push_outbox_table()
+    db = SessionLocal()
+    subscription_ids = []
+    try:
+        subscription_ids = register_subscriptions(db, base_url, [m.strip() for m in args.modes.split(",") if m.strip()])
+        queued = push_notify.enqueue_admin_notification(db, {
+            "title": "Deneme",
+            "body": "push_endpoint_standin",
+            "url": "/ui/finance/income",
+            "tag": "standin",
+        })
+        db.commit()
+        print(f"{queued} outbox satırı yazıldı, {args.workers} gönderici ile boşaltılıyor...")
+
+        deadline = time.monotonic() + args.timeout
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            while time.monotonic() < deadline:
+                processed = push_notify.drain_push_outbox_once(executor)
+                stats = push_notify.push_outbox_stats(db)
+                db.rollback()
+                if not processed and not stats["pending"]:
+                    break
+                if not processed:
+                    time.sleep(0.2)
+        stats = push_notify.push_outbox_stats(db)
+        for key in ("by_status", "sent", "retried", "failed", "gone", "cleaned_subscriptions", "queue_latency_p95"):
+            print(f"  {key}: {stats[key]}")
+        return 1 if stats["pending"] else 0
+    finally:
+        if subscription_ids:
+            db.query(models.PushSubscription).filter(
+                models.PushSubscription.id.in_(subscription_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        db.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
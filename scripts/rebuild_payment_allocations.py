@@ -0,0 +1,29 @@
+"""
+payment_lesson_allocations (ödeme → ders paket defteri) tablosunu ödeme ve
+yoklama kayıtlarından yeniden kurar.
+Çalıştırma (proje kökünden):
+  python -m scripts.rebuild_payment_allocations
+"""
+import sys
+import os
+
+# Proje kökünü path'e ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import SessionLocal, Base, engine
+from app import models
+from app import crud
+
+
+def main():
+    Base.metadata.create_all(bind=engine, tables=[models.PaymentLessonAllocation.__table__])
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_payment_allocations(db)
+        print(f"payment_lesson_allocations yeniden kuruldu: {count} slot.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+student_financial_state özet tablosunu yoklama ve ödeme kayıtlarından yeniden kurar.
+Çalıştırma (proje kökünden):
+  python -m scripts.rebuild_student_financial_state
+"""
+import sys
+import os
+
+# Proje kökünü path'e ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import SessionLocal, Base, engine
+from app import models
+from app import crud
+
+
+def main():
+    Base.metadata.create_all(bind=engine, tables=[models.StudentFinancialState.__table__])
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_student_financial_state(db)
+        print(f"student_financial_state yeniden kuruldu: {count} öğrenci.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
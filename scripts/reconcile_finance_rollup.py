@@ -0,0 +1,43 @@
+"""
+finance_daily_rollup tablosunu ham ödeme/gider kayıtlarıyla karşılaştırır.
+Çalıştırma (proje kökünden):
+  python -m scripts.reconcile_finance_rollup          # yalnızca rapor
+  python -m scripts.reconcile_finance_rollup --fix    # tutarsızlık varsa yeniden kur
+Çıkış kodu: tutarsızlık bulunursa (ve --fix verilmediyse) 1, yoksa 0.
+"""
+import sys
+import os
+
+# Proje kökünü path'e ekle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import SessionLocal, Base, engine
+from app import models
+from app import crud
+
+
+def main():
+    fix = "--fix" in sys.argv
+    Base.metadata.create_all(bind=engine, tables=[models.FinanceDailyRollup.__table__])
+    db = SessionLocal()
+    try:
+        mismatches = crud.reconcile_finance_daily_rollup(db)
+        for m in mismatches:
+            print(
+                f"  {m['day'] or '—'} {m['kind']} yöntem={m['method'] or '—'} "
+                f"öğretmen={m['teacher_id'] or '—'} kategori={m['category'] or '—'}: "
+                f"ham {m['expected_amount']:.2f} ₺ / {m['expected_count']} kayıt, "
+                f"rollup {m['rollup_amount']:.2f} ₺ / {m['rollup_count']} kayıt"
+            )
+        print(f"Toplam {len(mismatches)} tutarsız anahtar.")
+        if mismatches and fix:
+            count = crud.rebuild_finance_daily_rollup(db)
+            print(f"finance_daily_rollup yeniden kuruldu: {count} satır.")
+            return 0
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())